@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import Counter
+
+# Sustained requests per second and burst, per station and for the whole loop.
+# A dispatch takes tens of seconds, so a station asking for more than one
+# every few seconds is a stuck button or a misbehaving kiosk.
+STATION_RATE = 0.2
+STATION_BURST = 3
+GLOBAL_RATE = 2.0
+GLOBAL_BURST = 20
+# Requests waiting in the dispatch queue beyond which new ones are refused
+MAX_QUEUE_DEPTH = 50
+# The same (from, to, priority) within this many seconds is the same request
+DUPLICATE_WINDOW = 10.0
+# Idle stations and expired requests are forgotten once this many are tracked
+MAX_TRACKED = 1024
+
+# Why a request was refused, as sent in dispatch_failed's 'code'
+QUEUE_FULL = 'queue_full'
+STATION_RATE_LIMITED = 'station_rate'
+GLOBAL_RATE_LIMITED = 'global_rate'
+REASONS = {
+    QUEUE_FULL: 'The dispatch queue is full. Try again once it drains.',
+    STATION_RATE_LIMITED: 'Too many requests from this station. Wait a few seconds and try again.',
+    GLOBAL_RATE_LIMITED: 'The system is receiving too many requests. Try again shortly.',
+}
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return self.tokens
+
+    def full(self, now):
+        return self.refill(now) >= self.burst
+
+
+class AdmissionController:
+    """
+    Decides whether a request may go on to the queue or the broadcast path.
+
+    Each station has a token bucket (`station_rate` per second, up to
+    `station_burst`) and all stations share one (`global_rate`,
+    `global_burst`). A request takes a token from both or from neither.
+    With `max_depth`, admit() also refuses requests while the queue holds
+    that many.
+
+    A request repeating one admitted under the same key within
+    `duplicate_window` seconds is a duplicate. It costs no tokens, and
+    duplicate() returns what the first one recorded so the caller can
+    answer with that instead.
+    """
+
+    def __init__(self, station_rate=STATION_RATE, station_burst=STATION_BURST, global_rate=GLOBAL_RATE,
+                 global_burst=GLOBAL_BURST, max_depth=MAX_QUEUE_DEPTH, duplicate_window=DUPLICATE_WINDOW,
+                 clock=time.monotonic):
+        self.station_rate = station_rate
+        self.station_burst = station_burst
+        self.max_depth = max_depth
+        self.duplicate_window = duplicate_window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rate, global_burst, clock())
+        self._stations = {}
+        self._recent = {}   # key -> (admitted at, what record() was given)
+        self.stats = {'admitted': 0, 'duplicates': 0, 'rejected': 0}
+        self.rejections = Counter()
+
+    def duplicate(self, key, pending=None):
+        """
+        What was recorded for `key` within the window, else None. With
+        `pending`, only while pending(recorded) is true; it is called
+        without the controller's lock held.
+        """
+        now = self._clock()
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is not None and now - recent[0] > self.duplicate_window:
+                del self._recent[key]
+                recent = None
+        if recent is None or (pending is not None and not pending(recent[1])):
+            return None
+        with self._lock:
+            self.stats['duplicates'] += 1
+        return recent[1]
+
+    def admit(self, station, depth=0):
+        """None when the request may proceed (its tokens are taken), else one of REASONS"""
+        now = self._clock()
+        with self._lock:
+            if self.max_depth is not None and depth >= self.max_depth:
+                return self._reject(QUEUE_FULL)
+            bucket = self._stations.get(station)
+            if bucket is None:
+                if len(self._stations) >= MAX_TRACKED:
+                    self._prune(now)
+                bucket = self._stations[station] = TokenBucket(self.station_rate, self.station_burst, now)
+            if bucket.refill(now) < 1:
+                return self._reject(STATION_RATE_LIMITED)
+            if self._global.refill(now) < 1:
+                return self._reject(GLOBAL_RATE_LIMITED)
+            bucket.tokens -= 1
+            self._global.tokens -= 1
+            self.stats['admitted'] += 1
+        return None
+
+    def record(self, key, value):
+        """Remember an admitted request so repeats of `key` collapse into it"""
+        now = self._clock()
+        with self._lock:
+            if len(self._recent) >= MAX_TRACKED:
+                self._prune(now)
+            self._recent[key] = (now, value)
+
+    def _reject(self, reason):
+        self.stats['rejected'] += 1
+        self.rejections[reason] += 1
+        return reason
+
+    def _prune(self, now):
+        self._stations = {station: bucket for station, bucket in self._stations.items()
+                          if not bucket.full(now)}
+        self._recent = {key: recent for key, recent in self._recent.items()
+                        if now - recent[0] <= self.duplicate_window}
+
+    def metrics(self):
+        now = self._clock()
+        with self._lock:
+            return dict(self.stats,
+                        rejections=dict(self.rejections),
+                        global_tokens=round(self._global.refill(now), 2),
+                        limited_stations=sorted(str(station) for station, bucket in self._stations.items()
+                                                if bucket.refill(now) < 1),
+                        tracked_requests=len(self._recent))
@@ -1,18 +1,40 @@
-from flask import Flask, render_template, jsonify, request, abort, redirect, url_for, session
+# First, so eventlet can monkey-patch the standard library before anything else imports it
+import async_runtime
+ASYNC_MODE = async_runtime.configure()
+
+from flask import Flask, render_template, jsonify, request, abort, redirect, url_for, session, Response, stream_with_context
 from flask_socketio import SocketIO, emit, join_room, leave_room, disconnect
 from flask_cors import CORS
 from flask_mqtt import Mqtt
 import sqlite3
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 import hashlib
 import json
-import os, glob
+import os
 import threading
 import time
 from collections import defaultdict, deque
 import random
 import logging
 import schedule
+from db_pool import ConnectionPool
+from sensor_writer import SensorWriteBehind, SENSOR_KEYS
+from sensor_history import SensorHistory
+from station_state import StationStateStore, normalize_station_id
+from dispatch_scheduler import DispatchScheduler, Topology
+from topology_service import TopologyService, ensure_component_tables
+from dispatch_queue import DispatchQueue
+from dispatch_watchdog import DispatchWatchdog
+from dispatch_profile import DispatchProfiler
+from history_query import HistoryQuery, parse_timestamp
+from history_export import EXPORT_FORMATS, encode_rows, gzip_chunks
+from retention import RetentionEngine
+from fanout import FanOut
+from availability import AvailabilityTracker
+from station_view import StationViews
+from admission import AdmissionController, REASONS
+from async_runtime import MessageBridge, db_limit, offload_connection, server_options
+from sensor_codec import FORMAT_BINARY, FORMAT_JSON, decode_sensor_frame, is_binary, negotiate
 
 # use sensor 5 data to check the pod's status. based on it use simple if conditions to check if a dispatch can be done or not. 
 
@@ -31,11 +53,18 @@ sid_stations = {}  # sid -> username
 station_heartbeats = defaultdict(float) 
 HEARTBEAT_TIMEOUT = 30 
 
-# Priority Queue for dispatches
-normal_queue = deque()
-high_priority_queue = deque()
-dispatch_in_progress = False
-current_dispatch = None
+# Live sensor state per station; sensor_data in SQLite is only a snapshot of it
+station_state = StationStateStore(stale_after=HEARTBEAT_TIMEOUT)
+# SENSORDATA frame formats in order of preference, offered to stations that list theirs
+# in the online status; (FORMAT_JSON,) keeps every station on JSON
+SENSOR_FRAME_FORMATS = (FORMAT_BINARY, FORMAT_JSON)
+# Frames and payload bytes received per format, for /api/metrics
+sensor_ingest = defaultdict(int)
+
+# Serialises queue scans and segment reservations between Socket.IO handlers and the MQTT thread
+dispatch_lock = threading.RLock()
+# False reproduces the old one-dispatch-at-a-time behaviour
+CONCURRENT_DISPATCH = True
 
 # Map station names to their IDs for easier reference
 STATION_IDS = {
@@ -63,6 +92,8 @@ mqtt_priority_topic_sub = mqtt_topic_base + 'PRIORITY/#'
 mqtt_ack_topic_sub = mqtt_topic_base + 'ACK/#'
 mqtt_script_topic_sub = mqtt_topic_base + 'SCRIPT/#'
 mqtt_mtn_topic_sub = mqtt_topic_base + 'MTN/#'
+mqtt_heartbeat_topic_sub = mqtt_topic_base + 'HEARTBEAT/#'
+mqtt_trace_topic_sub = mqtt_topic_base + 'TRACE/#'
 
 # Topics for publishing (without wildcards)
 mqtt_sensor_data_topic_pub = mqtt_topic_base + 'SENSORDATA/'
@@ -103,9 +134,70 @@ app.secret_key = b'_5#y2L"F4Q8z\n\xec]/'
 app.config['SYSTEM_STATUS'] = False
 
 mqtt = Mqtt(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE)
+
+# Newest network_architecture*.json, parsed once and served from memory; its watcher
+# thread reloads it when the file changes
+topology_service = TopologyService(os.path.dirname(os.path.abspath(__file__)))
+
+def load_topology():
+    topology_service.reload()
+    snapshot = topology_service.current()
+    if snapshot is None:
+        logger.warning("No network architecture file found, dispatches will run exclusively")
+        return Topology({})
+    return snapshot.topology
+
+dispatch_scheduler = DispatchScheduler(load_topology(), concurrent=CONCURRENT_DISPATCH)
+
+def live_stations():
+    """Station numbers in the topology plus any station screen connected right now"""
+    return set(dispatch_scheduler.topology.stations) | {str(station) for station in connected_stations}
+
+# Server -> browser events go to the rooms involved, never to every socket
+fanout = FanOut(socketio, stations=live_stations)
+
+# Each station's screens follow its view through 'station_view' patches in its room
+station_views = StationViews(lambda station_id, patch: fanout.emit('station_view', patch, stations=[station_id]))
+
+# Sender/receiver/task of the newest history row, kept here so nothing has to query for it
+last_dispatch = {'sender': None, 'receiver': None, 'task_id': None}
 
 DATABASE = 'lan_monitoring.db'
+# Days the daily retention job keeps per table; with an archive directory the
+# expired rows are written there as gzipped NDJSON before they are deleted
+RETENTION_DAYS = {'history': 90, 'script_executions': 90}
+RETENTION_ARCHIVE_DIR = None
+# In eventlet mode every SQLite call runs on the executor's OS threads, not on the hub
+db_connections = ConnectionPool(DATABASE, wrap=offload_connection, max_borrowed=db_limit())
+db_connections.init_app(app)
+# Every sensor frame, partitioned per day, rolled up per hour; fed by the write-behind writer
+sensor_history = SensorHistory(db_connections)
+sensor_writer = SensorWriteBehind(db_connections, history=sensor_history)
+# Priority Queue for dispatches, journaled in the dispatch_queue table
+dispatch_queue = DispatchQueue(db_connections)
+# Step traces from the stations plus the broker's phase timings, per task
+dispatch_profiler = DispatchProfiler(db_connections)
+# Indexed, keyset-paginated reads of the history table for the history page and exports
+history_query = HistoryQuery(db_connections)
+# Expires old rows in small batches on its own thread (dispatch profiles go with their history rows)
+retention = RetentionEngine(db_connections, days=RETENTION_DAYS, archive_dir=RETENTION_ARCHIVE_DIR,
+                            on_delete={'history': DispatchProfiler.delete_tasks})
+# Rate limits, queue depth cap and duplicate collapsing for dispatch requests
+dispatch_admission = AdmissionController()
+# Empty pod requests are broadcast to every dashboard: one per station per 30 s, repeats dropped
+empty_pod_admission = AdmissionController(station_rate=1 / 30, station_burst=1, global_rate=0.5,
+                                          global_burst=5, max_depth=None, duplicate_window=30.0)
+empty_pod_lock = threading.Lock()
+# Fails dispatches that stall; deadlines per phase follow the observed durations
+dispatch_watchdog = DispatchWatchdog(lambda *timeout: handle_dispatch_timeout(*timeout),
+                                     on_phase=dispatch_profiler.record_phase)
+# ACK status -> (phase it starts, which end of the dispatch sends it)
+ACK_PHASES = {
+    'sending': ('sending', 'sender'),
+    'sent': ('in_transit', 'sender'),
+    'arrived': ('receiving', 'receiver'),
+}
 
 topics_to_subscribe = [
         (mqtt_sensor_data_topic_sub, 1),
@@ -114,7 +206,9 @@ topics_to_subscribe = [
         (mqtt_priority_topic_sub, 1),
         (mqtt_ack_topic_sub, 1),
         (mqtt_script_topic_sub, 1),
-        (mqtt_mtn_topic_sub, 1)
+        (mqtt_mtn_topic_sub, 1),
+        (mqtt_trace_topic_sub, 1),
+        (mqtt_heartbeat_topic_sub, 0)
     ]
 for topic, qos in topics_to_subscribe:
         mqtt.subscribe(topic, qos)
@@ -131,12 +225,17 @@ def handle_mqtt_connect(client, userdata, flags, rc):
         (mqtt_status_topic_sub, 1),
         (mqtt_priority_topic_sub, 1),
         (mqtt_ack_topic_sub, 1),
-        (mqtt_script_topic_sub, 1)
+        (mqtt_script_topic_sub, 1),
+        (mqtt_trace_topic_sub, 1),
+        (mqtt_heartbeat_topic_sub, 0)
     ]
     for topic, qos in topics_to_subscribe:
         mqtt.subscribe(topic, qos)
     #mqtt.subscribe(topics_to_subscribe)
     logger.info(f"Subscribed to topics: {', '.join(t[0] for t in topics_to_subscribe)}")
+    # Resume dispatches recovered from the queue journal once stations can hear us
+    with app.app_context():
+        process_next_dispatch()
 
 @mqtt.on_disconnect()
 def handle_disconnect(client, userdata, rc):
@@ -150,9 +249,7 @@ def handle_disconnect(client, userdata, rc):
         logger.info("- Callback crashed")
 
 def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_connections.get_db()
 
 def init_db():
     with app.app_context():
@@ -190,30 +287,53 @@ def init_db():
                        status TEXT,
                        output TEXT
                        )''')
+
+        HistoryQuery.init_schema(db)
+        RetentionEngine.init_schema(db)
+        DispatchQueue.init_schema(db)
+        DispatchProfiler.init_schema(db)
+        SensorHistory.init_schema(db)
+        snapshot = topology_service.current()
+        if snapshot is not None:
+            ensure_component_tables(db, snapshot.data)
         
         db.commit()
 
 def process_next_dispatch():
-    global dispatch_in_progress, current_dispatch
-    
-    if dispatch_in_progress:
-        return
-    if high_priority_queue:
-        dispatch_data = high_priority_queue.popleft()
-        dispatch_in_progress = True
-        current_dispatch = dispatch_data
-        execute_dispatch(dispatch_data)
-    elif normal_queue:
-        dispatch_data = normal_queue.popleft()
-        dispatch_in_progress = True
-        current_dispatch = dispatch_data
-        execute_dispatch(dispatch_data)
+    """Start every queued dispatch whose route is free (high priority queue first)"""
+    with dispatch_lock:
+        for dispatch_data in dispatch_scheduler.select_runnable(dispatch_queue.candidates()):
+            dispatch_queue.take(dispatch_data)
+            execute_dispatch(dispatch_data)
+
+def recover_dispatches():
+    """Replay the journaled queue after a restart"""
+    with app.app_context():
+        db = get_db()
+        cursor = db.execute(
+            "UPDATE history SET status = 'interrupted' WHERE status = 'in_progress'"
+        )
+        db.commit()
+        if cursor.rowcount:
+            logger.warning(f"Marked {cursor.rowcount} dispatches left in progress by the last run as interrupted")
+        dispatch_queue.recover()
+        # Otherwise handle_mqtt_connect resumes them
+        if mqtt.connected:
+            process_next_dispatch()
+
+def route_station_ids(from_id, to_id):
+    """Station IDs ('2', keyed like Topology.stations) a dispatch passes through, sender and receiver included"""
+    topology = dispatch_scheduler.topology
+    route = topology.route(from_id, to_id)
+    if not route:
+        return [str(i) for i in range(1, 5)]  # Unknown route: address every station as before
+    station_components = set(topology.stations.values())
+    return [normalize_station_id(node) for node in route if node in station_components]
 
 def execute_dispatch(dispatch_data):
     from_id = dispatch_data['from']
     to_id = dispatch_data['to']
     priority = dispatch_data['priority']
-    global dispatch_in_progress
     app.config['SYSTEM_STATUS'] = True
     
     logger.info(f"Executing dispatch: from {from_id} to {to_id} with {priority} priority")
@@ -225,8 +345,11 @@ def execute_dispatch(dispatch_data):
     )
     task_id = cursor.lastrowid
     db.commit()
+    last_dispatch.update(sender=str(from_id), receiver=str(to_id), task_id=task_id)
     
     dispatch_data['task_id'] = task_id
+    dispatch_queue.set_task(dispatch_data)
+    dispatch_watchdog.track(task_id, dispatch_data)
     
     dispatch_message = json.dumps({
         'task_id': task_id,
@@ -277,19 +400,13 @@ def execute_dispatch(dispatch_data):
     else:
         logger.error(f"Could not find station names for IDs: from={from_id}, to={to_id}")
     
-    socketio.emit('system_status_changed', {
-        'status': True,
-        'current_dispatch': {
-            'from': from_id,
-            'to': to_id,
-            'priority': priority
-        }
-    })
-    for i in range(1, 5):  # Assuming stations 1 to 4
-        if i == from_id:
+    # Only stations on this route; others may be busy with a concurrent dispatch
+    sender, receiver = normalize_station_id(from_id), normalize_station_id(to_id)
+    for i in route_station_ids(from_id, to_id):
+        if i == sender:
             status = {'status': 'sending', 'destination': to_id, 'task_id': task_id}
             msg = {'action':'dispatch'}
-        elif i == to_id:
+        elif i == receiver:
             msg = {'action':'receive'}
             status = {'status': 'receiving', 'source': from_id, 'task_id': task_id}
         else:
@@ -299,81 +416,42 @@ def execute_dispatch(dispatch_data):
         status_message = json.dumps(msg)
         mqtt.publish(f"{mqtt_status_topic_pub_1}{i}", status_message)
  
-        socketio.emit('status', status, room=str(i))
+        station_views.update(i, status=status)
+    availability.refresh()
 
-@mqtt.on_message()
 def handle_mqtt_message(client, userdata, message):
     try:
-        data = message.payload.decode()
         topic = message.topic
+        # Sensor frames may be binary, so they are decoded before anything treats them as text
+        if topic.startswith('PTS/SENSORDATA/'):
+            handle_sensor_message(topic, message.payload)
+            return
+
+        data = message.payload.decode()
         print(f"MQTT message received: {topic} -> {data}")
         logger.info(f"MQTT message received: {topic} -> {data}")
         
         # Handle different types of messages based on topic
-        if topic.startswith('PTS/SENSORDATA/'):
-            # Get station ID from topic
-            station_id = topic.split('/')[-1]
-            # Forward to Socket.IO clients
-            socketio.emit('mqtt_message', {'topic': topic, 'data': data}, room=str(station_id))
-            
-            # Store to database if it's valid JSON
-            try:
-                sensor_data = json.loads(data)
-                if isinstance(sensor_data, dict):
-                    db = get_db()
-                    #mapped_data = map_sensor_data(sensor_data)
-                    mapped_data = sensor_data
-                    db.execute(
-                        '''
-                        INSERT INTO sensor_data 
-                        (station_id, S1, S2, S3, S4, P1, P2, P3, P4) 
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ON CONFLICT(station_id) DO UPDATE SET
-                            S1 = excluded.S1,
-                            S2 = excluded.S2,
-                            S3 = excluded.S3,
-                            S4 = excluded.S4,
-                            P1 = excluded.P1,
-                            P2 = excluded.P2,
-                            P3 = excluded.P3,
-                            P4 = excluded.P4,
-                            timestamp = CURRENT_TIMESTAMP
-                        ''',
-                        (
-                            station_id,
-                            mapped_data.get('S1', False),
-                            mapped_data.get('S2', False),
-                            mapped_data.get('S3', False),
-                            mapped_data.get('S4', False),
-                            mapped_data.get('P1', False),
-                            mapped_data.get('P2', False),
-                            mapped_data.get('P3', False),
-                            mapped_data.get('P4', False)
-                        )
-                    )
-                    db.commit()
-                    #mapped_data = map_sensor_data(sensor_data)
-                    sensor_5 = mapped_data.get('P1', False)
-                    logger.info(f"Emitting Pod Availability: {not sensor_5} for station {station_id}")
-                    socketio.emit('pod_availability_changed', {
-                    'station_id': station_id,
-                    'available': not sensor_5
-                    }, room=str(station_id))
-
-            except json.JSONDecodeError:
-                logger.warning(f"Invalid JSON format in sensor data: {data}")
-                
-        elif topic.startswith('PTS/DISPATCH/'):
+        if topic.startswith('PTS/DISPATCH/'):
             parts = topic.split('/')
             if len(parts) >= 4:
                 from_id = parts[2]
                 to_id = parts[3]
-                socketio.emit('dispatch_event', {'from': from_id, 'to': to_id, 'data': data})
+                progress = {'from': from_id, 'to': to_id, 'data': data}
+                station_views.update(from_id, dispatch=progress)
+                station_views.update(to_id, dispatch=progress)
                 logger.info(f"Dispatch from {from_id} to {to_id}: {data}")
                 
+        elif topic.startswith('PTS/HEARTBEAT/'):
+            handle_station_heartbeat(topic.split('/')[-1], data)
+
+        elif topic.startswith('PTS/TRACE/'):
+            handle_station_trace(topic.split('/')[-1], data)
+
         elif topic.startswith('PTS/STATUS/'):
             station_id = topic.split('/')[-1]
-            socketio.emit('station_status', {'station': station_id, 'data': data}, room=str(station_id))
+            track_station_liveness(station_id, data)
+            fanout.emit('station_status', {'station': station_id, 'data': data}, stations=[station_id])
             logger.info(f"Status update for station {station_id}: {data}")
                 
         elif topic.startswith('PTS/PRIORITY/'):
@@ -393,75 +471,219 @@ def handle_mqtt_message(client, userdata, message):
             try:
                 ack_data = json.loads(data)
                 if ack_data.get('type') == 'receive_completed':
-                    handle_dispatch_completed(ack_data)
-                elif ack_data.get('type') == 'receive_completed':
-                    logger.info(f"Receiver ACK received for Task {ack_data.get('task_id')}")
-                    socketio.emit('receiver_ack_completed', ack_data)  # 🔥 NEW EMIT to frontend
+                    handle_dispatch_completed(ack_data, station_id=station_id)
+                elif ack_data.get('type') == 'command':
+                    handle_command_reply(ack_data, station_id)
+                elif ack_data.get('status') == 'failed':
+                    handle_station_failure(ack_data, station_id)
+                else:
+                    track_dispatch_phase(ack_data, station_id)
             except json.JSONDecodeError:
                 logger.warning(f"Invalid JSON format in acknowledgment: {data}")
                 
     except Exception as e:
         logger.error(f"MQTT message processing error: {e}")
+
+# In eventlet mode paho's callback only queues the message; a worker on the hub handles it
+mqtt_inbox = MessageBridge(handle_mqtt_message, socketio.start_background_task)
+
+@mqtt.on_message()
+def on_mqtt_message(client, userdata, message):
+    if ASYNC_MODE == 'threading':
+        handle_mqtt_message(client, userdata, message)
+    else:
+        mqtt_inbox.submit(client, userdata, message)
+
+def handle_sensor_message(topic, payload):
+    """A SENSORDATA frame, JSON or bin1 (see sensor_codec)"""
+    parts = topic.split('/')
+    if len(parts) != 3:
+        return  # PTS/SENSORDATA/<id>/format etc. go from the broker to the station
+    station_id = parts[2]
+    binary = is_binary(payload)
+    fmt = FORMAT_BINARY if binary else FORMAT_JSON
+    try:
+        sensor_data = decode_sensor_frame(payload)
+    except ValueError:
+        sensor_ingest['invalid'] += 1
+        logger.warning(f"Invalid sensor frame from station {station_id}: {payload!r}")
+        return
+    sensor_ingest[f'{fmt}_frames'] += 1
+    sensor_ingest[f'{fmt}_bytes'] += len(payload)
+    logger.info(f"Sensor frame ({fmt}) from station {station_id}: {sensor_data}")
+
+    if not station_state.update(station_id, sensor_data):
+        return  # duplicate frame
+    # Persisted by the write-behind thread, never inline on the paho thread
+    sensor_writer.submit(station_id, sensor_data)
+    # Screens get only the sensors that changed; pod availability goes out with the availability
+    station_views.update(station_id, sensors=station_state.get(station_id)['sensors'])
+    availability.refresh()
+
 @socketio.on('maintenance_entered')
 def handle_maintenance_entered(data):
     station_id = data['station_id']
-    emit('notify_maintenance_entered', {'station_id': station_id}, broadcast=True, include_self=False)
+    fanout.emit('notify_maintenance_entered', {'station_id': station_id}, topics=('maintenance',), skip_sid=request.sid)
 
 @socketio.on('maintenance_exited')
 def handle_maintenance_exited(data):
     station_id = data['station_id']
-    emit('notify_maintenance_exited', {'station_id': station_id}, broadcast=True, include_self=False)
+    fanout.emit('notify_maintenance_exited', {'station_id': station_id}, topics=('maintenance',), skip_sid=request.sid)
     
 @socketio.on('dispatch_completed')
-def handle_dispatch_completed(data):
-    global dispatch_in_progress, current_dispatch
-    
-    if dispatch_in_progress and current_dispatch:
-        task_id = data.get('task_id') or current_dispatch.get('task_id')
-        from_id = current_dispatch['from']
-        to_id = current_dispatch['to']
-        
-        logger.info(f"Dispatch completed: Task ID: {task_id}, from {from_id} to {to_id}")
-        
-        app.config['SYSTEM_STATUS'] = False
-        
-        # Update task status in database
-        db = get_db()
+def handle_dispatch_completed(data, station_id=None):
+    """
+    Completes the dispatch named by task_id, or the one received by station_id
+    (receiver ACK). A manual completion from the dashboard carries neither and
+    completes the oldest active dispatch.
+    """
+    with dispatch_lock:
+        task_id = data.get('task_id')
+        dispatch = dispatch_scheduler.find(task_id=task_id, receiver=station_id)
+        if dispatch is None and task_id is None and station_id is None:
+            active = dispatch_scheduler.active()
+            dispatch = active[0] if active else None
+        if dispatch is None:
+            logger.warning(f"Completion for unknown dispatch ignored: task {task_id}, station {station_id}")
+            return
+
+        logger.info(f"Dispatch completed: Task ID: {dispatch.get('task_id')}, from {dispatch['from']} to {dispatch['to']}")
+        dispatch_watchdog.finish(dispatch.get('task_id'))
+        details = record_station_trace(dispatch, station_id or dispatch['to'], data)
+        finish_dispatch(dispatch, 'completed', details)
+
+def handle_dispatch_timeout(task_id, dispatch, phase, elapsed):
+    """Called by the watchdog thread when a dispatch overruns its phase deadline"""
+    with app.app_context(), dispatch_lock:
+        if dispatch_scheduler.find(task_id=task_id) is not dispatch:
+            return  # Completed while the watchdog was deciding
+        fail_dispatch(dispatch, f"timed out while {phase.replace('_', ' ')}",
+                      {'timeout_phase': phase, 'elapsed': round(elapsed, 1)})
+
+def handle_station_failure(ack_data, station_id):
+    """A station aborted its side of a dispatch (sensor wait timed out)"""
+    role = 'sender' if ack_data.get('operation') == 'send' else 'receiver'
+    with dispatch_lock:
+        dispatch = dispatch_scheduler.find(task_id=ack_data.get('task_id'), **{role: station_id})
+        if dispatch is None:
+            logger.warning(f"Failure report from station {station_id} matches no active dispatch: {ack_data}")
+            return
+        dispatch_watchdog.forget(dispatch.get('task_id'))
+        record_station_trace(dispatch, station_id, ack_data)
+        fail_dispatch(dispatch, f"station {station_id} aborted: {ack_data.get('reason')}",
+                      {'failed_station': station_id, 'operation': ack_data.get('operation'),
+                       'reason': ack_data.get('reason')})
+
+def handle_command_reply(reply, station_id):
+    """
+    A station's accepted/queued/rejected answer to a command. A send or
+    receive it rejected (queue full) fails its dispatch now rather than at
+    the watchdog deadline.
+    """
+    if reply.get('status') != 'rejected':
+        return
+    role = {'send': 'sender', 'receive': 'receiver'}.get(reply.get('operation'))
+    if role is None:
+        logger.warning(f"Station {station_id} rejected {reply.get('command')}: {reply.get('reason')}")
+        return
+    with dispatch_lock:
+        dispatch = dispatch_scheduler.find(task_id=reply.get('task_id'), **{role: station_id})
+        if dispatch is None:
+            return
+        dispatch_watchdog.forget(dispatch.get('task_id'))
+        fail_dispatch(dispatch, f"station {station_id} rejected the {reply['operation']}: {reply.get('reason')}",
+                      {'rejected_station': station_id, 'operation': reply['operation'],
+                       'reason': reply.get('reason')})
+
+def record_station_trace(dispatch, station_id, ack_data):
+    """
+    Store the step trace a station ACK carries; returns the ACK details
+    without it, for history.execution_details
+    """
+    details = dict(ack_data.get('details') or {})
+    trace = details.pop('trace', None)
+    if trace:
+        try:
+            dispatch_profiler.record_trace(dispatch.get('task_id'), normalize_station_id(station_id), trace)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Could not store trace from station {station_id}: {e}")
+    return details or None
+
+def handle_station_trace(station_id, data):
+    """
+    The complete trace a station publishes once an operation is over; it
+    replaces the rows stored from its ACKs, which may have had steps still
+    running (no duration)
+    """
+    try:
+        message = json.loads(data)
+        dispatch_profiler.record_trace(message.get('task_id'), normalize_station_id(station_id),
+                                       message.get('trace'))
+    except (sqlite3.Error, TypeError, ValueError, AttributeError) as e:
+        logger.warning(f"Could not store trace from station {station_id}: {e}")
+
+def fail_dispatch(dispatch, reason, execution_details):
+    """Caller holds dispatch_lock"""
+    logger.error(f"Dispatch {dispatch.get('task_id')} from {dispatch['from']} to {dispatch['to']} failed: {reason}")
+    # Halt every station on the route before it is freed for the next dispatch;
+    # 'stop' preempts the running operation and drops the queued ones
+    stop_message = json.dumps({'action': 'stop', 'task_id': dispatch.get('task_id')})
+    for i in route_station_ids(dispatch['from'], dispatch['to']):
+        mqtt.publish(f"{mqtt_status_topic_pub_1}{i}", stop_message)
+    finish_dispatch(dispatch, 'failed', execution_details)
+    fanout.emit('dispatch_failed', {
+        'task_id': dispatch.get('task_id'),
+        'reason': f"Dispatch from {dispatch['from']} to {dispatch['to']} failed: {reason}."
+    }, stations=[dispatch['from']])
+
+def finish_dispatch(dispatch, status, execution_details=None):
+    """Record the outcome, free the route and start whatever it unblocks. Caller holds dispatch_lock."""
+    task_id = dispatch.get('task_id')
+    from_id = dispatch['from']
+    to_id = dispatch['to']
+
+    # Update task status in database
+    db = get_db()
+    db.execute(
+        'UPDATE history SET status = ? WHERE task_id = ?',
+        (status, task_id)
+    )
+    # Add execution details if available
+    if execution_details:
         db.execute(
-            'UPDATE history SET status = ? WHERE task_id = ?',
-            ('completed', task_id)
+            'UPDATE history SET execution_details = ? WHERE task_id = ?',
+            (json.dumps(execution_details), task_id)
         )
-        db.commit()
-        
-        # Add execution details if available
-        execution_details = data.get('details')
-        if execution_details:
-            db.execute(
-                'UPDATE history SET execution_details = ? WHERE task_id = ?',
-                (json.dumps(execution_details), task_id)
-            )
-            db.commit()
-        
-                # Notify UI to re-enable dispatch
-        socketio.emit('system_status_changed', {
-            'status': False,
-            'current_dispatch': None
-        })
-        # Reset dispatch state
-        dispatch_in_progress = False
-        current_dispatch = None
-        
-        # Process next dispatch if any
-        process_next_dispatch()
-        
-        # Update status for all stations
-        for i in range(1, 5):  # Assuming stations 1 to 4
-            status = {'status': 'standby'}
-            status_message = json.dumps(status)
-            mqtt.publish(f"{mqtt_status_topic_pub}{i}", status_message)
-            
-            socketio.emit('status', status, room=str(i))
-            
+    db.commit()
+
+    # Free the route's segments and blower
+    dispatch_scheduler.release(dispatch)
+    dispatch_queue.done(dispatch)
+    app.config['SYSTEM_STATUS'] = dispatch_scheduler.busy()
+
+    # Return the stations on this route to standby
+    for i in route_station_ids(from_id, to_id):
+        status_update = {'status': 'standby'}
+        mqtt.publish(f"{mqtt_status_topic_pub}{i}", json.dumps(status_update))
+        station_views.update(i, status=status_update)
+
+    # Start whatever the freed segments unblocked
+    process_next_dispatch()
+    availability.refresh()
+
+def track_dispatch_phase(ack_data, station_id):
+    """Advance the watchdog on the progress ACKs send_capsule/receive_capsule publish"""
+    phase, role = ACK_PHASES.get(ack_data.get('status'), (None, None))
+    if phase is None:
+        return
+    dispatch = dispatch_scheduler.find(task_id=ack_data.get('task_id'), **{role: station_id})
+    if dispatch is None:
+        return
+    record_station_trace(dispatch, station_id, ack_data)
+    if dispatch_watchdog.advance(dispatch.get('task_id'), phase):
+        fanout.emit('dispatch_phase', {'task_id': dispatch.get('task_id'), 'phase': phase},
+                    stations=[dispatch['from']])
+
 def map_sensor_data(data):
     if 'S1' in data: 
         return {
@@ -494,8 +716,8 @@ def handle_join(data):
         sid_stations[sid] = station_id
 
         # Notify others
-        emit('update_connected_stations', list(connected_stations.keys()), broadcast=True)
-        emit('station_joined', {'station_id': station_id}, broadcast=True)
+        fanout.state('update_connected_stations', list(connected_stations.keys()), topics=('stations',))
+        fanout.emit('station_joined', {'station_id': station_id}, topics=('stations',))
 
         # Publish to MQTT
         status_message = json.dumps({
@@ -511,18 +733,18 @@ def handle_join(data):
         join_room(page_id)
         logger.info(f"Joined room (page ID): {page_id}")
 
-    if dispatch_in_progress and current_dispatch:
-        emit('system_status_changed', {
-            'status': True,
-            'current_dispatch': current_dispatch
-        }, room=sid)
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Dashboards and page-wide sockets pick the fanout topics they listen to"""
+    topics = data.get('topics', []) if isinstance(data, dict) else []
+    fanout.subscribe(request.sid, topics)
 
 @socketio.on('hello_packet')
 def handle_hello_packet(data):
     sender = data['node']
     if sender in connected_stations:
-        # Broadcast hello packet to all other stations
-        emit('hello_packet', data, broadcast=True, include_self=False)
+        # Hello packet to the other connected stations
+        fanout.emit('hello_packet', data, stations=list(connected_stations), skip_sid=request.sid)
         
         # Also publish to MQTT
         hello_message = json.dumps(data)
@@ -548,8 +770,8 @@ def handle_heartbeat(data):
     timestamp = data['timestamp']
     if username in connected_stations:
         station_heartbeats[username] = timestamp
-        # Broadcast heartbeat to all other stations
-        emit('heartbeat', data, broadcast=True, include_self=False)
+        # Heartbeat to whoever watches the station registry
+        fanout.emit('heartbeat', data, topics=('stations',), skip_sid=request.sid)
         
         # Also publish to MQTT for logging
         heartbeat_message = json.dumps(data)
@@ -580,45 +802,114 @@ def handle_dispatch(data):
     priority = data.get('priority', 'low')
     
     logger.info(f"Dispatch request: from {from_id} to {to_id} with {priority} priority")
-    
-    # CHECK SENSOR-5 before dispatch
-    if not is_pod_available(from_id):
-        logger.warning(f"Dispatch aborted: No pod available at station {from_id}")
-        emit('dispatch_failed', {
-            'reason': f"No pod available at station {from_id}. Dispatch aborted."
-        }, room=request.sid)
-        return
 
-    dispatch_data = {
-        'from': from_id,
-        'to': to_id,
-        'priority': priority,
-        'timestamp': time.time()
-    }
-    
-    # Add to appropriate queue
-    if priority.lower() == 'high':
-        high_priority_queue.append(dispatch_data)
-        logger.info(f"Added to high priority queue. Queue length: {len(high_priority_queue)}")
-    else:
-        normal_queue.append(dispatch_data)
-        logger.info(f"Added to normal queue. Queue length: {len(normal_queue)}")
-    
-    # Publish to MQTT
-    dispatch_request = json.dumps(dispatch_data)
-    mqtt.publish(f"{mqtt_topic_base}PRIORITY/{from_id}/{to_id}", dispatch_request)
-    
-    # Process next dispatch if none is in progress
-    if not dispatch_in_progress:
+    # A repeat of a request that is still queued or running is answered with that one. Checked and
+    # recorded under one lock, so identical requests arriving together are queued once
+    key = (from_id, to_id, dispatch_queue.level_of(priority))
+    with dispatch_lock:
+        earlier = dispatch_admission.duplicate(key, pending=dispatch_pending)
+        if earlier is not None:
+            logger.info(f"Duplicate dispatch request from {from_id} to {to_id} collapsed into {earlier['queue_id']}")
+            position = dispatch_queue.position(earlier)
+            if position is not None:
+                emit('dispatch_queued', {
+                    'from': from_id,
+                    'to': to_id,
+                    'queue_id': earlier['queue_id'],
+                    'position': position,
+                    'duplicate': True
+                }, room=request.sid)
+            else:
+                emit('dispatch_failed', {
+                    'code': 'duplicate',
+                    'reason': f"A dispatch from {from_id} to {to_id} is already in progress."
+                }, room=request.sid)
+            return
+
+        # CHECK SENSOR-5 before dispatch
+        if not is_pod_available(from_id):
+            logger.warning(f"Dispatch aborted: No pod available at station {from_id}")
+            emit('dispatch_failed', {
+                'code': 'no_pod',
+                'reason': f"No pod available at station {from_id}. Dispatch aborted."
+            }, room=request.sid)
+            return
+
+        reason = dispatch_admission.admit(from_id, depth=len(dispatch_queue))
+        if reason is not None:
+            logger.warning(f"Dispatch from {from_id} to {to_id} refused: {reason}")
+            emit('dispatch_failed', {'code': reason, 'reason': REASONS[reason]}, room=request.sid)
+            return
+
+        dispatch_data = {
+            'from': from_id,
+            'to': to_id,
+            'priority': priority,
+            'timestamp': time.time()
+        }
+
+        # Publish to MQTT
+        dispatch_request = json.dumps(dispatch_data)
+        mqtt.publish(f"{mqtt_topic_base}PRIORITY/{from_id}/{to_id}", dispatch_request)
+
+        # Add to appropriate queue
+        dispatch_queue.push(dispatch_data)
+        dispatch_admission.record(key, dispatch_data)
+        logger.info(f"Added to {priority} priority queue. Queue depth: {dispatch_queue.depth()}")
+
+        # Starts it right away unless its route is busy
         process_next_dispatch()
-    else:
+        position = dispatch_queue.position(dispatch_data)
+    availability.refresh()
+
+    if position is not None:
         # Inform the client that the dispatch is queued
         emit('dispatch_queued', {
             'from': from_id,
             'to': to_id,
-            'position': len(high_priority_queue) if priority.lower() == 'high' else len(normal_queue)
+            'queue_id': dispatch_data['queue_id'],
+            'position': position
         }, room=str(from_id))
 
+def dispatch_pending(dispatch_data):
+    """Whether a dispatch is still queued or running"""
+    queue_id = dispatch_data.get('queue_id')
+    return (dispatch_queue.position(dispatch_data) is not None
+            or any(active.get('queue_id') == queue_id for active in dispatch_scheduler.active()))
+
+@socketio.on('cancel_dispatch')
+def handle_cancel_dispatch(data):
+    with dispatch_lock:
+        dispatch_data = dispatch_queue.cancel(data.get('queue_id'))
+    availability.refresh()
+    if dispatch_data is None:
+        emit('dispatch_failed', {'reason': 'Dispatch is no longer queued and cannot be cancelled.'}, room=request.sid)
+        return
+    logger.info(f"Cancelled queued dispatch {dispatch_data['queue_id']}: from {dispatch_data['from']} to {dispatch_data['to']}")
+    emit('dispatch_cancelled', {
+        'queue_id': dispatch_data['queue_id'],
+        'from': dispatch_data['from'],
+        'to': dispatch_data['to']
+    }, room=str(dispatch_data['from']))
+
+@socketio.on('reprioritise_dispatch')
+def handle_reprioritise_dispatch(data):
+    with dispatch_lock:
+        dispatch_data = dispatch_queue.reprioritise(data.get('queue_id'), data.get('priority', 'normal'))
+        if dispatch_data is None:
+            emit('dispatch_failed', {'reason': 'Dispatch is no longer queued and cannot be reprioritised.'}, room=request.sid)
+            return
+        process_next_dispatch()
+        position = dispatch_queue.position(dispatch_data)
+    availability.refresh()
+    if position is not None:
+        emit('dispatch_queued', {
+            'from': dispatch_data['from'],
+            'to': dispatch_data['to'],
+            'queue_id': dispatch_data['queue_id'],
+            'position': position
+        }, room=str(dispatch_data['from']))
+
 @socketio.on('sensor_data')
 def handle_sensor_data(data):
     station_id = data.get('station_id')
@@ -676,8 +967,8 @@ def cleanup_inactive_stations():
                 del station_sids[username]
             del connected_stations[username]
             del station_heartbeats[username]
-            emit('station_left', {'node': username}, broadcast=True)
-            emit('update_connected_stations', list(connected_stations.keys()), broadcast=True)
+            fanout.emit('station_left', {'node': username}, topics=('stations',))
+            fanout.state('update_connected_stations', list(connected_stations.keys()), topics=('stations',))
             
             # Publish station offline status to MQTT
             status_message = json.dumps({
@@ -700,8 +991,8 @@ def handle_disconnect():
         station_sids.pop(station_id, None)
         sid_stations.pop(sid, None)
 
-        emit('station_left', {'station_id': station_id}, broadcast=True)
-        emit('update_connected_stations', list(connected_stations.keys()), broadcast=True)
+        fanout.emit('station_left', {'station_id': station_id}, topics=('stations',))
+        fanout.state('update_connected_stations', list(connected_stations.keys()), topics=('stations',))
 
         status_message = json.dumps({
             'station_id': station_id,
@@ -724,22 +1015,95 @@ def is_pod_available(station_id):
     Returns True if pod is available, False otherwise.
     Sensor 5 = False => Pod available
     Sensor 5 = True => Pod not available
+    Served from the in-memory station state. A station that has not sent a
+    sensor frame or heartbeat within HEARTBEAT_TIMEOUT, or whose latest frame
+    was lost and is being resynced, is unknown, and unknown is never treated
+    as available.
     """
+    available = station_state.pod_available(station_id)
+    if available is None:
+        logger.warning(f"Pod availability unknown for station {station_id}: "
+                       "no recent sensor data or heartbeat, or a resync is pending")
+        return False
+    return available
+
+def pod_state(station_id):
+    available = station_state.pod_available(station_id)
+    if available is None:
+        return 'unknown'
+    return 'available' if available else 'occupied'
+
+def track_station_liveness(station_id, data):
+    """Online/offline (last will) STATUS messages published by the station firmware"""
     try:
-        db = get_db()
-        row = db.execute(
-            '''SELECT P1 FROM sensor_data 
-               WHERE station_id = ? 
-            ''',
-            (station_id,)
+        status = json.loads(data)
+    except json.JSONDecodeError:
+        return
+    # Only the firmware sends 'station'; the broker's own kiosk status uses 'station_id'
+    if not isinstance(status, dict) or 'station' not in status:
+        return
+    if status.get('status') == 'offline':
+        station_state.mark_offline(station_id)
+    elif status.get('status') == 'online':
+        station_state.touch(station_id, boot_id=status.get('boot_id'))
+        negotiate_sensor_format(station_id, status.get('sensor_formats'))
+
+def handle_station_heartbeat(station_id, data):
+    """Heartbeats keep a station live; the firmware's also carry its last sensor frame number"""
+    try:
+        heartbeat = json.loads(data)
+    except json.JSONDecodeError:
+        heartbeat = None
+    if not isinstance(heartbeat, dict):
+        heartbeat = {}
+    if station_state.touch(station_id, heartbeat.get('sensor_seq'), heartbeat.get('boot_id')):
+        request_sensor_resync(station_id)
+
+def request_sensor_resync(station_id):
+    """Ask a station to republish its current sensor frame (it is unknown until it does)"""
+    station_id = normalize_station_id(station_id)
+    logger.warning(f"Sensor frames from station {station_id} were lost, requesting resync")
+    mqtt.publish(f"{mqtt_sensor_data_topic_pub}{station_id}/sync", json.dumps({'timestamp': time.time()}))
+
+def negotiate_sensor_format(station_id, offered):
+    """Pick the frame format for a station that just came online; older firmware offers none and stays on JSON"""
+    fmt = negotiate(offered, SENSOR_FRAME_FORMATS)
+    station_state.set_format(station_id, fmt)
+    if offered:
+        mqtt.publish(f"{mqtt_sensor_data_topic_pub}{station_id}/format", json.dumps({'format': fmt}))
+        logger.info(f"Station {station_id} sends sensor frames as {fmt}")
+
+def load_last_dispatch():
+    with app.app_context():
+        row = get_db().execute(
+            'SELECT task_id, sender, receiver FROM history ORDER BY timestamp DESC LIMIT 1'
         ).fetchone()
-        if row:
-            return not bool(row[0])
-        else:
-            return False
-    except Exception as e:
-        logger.error(f"Error checking pod availability for station {station_id}: {e}")
-        return False
+    if row is not None:
+        last_dispatch.update(sender=row['sender'], receiver=row['receiver'], task_id=row['task_id'])
+
+def collect_availability():
+    """Everything a kiosk needs to know whether it may dispatch; memory only"""
+    active = dispatch_scheduler.active()
+    return {
+        'busy': bool(active),
+        'current_dispatch': dict(active[-1]) if active else None,
+        'last_dispatch': dict(last_dispatch),
+        'queue_depth': dispatch_queue.depth(),
+        'pods': {station: pod_state(station) for station in live_stations()},
+    }
+
+# Pushed to the 'availability' topic as versioned deltas; kiosks load /api/availability once
+availability = AvailabilityTracker(
+    collect_availability,
+    lambda delta: fanout.emit('availability', delta, topics=('availability',)))
+
+def load_station_state():
+    """Seed the live station state from the last persisted sensor snapshot"""
+    with app.app_context():
+        rows = get_db().execute('SELECT * FROM sensor_data').fetchall()
+    for row in rows:
+        station_state.seed(row['station_id'], {key: row[key] for key in SENSOR_KEYS})
+    logger.info(f"Loaded sensor snapshot for {len(rows)} stations (unknown until heard from)")
 
 
 @app.route('/')
@@ -774,21 +1138,14 @@ def handle_page(page_id):
 @app.route('/api/set_sensor_status/<station_id>/<sensor_5_status>', methods=['POST'])
 def set_sensor_status(station_id, sensor_5_status):
     try:
-        db = get_db()
         sensor_5_value = True if sensor_5_status.lower() == 'true' else False
-        db.execute(
-            '''INSERT INTO sensor_data 
-               (station_id, sensor_1, sensor_2, sensor_3, sensor_4, 
-                sensor_5, sensor_6, sensor_7, sensor_8)
-               VALUES (?, 0, 0, 0, 0, ?, 0, 0, 0)''',
-            (station_id, sensor_5_value)
-        )
-        db.commit()
+        frame = {key: False for key in SENSOR_KEYS}
+        frame['P1'] = sensor_5_value
+        station_state.update(station_id, frame)
+        sensor_writer.submit(normalize_station_id(station_id), frame)
 
-        socketio.emit('pod_availability_changed', {
-            'station_id': station_id,
-            'available': not sensor_5_value
-        }, room=str(station_id))
+        station_views.update(station_id, sensors=station_state.get(station_id)['sensors'])
+        availability.refresh()
 
         return jsonify({'message': f'Sensor-5 status updated for station {station_id}', 'sensor_5': sensor_5_value}), 200
     except Exception as e:
@@ -797,90 +1154,124 @@ def set_sensor_status(station_id, sensor_5_status):
 
 @app.route('/api/check_pod_available/<station_id>')
 def check_pod_available(station_id):
-    return jsonify({'available': is_pod_available(station_id)})
+    return jsonify({'available': is_pod_available(station_id), 'state': pod_state(station_id)})
+
+@app.route('/api/station_state')
+def get_station_state():
+    return jsonify(station_state.snapshot())
+
+@app.route('/api/profile')
+def get_profile_summary():
+    """Step and phase duration percentiles per station over recent tasks, slowest first"""
+    tasks = request.args.get('tasks', default=1000, type=int)
+    return jsonify(dispatch_profiler.summary(tasks=max(1, tasks)))
+
+@app.route('/api/profile/<int:task_id>')
+def get_task_profile(task_id):
+    task = get_db().execute(
+        'SELECT task_id, sender, receiver, priority, timestamp, status, execution_details FROM history WHERE task_id = ?',
+        (task_id,)
+    ).fetchone()
+    if task is None:
+        return jsonify({'error': 'Unknown task'}), 404
+    return jsonify({'task': dict(task), 'stations': dispatch_profiler.profile(task_id)})
+
+def history_range(default_since=3600):
+    """[start, end) in epoch ms from ?start=&end= (ms) or ?since= (seconds back)"""
+    now_ms = int(time.time() * 1000)
+    end = request.args.get('end', default=now_ms, type=int)
+    start = request.args.get('start', type=int)
+    if start is None:
+        start = end - int(request.args.get('since', default=default_since, type=float) * 1000)
+    return start, end
+
+@app.route('/api/sensor_history/<station_id>')
+def get_sensor_history(station_id):
+    """
+    Sensor frames of a station, e.g. ?sensor=P3&edges=1&since=3600 for every
+    P3 edge in the last hour
+    """
+    station_id = normalize_station_id(station_id)
+    sensor = request.args.get('sensor')
+    if not station_id.isdigit() or (sensor is not None and sensor not in SENSOR_KEYS):
+        return jsonify({'error': 'Unknown station or sensor'}), 400
+    start, end = history_range()
+    edges = request.args.get('edges', '').lower() in ('1', 'true', 'yes')
+    limit = min(request.args.get('limit', default=10000, type=int), 100000)
+    events = sensor_history.events(station_id, start, end, sensor=sensor, edges_only=edges, limit=limit)
+    return jsonify({'station_id': station_id, 'start': start, 'end': end, 'events': events})
+
+@app.route('/api/sensor_history/<station_id>/hourly')
+def get_sensor_rollups(station_id):
+    """Frames and edges per sensor per hour, kept long after the raw events"""
+    station_id = normalize_station_id(station_id)
+    if not station_id.isdigit():
+        return jsonify({'error': 'Unknown station'}), 400
+    start, end = history_range(default_since=24 * 3600)
+    return jsonify({'station_id': station_id, 'hours': sensor_history.rollups(station_id, start, end)})
+
+@app.route('/api/metrics')
+def get_metrics():
+    return jsonify({
+        'sensor_writer': sensor_writer.metrics(),
+        'dispatch_queue': dispatch_queue.depth(),
+        'dispatch_scheduler': dict(dispatch_scheduler.stats,
+                                   active=len(dispatch_scheduler.active()),
+                                   utilisation=dispatch_scheduler.utilisation()),
+        'db_connections': db_connections.stats,
+        'sensor_ingest': dict(sensor_ingest),
+        'sensor_streams': station_state.stream_stats(),
+        'sensor_history': sensor_history.metrics(),
+        'retention': retention.metrics(),
+        'topology': topology_service.metrics(),
+        'fanout': fanout.metrics(),
+        'availability': availability.metrics(),
+        'station_views': station_views.metrics(),
+        'admission': {'dispatch': dispatch_admission.metrics(), 'empty_pod': empty_pod_admission.metrics()},
+        'async_mode': ASYNC_MODE,
+        'mqtt_inbox': mqtt_inbox.metrics(),
+        'dispatch_phases': dispatch_watchdog.histograms()
+    })
 
-# can be kept on a separate file
 @app.route('/api/network_architecture')
 def get_network_architecture():
-    try:
-        directory = os.path.dirname(__file__)
-        json_files = glob.glob(os.path.join(directory, "network_architecture*.json"))
-        
-        if not json_files:
-            return jsonify({'error': 'No architecture files found'}), 404
-        
-        latest_file = max(json_files, key=os.path.getmtime)
-        with open(latest_file, 'r') as json_file:
-            data = json.load(json_file)
-        # Debug: Check keys present in the JSON file
-        logger.debug(f"Loaded JSON data keys: {data.keys()}")
-        
-        # Process the components from the JSON file
-        components = data.get('components', [])
-        logger.debug(f"Found {len(components)} components in JSON file.")
-        db = get_db()
-        
-        for component in components:
-            comp_type = component.get('type')  # Use the correct key for type
-            comp_id = component.get('id')      # Use the correct key for id
-            logger.debug(f"Component details: type={comp_type}, id={comp_id}")
-            
-            if comp_type in ['passthrough-station', 'bottom-loading-station']:
-                if comp_id:
-                    table_name = f"component_{comp_id}"
-                    logger.debug(f"Creating table for component id: {comp_id}, table name: {table_name}")
-                    db.execute(f'''
-                        CREATE TABLE IF NOT EXISTS "{table_name}" (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            positional_sensor_1 BOOLEAN NOT NULL,
-                            positional_sensor_2 BOOLEAN NOT NULL,
-                            positional_sensor_3 BOOLEAN NOT NULL,
-                            positional_sensor_4 BOOLEAN NOT NULL,
-                            positional_sensor_5 BOOLEAN NOT NULL,
-                            positional_sensor_6 BOOLEAN NOT NULL,
-                            positional_sensor_7 BOOLEAN NOT NULL,
-                            positional_sensor_8 BOOLEAN NOT NULL
-                        )
-                    ''')
-                else:
-                    logger.debug("Skipping component due to missing id.")
-            else:
-                logger.debug("Skipping component due to type mismatch.")
-        db.commit()
-        logger.debug("Component tables creation committed.")
-        
-        return jsonify(data)
-    except FileNotFoundError:
-        return jsonify({'error': 'Network architecture file not found'}), 404
-    except json.JSONDecodeError:
-        return jsonify({'error': 'Invalid JSON format in network architecture file'}), 500
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
+    """The cached architecture; browsers revalidate with If-None-Match and get a 304"""
+    snapshot = topology_service.current()
+    if snapshot is None:
+        return jsonify({'error': 'No architecture files found'}), 404
+    response = Response(snapshot.body, content_type='application/json')
+    response.set_etag(snapshot.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    if topology_service.stale():
+        response.headers['Warning'] = '110 - "Architecture file removed, serving the last loaded topology"'
+    return response.make_conditional(request)
+
+def on_topology_change(snapshot):
+    """New architecture file: reroute the scheduler and create tables for new stations"""
+    dispatch_scheduler.set_topology(snapshot.topology)
+    db = db_connections.thread_connection()
+    with db:
+        ensure_component_tables(db, snapshot.data)
+
+topology_service.on_change.append(on_topology_change)
+
+
+@app.route('/api/availability')
+def get_availability():
+    """Full availability snapshot at its version; the 'availability' deltas continue from it"""
+    return jsonify(availability.snapshot())
+
+@app.route('/api/station_view/<station_id>')
+def get_station_view(station_id):
+    """A station's view at its version; its 'station_view' patches continue from it"""
+    return jsonify(station_views.snapshot(station_id))
 
 @app.route('/api/live_tracking')
 def get_live_tracking():
+    """Kept for older pages; the same data is in /api/availability"""
+    snapshot = availability.snapshot()
     try:
-        db = get_db()
-        # Get the most recent entry from history table
-        latest_entry = db.execute(
-            'SELECT * FROM history ORDER BY timestamp DESC LIMIT 1'
-        ).fetchone()
-       
-        if (latest_entry):
-            return jsonify({
-                'system_status': app.config['SYSTEM_STATUS'],
-                'sender': latest_entry['sender'],
-                'receiver': latest_entry['receiver'],
-                'task_id': latest_entry['task_id']
-            })
-        else:
-            return jsonify({
-                'system_status': app.config['SYSTEM_STATUS'],
-                'sender': None,
-                'receiver': None,
-                'task_id': None
-            })
+        return jsonify(dict(snapshot['last_dispatch'], system_status=app.config['SYSTEM_STATUS']))
     except Exception as e:
         logger.error(f"Error fetching live tracking data: {e}")
         return jsonify({
@@ -890,34 +1281,54 @@ def get_live_tracking():
             'task_id': None
         })
 
+def history_filters():
+    """
+    HistoryQuery filters from ?station=&sender=&receiver=&priority=&status=&since=&until=
+    (status may repeat or be comma separated; since/until are dates or date times).
+    Raises ValueError for a malformed date.
+    """
+    filters = {key: request.args[key] for key in ('station', 'sender', 'receiver', 'priority')
+               if request.args.get(key)}
+    statuses = [status for value in request.args.getlist('status') for status in value.split(',') if status]
+    if statuses:
+        filters['status'] = statuses
+    if request.args.get('since'):
+        filters['since'] = parse_timestamp(request.args['since'])
+    if request.args.get('until'):
+        filters['until'] = parse_timestamp(request.args['until'], end=True)
+    return filters
+
+@app.route('/api/history')
+def get_history_page():
+    """
+    One page of history, newest first (?order=asc for oldest first). Pass the
+    returned next_cursor as ?cursor= for the following page; null means last page.
+    """
+    try:
+        logs, next_cursor = history_query.page(limit=request.args.get('limit', default=100, type=int),
+                                               cursor=request.args.get('cursor'),
+                                               order=request.args.get('order', 'desc'),
+                                               **history_filters())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'logs': logs, 'next_cursor': next_cursor})
+
 @app.route('/get_logs')
 def get_logs():
+    """Latest page of history as a plain list; /api/history pages further back"""
     try:
-        db = get_db()
-        rows = db.execute(
-            'SELECT * FROM history ORDER BY timestamp DESC'
-        ).fetchall()
-        
-        # Convert to list of dictionaries
-        result = []
-        for row in rows:
-            result.append({
-                'task_id': row['task_id'],
-                'from': row['sender'],
-                'to': row['receiver'],
-                'priority': row['priority'],
-                'date': datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%y'),
-                'time': datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S').strftime('%H:%M')
-            })
-        
-        return jsonify(result)
+        logs, _ = history_query.page(limit=request.args.get('limit', default=100, type=int),
+                                     **history_filters())
+        return jsonify(logs)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error fetching logs: {e}")
         return jsonify({'error': 'Failed to retrieve logs'}), 500
 
 def drop_all_tables():
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = get_db()
         cur = conn.cursor()
         
         # Retrieve the list of all user-defined tables in the database
@@ -934,7 +1345,7 @@ def drop_all_tables():
             cur.execute(f"DROP TABLE IF EXISTS '{table_name}'")
         
         conn.commit()
-        conn.close()
+        sensor_history.reset()
         
         logger.info("All user-defined tables dropped successfully")
     except Exception as e:
@@ -949,42 +1360,17 @@ def clear_history():
         
         # Clear all history records
         db.execute("DELETE FROM history")
+        db.execute("DELETE FROM dispatch_profile")
         db.commit()
         
         # Re-initialize component tables based on JSON
-        directory = os.path.dirname(__file__)
-        json_files = glob.glob(os.path.join(directory, "network_architecture*.json"))
-
-        if not json_files:
+        snapshot = topology_service.current()
+        if snapshot is None:
             logger.warning("No network architecture files found")
             return jsonify({'error': 'No architecture files found'}), 404
 
-        latest_file = max(json_files, key=os.path.getmtime)
-        with open(latest_file, 'r') as json_file:
-            data = json.load(json_file)
-
-        components = data.get('components', [])
-
-        for component in components:
-            comp_type = component.get('type')
-            comp_id = component.get('id')
-
-            if comp_type in ['passthrough-station', 'bottom-loading-station'] and comp_id:
-                table_name = f"component_{comp_id}"
-                db.execute(f'''
-                    CREATE TABLE IF NOT EXISTS "{table_name}" (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        positional_sensor_1 BOOLEAN NOT NULL,
-                        positional_sensor_2 BOOLEAN NOT NULL,
-                        positional_sensor_3 BOOLEAN NOT NULL,
-                        positional_sensor_4 BOOLEAN NOT NULL,
-                        positional_sensor_5 BOOLEAN NOT NULL,
-                        positional_sensor_6 BOOLEAN NOT NULL,
-                        positional_sensor_7 BOOLEAN NOT NULL,
-                        positional_sensor_8 BOOLEAN NOT NULL
-                    )
-                ''')
-
+        components = snapshot.data.get('components', [])
+        ensure_component_tables(db, snapshot.data)
         db.commit()
 
         return jsonify({
@@ -998,80 +1384,46 @@ def clear_history():
         return jsonify({'status': 'error', 'message': f'Failed to clear history: {str(e)}'}), 500
 
 
-# 30-day clear history endpoint
-@app.route('/api/clear_history_30', methods=['DELETE'])
-def clear_history_30_days():
-    """Clear history data older than 30 days"""
+def clear_history_older_than(days):
+    """Hand the delete to the retention worker; progress is at /api/retention/<job id>"""
     try:
-        cutoff_date = datetime.now() - timedelta(days=30)
-        cutoff_date_str = cutoff_date.strftime('%Y-%m-%d %H:%M:%S')
-
-        db = get_db()
-        cursor = db.execute(
-            'DELETE FROM history WHERE timestamp < ?',
-            (cutoff_date_str,)
-        )
-        deleted_count = cursor.rowcount
-        db.commit()
-
-        return jsonify({
-            'status': 'success',
-            'message': f'History older than 30 days cleared successfully. {deleted_count} records deleted.',
-            'records_deleted': deleted_count,
-            'cutoff_date': cutoff_date.isoformat()
-        }), 200
-
+        job = retention.submit('history', days=days)
     except Exception as e:
-        logger.error(f"Error clearing 30-day history: {e}")
+        logger.error(f"Error clearing {days}-day history: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
+    return jsonify({
+        'status': 'success',
+        'message': f'Clearing history older than {days} days in the background.',
+        'job': job
+    }), 202
 
+# 30-day clear history endpoint
+@app.route('/api/clear_history_30', methods=['DELETE'])
+def clear_history_30_days():
+    """Clear history data older than 30 days"""
+    return clear_history_older_than(30)
 
 # 60-day clear history endpoint
 @app.route('/api/clear_history_60', methods=['DELETE'])
 def clear_history_60_days():
     """Clear history data older than 60 days"""
-    try:
-        cutoff_date = datetime.now() - timedelta(days=60)
-        cutoff_date_str = cutoff_date.strftime('%Y-%m-%d %H:%M:%S')
-
-        db = get_db()
-        cursor = db.execute(
-            'DELETE FROM history WHERE timestamp < ?',
-            (cutoff_date_str,)
-        )
-        deleted_count = cursor.rowcount
-        db.commit()
+    return clear_history_older_than(60)
 
-        return jsonify({
-            'status': 'success',
-            'message': f'History older than 60 days cleared successfully. {deleted_count} records deleted.',
-            'records_deleted': deleted_count,
-            'cutoff_date': cutoff_date.isoformat()
-        }), 200
+@app.route('/api/retention')
+def get_retention_jobs():
+    return jsonify({'days': retention.days, 'archive_dir': retention.archive_dir, 'jobs': retention.jobs()})
 
-    except Exception as e:
-        logger.error(f"Error clearing 60-day history: {e}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+@app.route('/api/retention/<int:job_id>')
+def get_retention_job(job_id):
+    job = retention.job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown retention job'}), 404
+    return jsonify(job)
 
 @app.route('/api/get_dispatch_history')
 def get_dispatch_history():
-    db = get_db()
-    rows = db.execute(
-        'SELECT * FROM history ORDER BY timestamp DESC LIMIT 100'
-    ).fetchall()
-
-    result = []
-    for row in rows:
-        result.append({
-            'task_id': row['task_id'],
-            'from': row['sender'],
-            'to': row['receiver'],
-            'priority': row['priority'],
-            'date': datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%y'),
-            'time': datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S').strftime('%H:%M')
-        })
-    
-    return jsonify(result)
+    logs, _ = history_query.page(limit=100)
+    return jsonify(logs)
 
 @app.route('/api/check_dispatch_allowed')
 def check_dispatch_allowed():
@@ -1136,73 +1488,61 @@ def get_current_station_by_id(station_id):
 
 @app.route('/api/download_history', methods=['GET'])
 def download_history():
-    db = get_db()
-    rows = db.execute(
-        'SELECT * FROM history ORDER BY timestamp DESC'
-    ).fetchall()
-
-    result = []
-    for row in rows:
-        try:
-            # Parse the timestamp safely
-            date_str = ''
-            time_str = ''
-            if row['timestamp']:
-                try:
-                    date_obj = datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S')
-                    date_str = date_obj.strftime('%d/%m/%y')
-                    time_str = date_obj.strftime('%H:%M')
-                except ValueError:
-                    # If timestamp is in a different format, try another common format
-                    try:
-                        date_obj = datetime.strptime(row['timestamp'], '%Y-%m-%dT%H:%M:%S')
-                        date_str = date_obj.strftime('%d/%m/%y')
-                        time_str = date_obj.strftime('%H:%M')
-                    except ValueError:
-                        # If still can't parse, use raw value
-                        date_str = str(row['timestamp']).split(' ')[0] if ' ' in str(row['timestamp']) else str(row['timestamp'])
-                        time_str = str(row['timestamp']).split(' ')[1] if ' ' in str(row['timestamp']) else ''
-            
-            result.append({
-                'task_id': row['task_id'],
-                'from': row['sender'],
-                'to': row['receiver'],
-                'priority': row['priority'],
-                'date': date_str,
-                'time': time_str
-            })
-        except Exception as e:
-            # Log the error but continue processing other rows
-            logger.error(f"Error processing row {row['task_id']}: {str(e)}")
-            # Add the row with error indication
-            result.append({
-                'task_id': row['task_id'],
-                'from': row['sender'],
-                'to': row['receiver'],
-                'priority': row['priority'],
-                'date': 'error',
-                'time': 'error'
-            })
-    
-    return jsonify(result)
+    """
+    Every matching history row (same filters as /api/history), streamed as it
+    is read a page at a time: ?format=json (one array, the default), ndjson or
+    csv, and ?gzip=1 for a .gz download
+    """
+    fmt = request.args.get('format', 'json')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format {fmt!r}, expected one of {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        filters = history_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    content_type, extension = EXPORT_FORMATS[fmt]
+    filename = f"teller_loop_history_{datetime.now():%Y-%m-%d}.{extension}"
+    chunks = encode_rows(history_query.rows(**filters), fmt)
+    if request.args.get('gzip', '').lower() in ('1', 'true', 'yes'):
+        chunks = gzip_chunks(chunks)
+        content_type = 'application/gzip'
+        filename += '.gz'
+    # No Content-Length: the server sends it chunked while the rows are still being read
+    return Response(stream_with_context(chunks), content_type=content_type,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
 @socketio.on('request_empty_pod')
 def handle_empty_pod_request(data):
     requester_station = data.get('requesterStation', 'Unknown')
 
+    # Dashboards still show the earlier request; a repeat is not broadcast again. Checked and
+    # recorded under one lock, so identical requests arriving together are broadcast once
+    with empty_pod_lock:
+        if empty_pod_admission.duplicate(requester_station) is not None:
+            logger.info(f"Duplicate empty pod request from {requester_station} dropped")
+            return
+        reason = empty_pod_admission.admit(requester_station)
+        if reason is None:
+            empty_pod_admission.record(requester_station, data)
+    if reason is not None:
+        logger.warning(f"Empty pod request from {requester_station} refused: {reason}")
+        emit('empty_pod_request_failed', {'code': reason, 'reason': REASONS[reason]}, room=request.sid)
+        return
+
     # MQTT publish
     request_message = json.dumps(data)
     mqtt.publish(f"{mqtt_topic_base}EMPTY_POD_REQUEST/{requester_station}", request_message)
 
-    # Broadcast to all connected clients (except sender)
-    emit('empty_pod_request', data, broadcast=True, include_self=False)
+    # To the dashboards (except the sender's)
+    fanout.emit('empty_pod_request', data, topics=('dispatch',), skip_sid=request.sid)
 
     logger.info(f"Empty pod request from {requester_station}")
 
 
 @socketio.on('empty_pod_request_accepted')
 def handle_empty_pod_request_accepted(data):
-    emit('empty_pod_request_accepted', data, broadcast=True)
+    fanout.emit('empty_pod_request_accepted', data, topics=('dispatch',))
     acceptance_message = json.dumps(data)
     mqtt.publish(f"{mqtt_topic_base}EMPTY_POD_ACCEPTED/{data.get('requesterStation', 'Unknown')}", acceptance_message)
     logger.info(f"Empty pod request accepted: {data}")
@@ -1217,26 +1557,14 @@ def handle_empty_pod_request_accepted(data):
     
 def cleanup_old_history():
     """
-    Deletes history entries older than 90 days
+    Queues the removal of rows past RETENTION_DAYS for every table; the
+    retention worker logs what it deleted
     """
     try:
-        db = get_db()
-        cutoff_date = datetime.now() - timedelta(days=30)
-        cutoff_date_str = cutoff_date.strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Delete old entries
-        cursor = db.execute(
-            'DELETE FROM history WHERE timestamp < ?',
-            (cutoff_date_str,)
-        )
-        deleted_count = cursor.rowcount
-        db.commit()
-        
-        logger.info(f"Cleaned up {deleted_count} history entries older than 90 days")
-        return deleted_count
+        return retention.submit_all()
     except Exception as e:
-        logger.error(f"Error cleaning up old history: {e}")
-        return 0
+        logger.error(f"Error queueing history cleanup: {e}")
+        return []
 
 def run_scheduled_tasks():
     """
@@ -1246,16 +1574,42 @@ def run_scheduled_tasks():
         schedule.run_pending()
         time.sleep(60)  # Check every minute
 
-# Schedule the cleanup task to run daily at midnight
+# Queue the retention jobs daily at midnight; the retention worker does the deleting
 schedule.every().day.at("00:00").do(cleanup_old_history)
+# Roll up finished hours of sensor events and drop expired day partitions
+schedule.every().hour.do(sensor_history.maintain)
 
 # Start the scheduler in a separate thread
 scheduler_thread = threading.Thread(target=run_scheduled_tasks, daemon=True)
 scheduler_thread.start()
 
+sensor_writer.start()
+dispatch_watchdog.start()
+retention.start()
+topology_service.start()
+availability.start()
+if ASYNC_MODE != 'threading':
+    mqtt_inbox.start()
+
 
 if __name__ == '__main__':
     init_db()
+    load_station_state()
+    load_last_dispatch()
+    recover_dispatches()
     # Run initial cleanup
     cleanup_old_history()
-    socketio.run(app, host='0.0.0.0', port=80, debug=True)
+    try:
+        # threading is the development server; BROKER_ASYNC_MODE=eventlet for production.
+        # No reloader: its watcher process would import this module and run the
+        # recovery above as well, replaying the recovered dispatches twice.
+        socketio.run(app, host='0.0.0.0', port=80, debug=ASYNC_MODE == 'threading', use_reloader=False,
+                     **server_options())
+    finally:
+        mqtt_inbox.stop()
+        availability.stop()
+        dispatch_watchdog.stop()
+        retention.stop()
+        topology_service.stop()
+        sensor_writer.stop()
+        db_connections.close_all()
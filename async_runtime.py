@@ -0,0 +1,133 @@
+import os
+import queue
+import sqlite3
+import logging
+
+logger = logging.getLogger('Broker')
+
+# 'threading' is the development server (an OS thread per connected client);
+# 'eventlet' serves every client from green threads on one hub
+ASYNC_MODES = ('threading', 'eventlet')
+DEFAULT_ASYNC_MODE = 'threading'
+ASYNC_MODE_VARIABLE = 'BROKER_ASYNC_MODE'
+
+# OS threads behind offload(). A SQLite call waiting for the write lock holds
+# one, so handlers may only borrow so many connections at once (db_limit())
+# that the connection holding the lock always finds a free thread to commit
+# on; the rest are left for the background workers' own connections.
+EXECUTOR_THREADS = 20
+BACKGROUND_CONNECTIONS = 8
+# Open HTTP connections the eventlet server accepts (eventlet's default is
+# 1024); a websocket client holds one, a long-polling client two
+MAX_CONNECTIONS = 2048
+
+_STOP = object()
+_mode = None
+
+
+def configure(mode=None):
+    """
+    Select the server runtime (`mode`, else $BROKER_ASYNC_MODE, else
+    threading). Call it before importing anything else that uses sockets or
+    threads: eventlet monkey-patches the standard library, which turns
+    paho's network thread, the scheduler and the background workers into
+    green threads on the Socket.IO hub.
+    """
+    global _mode
+    if _mode is not None:
+        return _mode
+    mode = mode or os.environ.get(ASYNC_MODE_VARIABLE) or DEFAULT_ASYNC_MODE
+    if mode not in ASYNC_MODES:
+        raise ValueError(f"Unknown async mode {mode!r}, expected one of {', '.join(ASYNC_MODES)}")
+    if mode == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+        from eventlet import tpool
+        tpool.set_num_threads(EXECUTOR_THREADS)
+    _mode = mode
+    return mode
+
+
+def async_mode():
+    return _mode or DEFAULT_ASYNC_MODE
+
+
+def db_limit():
+    """Cap on the pooled connections handlers hold at once, None when unlimited"""
+    if _mode == 'eventlet':
+        return EXECUTOR_THREADS - BACKGROUND_CONNECTIONS
+    return None
+
+
+def server_options():
+    """Extra socketio.run() arguments for the selected runtime"""
+    if _mode == 'eventlet':
+        return {'max_size': MAX_CONNECTIONS}
+    return {}
+
+
+def offload(func, *args, **kwargs):
+    """Run blocking work on the executor's OS threads in eventlet mode, inline otherwise"""
+    if _mode == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+
+def offload_connection(conn):
+    """
+    `conn` with its calls, and those of the cursors it returns, run through
+    offload() in eventlet mode; a SQLite statement then parks only the
+    calling green thread instead of the whole hub. Attributes must be set
+    before wrapping.
+    """
+    if _mode == 'eventlet':
+        from eventlet import tpool
+        return tpool.Proxy(conn, autowrap=(sqlite3.Cursor,))
+    return conn
+
+
+class MessageBridge:
+    """
+    Moves MQTT callbacks off paho's network loop onto one worker started
+    with `spawn` (socketio.start_background_task, so a green thread on the
+    hub in eventlet mode). paho keeps reading and answering keepalives
+    while a message waits on dispatch_lock or the database, and messages
+    are still handled one at a time in arrival order.
+    """
+
+    def __init__(self, handler, spawn):
+        self.handler = handler
+        self._spawn = spawn
+        self._queue = queue.Queue()
+        self._worker = None
+        self.stats = {'received': 0, 'handled': 0, 'errors': 0, 'max_depth': 0}
+
+    def start(self):
+        if self._worker is None:
+            self._worker = self._spawn(self._run)
+
+    def stop(self):
+        if self._worker is not None:
+            self._queue.put(_STOP)
+            self._worker = None
+
+    def submit(self, *args):
+        self._queue.put(args)
+        self.stats['received'] += 1
+        self.stats['max_depth'] = max(self.stats['max_depth'], self._queue.qsize())
+
+    def _run(self):
+        while True:
+            args = self._queue.get()
+            if args is _STOP:
+                return
+            try:
+                self.handler(*args)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"MQTT message handler failed: {e}")
+            self.stats['handled'] += 1
+
+    def metrics(self):
+        return dict(self.stats, depth=self._queue.qsize())
@@ -0,0 +1,97 @@
+import logging
+import threading
+
+logger = logging.getLogger('Broker')
+
+# The collector is re-run this often even without a nudge, which catches
+# pods going 'unknown' when a station stops reporting
+CHECK_INTERVAL = 1.0
+
+
+def diff_state(old, new):
+    """
+    Top-level keys of `new` that differ from `old`. Dict values are diffed
+    one level down, so one station's pod changing sends only that station;
+    a key that disappeared comes back as None.
+    """
+    changes = {}
+    for key in old.keys() | new.keys():
+        before, after = old.get(key), new.get(key)
+        if before == after:
+            continue
+        if isinstance(before, dict) and isinstance(after, dict):
+            changes[key] = {name: after.get(name) for name in before.keys() | after.keys()
+                            if before.get(name) != after.get(name)}
+        else:
+            changes[key] = after
+    return changes
+
+
+class AvailabilityTracker:
+    """
+    Whether a dispatch can start, kept by the broker instead of asked for
+    by every kiosk: system busy, the current and last dispatch, queue depth
+    and each station's pod state.
+
+    `collect` returns that state from memory (never the database).
+    refresh() re-collects it and, when anything changed, bumps `version`
+    and hands `publish` a delta, {'version': n, 'changes': {...}}, applied
+    on top of version n - 1. Callers refresh() right after they change
+    something; a background thread also does every `check_interval`.
+    snapshot() is the full state at its version, for a client's first
+    load and for one that missed a delta.
+    """
+
+    def __init__(self, collect, publish, check_interval=CHECK_INTERVAL):
+        self.collect = collect
+        self.publish = publish
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._state = {}
+        self.version = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'refreshes': 0, 'deltas': 0, 'snapshots': 0, 'errors': 0}
+
+    def refresh(self):
+        """Re-collect; returns the delta published, or None when nothing changed"""
+        with self._lock:
+            self.stats['refreshes'] += 1
+            state = self.collect()
+            changes = diff_state(self._state, state)
+            if not changes:
+                return None
+            self._state = state
+            self.version += 1
+            delta = {'version': self.version, 'changes': changes}
+            self.stats['deltas'] += 1
+            # Under the lock, so deltas go out in version order
+            self.publish(delta)
+        return delta
+
+    def snapshot(self):
+        self.refresh()
+        with self._lock:
+            self.stats['snapshots'] += 1
+            return dict(self._state, version=self.version)
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Availability refresh failed: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='availability', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def metrics(self):
+        return dict(self.stats, version=self.version)
@@ -0,0 +1,98 @@
+"""
+Admission control under a flood: what reaches the dispatch queue without
+and with the AdmissionController.
+
+Simulated on a virtual clock for `seconds`: a stuck button repeating one
+request STUCK_RATE times a second, a misbehaving kiosk sending requests to
+changing destinations BUGGY_RATE times a second, and the other stations
+each asking for a dispatch every NORMAL_INTERVAL seconds. A queued request
+stays pending for DISPATCH_SECONDS (one dispatch at a time).
+
+Reports the requests admitted per source, the deepest the queue got, the
+rejections by reason and the cost of one decision.
+
+    python benchmarks/bench_admission.py [seconds] [stations]
+"""
+import os
+import sys
+import time
+from collections import Counter, deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AdmissionController  # noqa: E402
+
+STUCK_RATE = 50
+BUGGY_RATE = 20
+NORMAL_INTERVAL = 60.0
+DISPATCH_SECONDS = 30.0
+STEP = 0.01
+
+
+def requests(seconds, stations):
+    """(time, source, from, to, priority) in time order"""
+    sent = []
+    for i in range(int(seconds * STUCK_RATE)):
+        sent.append((i / STUCK_RATE, 'stuck', 1, 2, 'high'))
+    for i in range(int(seconds * BUGGY_RATE)):
+        sent.append((i / BUGGY_RATE, 'buggy', 2, 3 + i % (stations - 2), 'normal'))
+    for station in range(3, stations + 1):
+        at = station % NORMAL_INTERVAL
+        while at < seconds:
+            sent.append((at, 'normal', station, 1, 'normal'))
+            at += NORMAL_INTERVAL
+    return sorted(sent, key=lambda request: request[0])
+
+
+def simulate(label, sent, limited):
+    now = [0.0]
+    controller = AdmissionController(clock=lambda: now[0]) if limited else None
+    queue = deque()   # queue ids, dispatched in order
+    pending = {}
+    admitted = Counter()
+    deepest = 0
+    next_start = DISPATCH_SECONDS
+    for queue_id, (at, source, from_id, to_id, priority) in enumerate(sent):
+        now[0] = at
+        while queue and at >= next_start:
+            pending.pop(queue.popleft(), None)
+            next_start += DISPATCH_SECONDS
+        if controller is not None:
+            key = (from_id, to_id, priority)
+            if controller.duplicate(key, pending=lambda earlier: earlier in pending) is not None:
+                continue
+            if controller.admit(from_id, depth=len(queue)) is not None:
+                continue
+            controller.record(key, queue_id)
+        queue.append(queue_id)
+        pending[queue_id] = source
+        admitted[source] += 1
+        deepest = max(deepest, len(queue))
+    print(f"{label:10s} admitted {dict(admitted)}  deepest queue {deepest}")
+    if controller is not None:
+        metrics = controller.metrics()
+        print(f"{'':10s} duplicates collapsed {metrics['duplicates']}, rejected {metrics['rejections']}")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60
+    stations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    sent = requests(seconds, stations)
+    print(f"{len(sent)} requests over {seconds:.0f}s from {stations} stations "
+          f"(stuck button {STUCK_RATE}/s, misbehaving kiosk {BUGGY_RATE}/s)")
+    simulate('no limits', sent, limited=False)
+    simulate('admission', sent, limited=True)
+
+    controller = AdmissionController(station_rate=1e9, station_burst=1e9, global_rate=1e9, global_burst=1e9)
+    count = 100000
+    start = time.perf_counter()
+    for i in range(count):
+        key = (i % 50, 1, 'normal')
+        if controller.duplicate(key) is None and controller.admit(i % 50) is None:
+            controller.record(key, i)
+    elapsed = time.perf_counter() - start
+    print(f"decision cost {elapsed / count * 1e6:.2f} us (duplicate + admit + record)")
+
+
+if __name__ == '__main__':
+    main()
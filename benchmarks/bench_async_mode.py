@@ -0,0 +1,268 @@
+"""
+Socket.IO clients per broker process, threading vs eventlet.
+
+Starts a small Flask-SocketIO server in a subprocess for each mode, set up
+the way the broker sets itself up (async_runtime.configure, ConnectionPool
+wrapped with offload_connection), and connects simulated kiosks to it over
+Engine.IO long-polling, the transport both modes serve without extra
+packages. Every kiosk then sends a `probe` each PROBE_INTERVAL seconds; the
+handler reads the recent history, as the kiosks' status polls do, and
+answers with an emit. Meanwhile the server broadcasts a `tick` every
+TICK_INTERVAL seconds.
+
+Reports how many clients connected, the server's OS threads and RSS, the
+probe round trip (p50/p99) and the tick delivery latency (p99).
+
+    python benchmarks/bench_async_mode.py [clients] [seconds]
+"""
+import os
+import sys
+import json
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+PROBE_INTERVAL = 2.0
+TICK_INTERVAL = 1.0
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS history
+            (task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+             sender TEXT NOT NULL,
+             receiver TEXT NOT NULL,
+             priority TEXT NOT NULL,
+             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+             status TEXT DEFAULT 'pending')'''
+FILL = "INSERT INTO history (sender, receiver, priority, status) VALUES ('1', '2', 'normal', 'completed')"
+RECENT = 'SELECT * FROM history ORDER BY task_id DESC LIMIT 200'
+
+
+def proc_status(field):
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+def serve(mode, port, database):
+    """Server side, in its own process: the runtime has to be chosen before Flask is imported"""
+    import async_runtime
+    async_runtime.configure(mode)
+    import logging
+    from flask import Flask, jsonify, request
+    from flask_socketio import SocketIO, emit
+    from db_pool import ConnectionPool
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode=mode)
+    pool = ConnectionPool(database, wrap=async_runtime.offload_connection, max_borrowed=async_runtime.db_limit())
+    pool.init_app(app)
+    with app.app_context():
+        db = pool.get_db()
+        db.execute(SCHEMA)
+        db.executemany(FILL, [()] * 5000)
+        db.commit()
+    clients = set()
+
+    @socketio.on('connect')
+    def connect():
+        clients.add(request.sid)
+
+    @socketio.on('disconnect')
+    def disconnect():
+        clients.discard(request.sid)
+
+    @socketio.on('probe')
+    def probe(data):
+        pool.get_db().execute(RECENT).fetchall()
+        emit('probe_ack', data)
+
+    @app.route('/stats')
+    def stats():
+        return jsonify({'clients': len(clients), 'threads': proc_status('Threads'),
+                        'rss_kb': proc_status('VmRSS')})
+
+    def ticker():
+        while True:
+            socketio.sleep(TICK_INTERVAL)
+            socketio.emit('tick', {'t': time.time()})
+
+    socketio.start_background_task(ticker)
+    socketio.run(app, host='127.0.0.1', port=port, log_output=False, **async_runtime.server_options())
+
+
+class PollingClient:
+    """Minimal Socket.IO client over Engine.IO v4 long-polling"""
+
+    def __init__(self, port, on_event):
+        import http.client
+        import threading
+        self._get = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        self._post = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        self._post_lock = threading.Lock()   # pongs and emits share the POST connection
+        self.on_event = on_event
+        self.sid = None
+        self.connected = False
+        self.closed = False
+
+    def _request(self, conn, method, body=None):
+        path = f'/socket.io/?EIO=4&transport=polling&t={time.time()}'
+        if self.sid:
+            path += f'&sid={self.sid}'
+        conn.request(method, path, body=body, headers={'Content-Type': 'text/plain;charset=UTF-8'})
+        response = conn.getresponse()
+        data = response.read().decode()
+        if response.status != 200:
+            raise ConnectionError(f"{method} {response.status}: {data}")
+        return data
+
+    def _send(self, packet):
+        with self._post_lock:
+            self._request(self._post, 'POST', packet)
+
+    def connect(self):
+        handshake = self._request(self._get, 'GET')
+        self.sid = json.loads(handshake[1:])['sid']
+        self._send('40')
+        while not self.connected:
+            self._receive()
+
+    def _receive(self):
+        for packet in self._request(self._get, 'GET').split('\x1e'):
+            if packet == '2':
+                self._send('3')
+            elif packet.startswith('40'):
+                self.connected = True
+            elif packet.startswith('42'):
+                event, data = json.loads(packet[2:])
+                self.on_event(event, data)
+
+    def run(self):
+        while not self.closed:
+            try:
+                self._receive()
+            except Exception:
+                if not self.closed:
+                    raise
+
+    def emit(self, event, data):
+        self._send('42' + json.dumps([event, data]))
+
+    def close(self):
+        self.closed = True
+        try:
+            self._send('41')
+        except Exception:
+            pass
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+def free_port():
+    import socket
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def measure(mode, count, seconds, directory):
+    import subprocess
+    import urllib.request
+    import eventlet
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'server', mode, str(port),
+                               os.path.join(directory, f'{mode}.db')])
+    try:
+        for _ in range(100):
+            if server.poll() is not None:
+                raise RuntimeError(f"{mode} server exited with {server.returncode}")
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/stats', timeout=1).read()
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError(f"{mode} server did not start")
+
+        rtts, ticks = [], []
+
+        def on_event(event, data):
+            now = time.time()
+            if event == 'probe_ack':
+                rtts.append((now - data['t']) * 1000)
+            elif event == 'tick' and measuring[0]:
+                ticks.append((now - data['t']) * 1000)
+        measuring = [False]
+
+        clients = []
+
+        def connect():
+            client = PollingClient(port, on_event)
+            try:
+                client.connect()
+            except Exception:
+                return
+            clients.append(client)
+            eventlet.spawn(client.run)
+
+        start = time.time()
+        pool = eventlet.GreenPool(50)
+        for _ in range(count):
+            pool.spawn(connect)
+        pool.waitall()
+        connected_in = time.time() - start
+        stats = json.loads(urllib.request.urlopen(f'http://127.0.0.1:{port}/stats', timeout=10).read())
+
+        def prober(client, offset):
+            eventlet.sleep(offset)
+            deadline = time.time() + seconds
+            while time.time() < deadline and not client.closed:
+                try:
+                    client.emit('probe', {'t': time.time()})
+                except Exception:
+                    return
+                eventlet.sleep(PROBE_INTERVAL)
+        measuring[0] = True
+        probers = [eventlet.spawn(prober, client, i * PROBE_INTERVAL / max(1, len(clients)))
+                   for i, client in enumerate(clients)]
+        for prober_thread in probers:
+            prober_thread.wait()
+        eventlet.sleep(1)
+        measuring[0] = False
+        for client in clients:
+            client.close()
+
+        print(f"{mode:10s} {len(clients):4d}/{count} connected in {connected_in:5.1f}s  "
+              f"server threads {stats['threads']:4d}  RSS {stats['rss_kb'] / 1024:6.1f} MB "
+              f"({stats['rss_kb'] / max(1, len(clients)):5.0f} kB/client)  "
+              f"probe p50 {percentile(rtts, 0.5):7.1f} ms p99 {percentile(rtts, 0.99):7.1f} ms  "
+              f"tick p99 {percentile(ticks, 0.99):7.1f} ms  ({len(rtts)} probes, {len(ticks)} ticks)")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'server':
+        serve(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+        return
+    import eventlet
+    eventlet.monkey_patch()
+    import tempfile
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"{count} polling clients, a probe per client every {PROBE_INTERVAL:.0f}s for {seconds:.0f}s")
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ('threading', 'eventlet'):
+            measure(mode, count, seconds, directory)
+
+
+if __name__ == '__main__':
+    main()
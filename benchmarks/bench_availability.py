@@ -0,0 +1,93 @@
+"""
+Dispatch availability: what the kiosks' REST polling cost vs the pushed
+AvailabilityTracker.
+
+Per call: the old /api/live_tracking query on a filled history table vs a
+snapshot(), and a refresh() that finds nothing changed (what the background
+check costs every CHECK_INTERVAL). Then a simulated hour for a fleet of
+kiosks that asked the three endpoints every POLL_INTERVAL seconds, against
+the deltas the same dispatches and pod changes publish.
+
+    python benchmarks/bench_availability.py [kiosks] [history rows] [dispatches per hour]
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from availability import AvailabilityTracker, CHECK_INTERVAL  # noqa: E402
+from history_query import HISTORY_INDEXES  # noqa: E402
+
+POLL_INTERVAL = 2.0
+ENDPOINTS = 3   # check_dispatch_allowed, check_pod_available, live_tracking
+CALLS = 20000
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS history
+            (task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+             sender TEXT NOT NULL,
+             receiver TEXT NOT NULL,
+             priority TEXT NOT NULL,
+             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+             status TEXT DEFAULT 'pending')'''
+FILL = "INSERT INTO history (sender, receiver, priority, status) VALUES ('1', '2', 'normal', 'completed')"
+LATEST = 'SELECT * FROM history ORDER BY timestamp DESC LIMIT 1'
+
+
+def per_call(label, func, count=CALLS):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:34s} {elapsed / count * 1e6:8.1f} us/call")
+
+
+def main():
+    kiosks = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    dispatches = int(sys.argv[3]) if len(sys.argv) > 3 else 120
+
+    state = {'busy': False, 'current_dispatch': None, 'queue_depth': {'normal': 0},
+             'last_dispatch': {'sender': '1', 'receiver': '2', 'task_id': rows},
+             'pods': {str(i): 'available' for i in range(1, kiosks + 1)}}
+    published = []
+    tracker = AvailabilityTracker(lambda: dict(state), published.append)
+
+    with tempfile.TemporaryDirectory() as directory:
+        conn = sqlite3.connect(os.path.join(directory, 'bench.db'))
+        conn.execute(SCHEMA)
+        for statement in HISTORY_INDEXES:
+            conn.execute(statement)
+        conn.executemany(FILL, [()] * rows)
+        conn.commit()
+        print(f"{rows} history rows, {kiosks} kiosks")
+        per_call('live_tracking query (indexed)', lambda: conn.execute(LATEST).fetchone())
+        conn.execute('DROP INDEX idx_history_timestamp')
+        per_call('live_tracking query (no index)', lambda: conn.execute(LATEST).fetchone(), count=200)
+        conn.close()
+    per_call('AvailabilityTracker.snapshot()', tracker.snapshot)
+    per_call('refresh(), nothing changed', tracker.refresh)
+
+    # An hour: each dispatch starts and finishes and moves the sender's pod
+    published.clear()
+    for i in range(dispatches):
+        station = str(i % kiosks + 1)
+        state.update(busy=True, current_dispatch={'from': station, 'to': '1', 'task_id': i},
+                     last_dispatch={'sender': station, 'receiver': '1', 'task_id': i})
+        state['pods'] = dict(state['pods'], **{station: 'occupied'})
+        tracker.refresh()
+        state.update(busy=False, current_dispatch=None)
+        state['pods'] = dict(state['pods'], **{station: 'available'})
+        tracker.refresh()
+    polls = int(kiosks * ENDPOINTS * 3600 / POLL_INTERVAL)
+    checks = int(3600 / CHECK_INTERVAL)
+    delta_bytes = sum(len(repr(delta)) for delta in published)
+    print(f"polling: {polls} requests/hour, {polls // ENDPOINTS} history queries")
+    print(f"push:    {len(published)} deltas/hour to {kiosks} kiosks ({len(published) * kiosks} deliveries, "
+          f"~{delta_bytes // max(1, len(published))} bytes each), {checks} in-memory checks, 0 queries")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Command-to-motion latency on a station: a thread per command (the old
+handlers) vs the single SequenceEngine executor.
+
+Each command is a short jog on the simulated stepper; latency is measured
+from the moment the command "arrives" to the first step pulse. A second run
+fires commands in pairs, the way the broker sends one dispatch on several
+topics, and counts how often two moves overlapped on the motor.
+
+    python benchmarks/bench_command_latency.py [commands]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motion_backend import SleepBackend  # noqa: E402
+from motion_sequence import SequenceEngine, Step  # noqa: E402
+from gpio_backend import FakeGPIO  # noqa: E402
+
+JOG = (0.0002,) * 20
+
+
+class Station:
+    def __init__(self):
+        self.motor = SleepBackend(FakeGPIO(), 16, 19, record=True)
+        self.busy = False
+        self.moving = 0
+        self.overlaps = 0
+        self.lock = threading.Lock()
+
+    def jog(self):
+        with self.lock:
+            self.moving += 1
+            self.overlaps += self.moving > 1
+        self.motor.run(JOG)
+        with self.lock:
+            self.moving -= 1
+
+
+def thread_per_command(station, received):
+    # Old handler: check the flag, then start a thread that sets it
+    if station.busy:
+        return
+
+    def run():
+        station.busy = True
+        station.jog()
+        station.busy = False
+    threading.Thread(target=run).start()
+
+
+def measure(label, commands, pairs, make_submit):
+    station = Station()
+    submit, close = make_submit(station)
+    latencies = []
+    for _ in range(commands):
+        station.motor.pulses.clear()
+        received = time.perf_counter()
+        for _ in range(2 if pairs else 1):
+            submit(station, received)
+        while not station.motor.pulses:
+            time.sleep(0.0001)
+        latencies.append((station.motor.pulses[0] - received) * 1000)
+        while station.busy or station.moving:
+            time.sleep(0.001)
+        time.sleep(0.005)
+    close()
+    latencies.sort()
+    print(f"{label:40s} p50 {latencies[len(latencies) // 2]:6.3f} ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:6.3f} ms  overlapping moves {station.overlaps}")
+
+
+def threads(station):
+    return thread_per_command, lambda: None
+
+
+def executor(station):
+    engine = SequenceEngine(on_finish=lambda operation: setattr(station, 'busy', engine.busy()))
+    engine.start()
+    steps = [Step('jog', 'move', lambda ctx: station.jog())]
+
+    def submit(station, received):
+        station.busy = True
+        engine.submit('jog', steps, received_at=received)
+    return submit, engine.stop
+
+
+def main():
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    print(f"{commands} jog commands, latency from command to first step pulse")
+    for pairs in (False, True):
+        suffix = ' (commands in pairs)' if pairs else ''
+        measure('thread per command' + suffix, commands, pairs, threads)
+        measure('single executor' + suffix, commands, pairs, executor)
+
+
+if __name__ == '__main__':
+    main()
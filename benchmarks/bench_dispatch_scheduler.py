@@ -0,0 +1,113 @@
+"""
+Simulated dispatch throughput: segment-reserving scheduler vs the old serial loop.
+
+Builds a synthetic line of blower zones (one side-channel blower feeding a chain
+of passthrough stations per zone), queues a backlog of random dispatches and
+runs both scheduler modes on a simulated clock. Transit time grows with the
+number of tube segments on the route.
+
+    python benchmarks/bench_dispatch_scheduler.py [dispatches] [zones] [stations_per_zone]
+"""
+import os
+import sys
+import heapq
+import random
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dispatch_scheduler import DispatchScheduler, Topology  # noqa: E402
+
+BASE_SECONDS = 8.0          # load + unload at the stations
+SECONDS_PER_SEGMENT = 2.0   # pod travel per tube segment
+LOCAL_TRAFFIC = 0.8         # share of dispatches that stay inside one blower zone
+
+
+def build_topology(zones, per_zone):
+    components = []
+    connections = []
+
+    def link(a, b):
+        connections.append({'start': {'componentId': a}, 'end': {'componentId': b}})
+
+    station = 0
+    previous_zone_tail = None
+    zone_stations = []
+    for zone in range(1, zones + 1):
+        blower = f'side-channel-blower-{zone}'
+        components.append({'id': blower, 'type': 'side-channel-blower'})
+        chain = []
+        for _ in range(per_zone):
+            station += 1
+            comp_id = f'passthrough-station-{station}'
+            components.append({'id': comp_id, 'type': 'passthrough-station'})
+            if chain:
+                link(chain[-1], comp_id)
+            chain.append(comp_id)
+        link(blower, chain[0])
+        if previous_zone_tail:
+            link(previous_zone_tail, chain[0])
+        previous_zone_tail = chain[-1]
+        zone_stations.append(list(range(station - per_zone + 1, station + 1)))
+    return Topology({'components': components, 'connections': connections}), zone_stations
+
+
+def make_requests(count, zone_stations, seed=7):
+    rng = random.Random(seed)
+    all_stations = [s for zone in zone_stations for s in zone]
+    requests = []
+    for _ in range(count):
+        if rng.random() < LOCAL_TRAFFIC:
+            zone = rng.choice(zone_stations)
+            from_id, to_id = rng.sample(zone, 2)
+        else:
+            from_id, to_id = rng.sample(all_stations, 2)
+        requests.append({'from': from_id, 'to': to_id, 'priority': 'low'})
+    return requests
+
+
+def simulate(topology, requests, concurrent):
+    now = [0.0]
+    scheduler = DispatchScheduler(topology, concurrent=concurrent, clock=lambda: now[0])
+    queue = deque(dict(r) for r in requests)
+    running = []   # heap of (finish_time, sequence, dispatch)
+    sequence = 0
+
+    while queue or running:
+        for dispatch in scheduler.select_runnable(list(queue)):
+            queue.remove(dispatch)
+            hops = len(topology.route(dispatch['from'], dispatch['to'])) - 1
+            sequence += 1
+            heapq.heappush(running, (now[0] + BASE_SECONDS + SECONDS_PER_SEGMENT * hops, sequence, dispatch))
+        finish, _, dispatch = heapq.heappop(running)
+        now[0] = finish
+        scheduler.release(dispatch)
+
+    utilisation = scheduler.utilisation()
+    segments = [v for k, v in utilisation.items() if k.startswith('segment:')]
+    return now[0], scheduler.stats['max_concurrent'], segments
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    zones = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    per_zone = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    topology, zone_stations = build_topology(zones, per_zone)
+    requests = make_requests(count, zone_stations)
+
+    print(f"dispatches: {count}, zones: {zones}, stations/zone: {per_zone}")
+    results = {}
+    for label, concurrent in (('serial (dispatch_in_progress)', False), ('segment scheduler', True)):
+        makespan, max_concurrent, segments = simulate(topology, requests, concurrent)
+        results[label] = makespan
+        mean_segment = sum(segments) / len(segments) if segments else 0.0
+        print(f"{label:30s} makespan {makespan / 3600:7.2f} h  "
+              f"{count / makespan * 3600:7.1f} dispatches/h  "
+              f"max concurrent {max_concurrent}  mean segment utilisation {mean_segment:.0%}")
+    serial, pipelined = results.values()
+    print(f"throughput gain: {serial / pipelined:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
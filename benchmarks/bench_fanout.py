@@ -0,0 +1,136 @@
+"""
+Socket.IO fan-out under load: the old broadcasts vs FanOut's room targeting
+and coalescing, for a burst of dispatches with hundreds of clients connected.
+
+Clients are Flask-SocketIO test clients: two screens per station (dispatch
+and maintenance page, both in the station's room), dashboards subscribed to
+the 'dispatch' topic and page-wide sockets subscribed to 'maintenance'. Each
+dispatch sends what execute_dispatch/finish_dispatch send: system status
+twice, a status per route station twice, a dispatch_event and the sender's
+pod availability.
+
+Reports the packets the clients received and how long the burst took.
+
+    python benchmarks/bench_fanout.py [stations] [dashboards] [dispatches]
+"""
+import os
+import sys
+import random
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, request  # noqa: E402
+from flask_socketio import SocketIO, join_room  # noqa: E402
+from fanout import FanOut, COALESCE_WINDOW  # noqa: E402
+
+ROUTE_LENGTH = 3
+
+
+def make_app(stations):
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode='threading')
+    fanout = FanOut(socketio, stations=lambda: range(1, stations + 1))
+
+    @socketio.on('join')
+    def join(data):
+        join_room(str(int(data['station_id'])))
+
+    @socketio.on('subscribe')
+    def subscribe(data):
+        fanout.subscribe(request.sid, data['topics'])
+
+    return app, socketio, fanout
+
+
+def connect(app, socketio, stations, dashboards):
+    clients = []
+    for station in range(1, stations + 1):
+        for _ in range(2):
+            client = socketio.test_client(app)
+            client.emit('join', {'station_id': station})
+            clients.append(client)
+    for i in range(dashboards):
+        client = socketio.test_client(app)
+        client.emit('subscribe', {'topics': ['dispatch']})
+        clients.append(client)
+        client = socketio.test_client(app)
+        client.emit('subscribe', {'topics': ['maintenance']})
+        clients.append(client)
+    return clients
+
+
+def burst(stations, count):
+    rng = random.Random(21)
+    dispatches = []
+    for task_id in range(count):
+        start = rng.randint(1, stations - ROUTE_LENGTH + 1)
+        route = list(range(start, start + ROUTE_LENGTH))
+        if rng.random() < 0.5:
+            route.reverse()
+        dispatches.append((task_id, route))
+    return dispatches
+
+
+def old_dispatch(socketio, task_id, route):
+    status = {'status': True, 'current_dispatch': task_id}
+    socketio.emit('system_status_changed', status)
+    for i in route:
+        socketio.emit('status', {'status': 'busy', 'task_id': task_id}, room=str(i))
+    socketio.emit('dispatch_event', {'from': route[0], 'to': route[-1], 'data': 'sent'})
+    socketio.emit('pod_availability_changed', {'station_id': route[0], 'available': False}, room=str(route[0]))
+    socketio.emit('system_status_changed', {'status': False, 'current_dispatch': None})
+    for i in route:
+        socketio.emit('status', {'status': 'standby'}, room=str(i))
+
+
+def new_dispatch(fanout, task_id, route):
+    status = {'status': True, 'current_dispatch': task_id}
+    fanout.state('system_status_changed', status, all_stations=True, topics=('dispatch',))
+    for i in route:
+        fanout.emit('status', {'status': 'busy', 'task_id': task_id}, stations=[i])
+    fanout.emit('dispatch_event', {'from': route[0], 'to': route[-1], 'data': 'sent'},
+                stations=[route[0], route[-1]], topics=('dispatch',))
+    fanout.state('pod_availability_changed', {'station_id': route[0], 'available': False}, stations=[route[0]])
+    fanout.state('system_status_changed', {'status': False, 'current_dispatch': None},
+                 all_stations=True, topics=('dispatch',))
+    for i in route:
+        fanout.emit('status', {'status': 'standby'}, stations=[i])
+
+
+def received(clients):
+    return sum(len(client.get_received()) for client in clients)
+
+
+def measure(label, clients, send, dispatches):
+    received(clients)
+    start = time.perf_counter()
+    for task_id, route in dispatches:
+        send(task_id, route)
+    elapsed = time.perf_counter() - start
+    time.sleep(COALESCE_WINDOW * 3)   # trailing coalesced states
+    packets = received(clients)
+    print(f"{label:12s} {packets:9d} packets delivered  {packets / len(dispatches):8.1f} per dispatch  "
+          f"{elapsed * 1000:8.1f} ms")
+
+
+def main():
+    stations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    dashboards = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    app, socketio, fanout = make_app(stations)
+    clients = connect(app, socketio, stations, dashboards)
+    dispatches = burst(stations, count)
+    print(f"{len(clients)} clients ({stations} stations x 2, {dashboards} dashboards, "
+          f"{dashboards} page sockets), {count} dispatches")
+    measure('broadcast', clients, lambda task_id, route: old_dispatch(socketio, task_id, route), dispatches)
+    measure('FanOut', clients, lambda task_id, route: new_dispatch(fanout, task_id, route), dispatches)
+    metrics = fanout.metrics()
+    print(f"FanOut: {metrics['emits']} emits, {metrics['deliveries']} deliveries, "
+          f"{metrics['coalesced']} coalesced; by event {metrics['deliveries_by_event']}")
+    for client in clients:
+        client.disconnect()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+History export: the old download_history (every row in a Python list, then
+one jsonify blob) vs the streamed export (HistoryQuery pages encoded in
+chunks as JSON, NDJSON or CSV, optionally gzipped).
+
+Each variant runs in a fresh interpreter against the same synthetic history
+table, so peak RSS is that variant's alone. Reports export time, time to
+the first byte, bytes produced and peak RSS (an interpreter with the project
+modules imported and a full SQLite page cache is the floor, about 40 MB).
+
+    python benchmarks/bench_history_export.py [rows]
+"""
+import os
+import sys
+import json
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool  # noqa: E402
+from history_export import encode_rows, gzip_chunks  # noqa: E402
+from history_query import HistoryQuery  # noqa: E402
+
+HISTORY_SCHEMA = '''CREATE TABLE history
+                    (task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     sender TEXT NOT NULL,
+                     receiver TEXT NOT NULL,
+                     priority TEXT NOT NULL,
+                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                     status TEXT DEFAULT 'pending',
+                     execution_details TEXT
+                     )'''
+HISTORY_INSERT = 'INSERT INTO history (sender, receiver, priority, timestamp, status) VALUES (?, ?, ?, ?, ?)'
+
+VARIANTS = ('list + json', 'stream json', 'stream ndjson', 'stream csv', 'stream csv + gzip')
+
+
+def history_rows(count, seed=18):
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=365)
+    step = 365 * 86400 / count
+    for i in range(count):
+        sender, receiver = rng.sample([str(station) for station in range(1, 9)], 2)
+        yield (sender, receiver, rng.choice(('low', 'normal', 'high')),
+               (start + timedelta(seconds=i * step)).strftime('%Y-%m-%d %H:%M:%S'),
+               rng.choice(('completed',) * 9 + ('failed',)))
+
+
+def old_export(db):
+    """download_history before streaming, minus Flask: build the list, serialise it whole"""
+    result = []
+    for row in db.execute('SELECT * FROM history ORDER BY timestamp DESC').fetchall():
+        date_obj = datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S')
+        result.append({'task_id': row['task_id'], 'from': row['sender'], 'to': row['receiver'],
+                       'priority': row['priority'], 'date': date_obj.strftime('%d/%m/%y'),
+                       'time': date_obj.strftime('%H:%M')})
+    return [json.dumps(result).encode()]
+
+
+def peak_rss_kb():
+    """
+    VmHWM of this process. Not ru_maxrss: on Linux that survives exec, so a
+    child would report the parent's peak.
+    """
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return 0
+
+
+def run_variant(path, variant):
+    """Child process: run one export, print a JSON line of results"""
+    pool = ConnectionPool(path)
+    db = pool.thread_connection()
+    start = time.perf_counter()
+    if variant == 'list + json':
+        chunks = old_export(db)
+    else:
+        fmt = variant.split()[1]
+        chunks = encode_rows(HistoryQuery(pool).rows(), fmt)
+        if variant.endswith('gzip'):
+            chunks = gzip_chunks(chunks)
+    first = None
+    size = 0
+    for chunk in chunks:
+        if first is None:
+            first = time.perf_counter() - start
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'seconds': elapsed, 'first': first, 'bytes': size, 'rss_kb': peak_rss_kb()}))
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--variant':
+        run_variant(sys.argv[2], sys.argv[3])
+        return
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'history.db')
+        pool = ConnectionPool(path)
+        db = pool.thread_connection()
+        db.execute(HISTORY_SCHEMA)
+        with db:
+            db.executemany(HISTORY_INSERT, history_rows(count))
+            HistoryQuery.init_schema(db)
+        pool.close_all()
+
+        print(f"{count} history rows")
+        print(f"{'':20s} {'total':>9s} {'first byte':>11s} {'output':>10s} {'peak RSS':>10s}")
+        for variant in VARIANTS:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--variant', path, variant],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{variant:20s} {result['seconds']:8.2f}s {result['first'] * 1000:9.1f}ms "
+                  f"{result['bytes'] / 1e6:8.1f}MB {result['rss_kb'] / 1024:8.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Dispatch history reads on a synthetic history table: the old /get_logs
+(every row, newest first, no index, two strptime calls per row) vs
+HistoryQuery pages (indexed keyset pagination, date/time formatted by SQLite).
+
+Times the first page, a page deep in the history (reached through its
+cursor), and filtered pages by station, status and date range, each with
+the query plan SQLite picked.
+
+    python benchmarks/bench_history_query.py [rows]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool  # noqa: E402
+from history_query import HistoryQuery, TIMESTAMP_FORMAT  # noqa: E402
+
+HISTORY_SCHEMA = '''CREATE TABLE history
+                    (task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     sender TEXT NOT NULL,
+                     receiver TEXT NOT NULL,
+                     priority TEXT NOT NULL,
+                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                     status TEXT DEFAULT 'pending',
+                     execution_details TEXT
+                     )'''
+HISTORY_INSERT = 'INSERT INTO history (sender, receiver, priority, timestamp, status) VALUES (?, ?, ?, ?, ?)'
+
+STATIONS = [str(station) for station in range(1, 9)]
+STATUSES = ['completed'] * 96 + ['failed'] * 3 + ['interrupted']
+
+
+def history_rows(count, seed=17):
+    """`count` dispatches spread over a year, oldest first"""
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=365)
+    step = 365 * 86400 / count
+    for i in range(count):
+        sender, receiver = rng.sample(STATIONS, 2)
+        timestamp = start + timedelta(seconds=i * step)
+        yield (sender, receiver, rng.choice(('low', 'normal', 'high')),
+               timestamp.strftime(TIMESTAMP_FORMAT), rng.choice(STATUSES))
+
+
+def old_get_logs(db):
+    rows = db.execute('SELECT * FROM history ORDER BY timestamp DESC').fetchall()
+    return [{'task_id': row['task_id'], 'from': row['sender'], 'to': row['receiver'],
+             'priority': row['priority'],
+             'date': datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%y'),
+             'time': datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S').strftime('%H:%M')}
+            for row in rows]
+
+
+def timed(fn, repeat=10):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def plan(db, query, **filters):
+    """Query plan of the page HistoryQuery would run for `filters`"""
+    sql, params = query._select('desc', None, 100, **filters)
+    rows = db.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    return '; '.join(row['detail'] for row in rows)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as directory:
+        pool = ConnectionPool(os.path.join(directory, 'history.db'))
+        db = pool.thread_connection()
+        db.execute(HISTORY_SCHEMA)
+        with db:
+            db.executemany(HISTORY_INSERT, history_rows(count))
+        print(f"{count} history rows over 365 days, {len(STATIONS)} stations")
+
+        old_ms, old = timed(lambda: old_get_logs(db), repeat=1)
+        print(f"{'old /get_logs (all rows)':36s} {old_ms:10.1f} ms  ({len(old)} rows)")
+
+        start = time.perf_counter()
+        with db:
+            HistoryQuery.init_schema(db)
+        print(f"{'create indexes':36s} {(time.perf_counter() - start) * 1000:10.1f} ms")
+
+        query = HistoryQuery(pool)
+        first_ms, (rows, cursor) = timed(lambda: query.page())
+        print(f"{'first page (100)':36s} {first_ms:10.3f} ms")
+
+        for _ in range(count // 2 // 1000):
+            _, cursor = query.page(limit=1000, cursor=cursor)
+        deep_ms, (rows, _) = timed(lambda: query.page(cursor=cursor))
+        print(f"{'page at row ' + str(count // 2):36s} {deep_ms:10.3f} ms  (from {rows[0]['date']})")
+
+        month_ago = (datetime.now() - timedelta(days=30)).strftime(TIMESTAMP_FORMAT)
+        two_months_ago = (datetime.now() - timedelta(days=60)).strftime(TIMESTAMP_FORMAT)
+        cases = (
+            ('station 3', {'station': '3'}),
+            ('sender 3', {'sender': '3'}),
+            ('receiver 3, high priority', {'receiver': '3', 'priority': 'high'}),
+            ('status failed', {'status': 'failed'}),
+            ('status failed or interrupted', {'status': ['failed', 'interrupted']}),
+            ('30 days from 60 days ago', {'since': two_months_ago, 'until': month_ago}),
+        )
+        for label, filters in cases:
+            ms, (rows, _) = timed(lambda: query.page(**filters))
+            print(f"{label:36s} {ms:10.3f} ms  ({len(rows)} rows)  {plan(db, query, **filters)}")
+
+        export_ms, exported = timed(lambda: sum(1 for _ in query.rows(status='failed')), repeat=1)
+        print(f"{'all failed dispatches, paged':36s} {export_ms:10.1f} ms  ({exported} rows)")
+        pool.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Lookups/second for is_pod_available: SQLite SELECT vs the in-memory store.
+
+    python benchmarks/bench_pod_available.py [lookups]
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool  # noqa: E402
+from sensor_writer import SENSOR_UPSERT_SQL, sensor_row  # noqa: E402
+from station_state import StationStateStore  # noqa: E402
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS sensor_data
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             station_id TEXT NOT NULL UNIQUE,
+             S1 BOOLEAN, S2 BOOLEAN, S3 BOOLEAN, S4 BOOLEAN,
+             P1 BOOLEAN, P2 BOOLEAN, P3 BOOLEAN, P4 BOOLEAN,
+             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)'''
+
+STATIONS = [str(i) for i in range(1, 9)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    frame = {'S1': True, 'P1': False}
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'bench.db')
+        conn = sqlite3.connect(database)
+        conn.execute(SCHEMA)
+        conn.executemany(SENSOR_UPSERT_SQL, [sensor_row(s, frame) for s in STATIONS])
+        conn.commit()
+        conn.close()
+
+        pool = ConnectionPool(database)
+        db = pool.thread_connection()
+        start = time.perf_counter()
+        for i in range(count):
+            row = db.execute('SELECT P1 FROM sensor_data WHERE station_id = ?',
+                             (STATIONS[i % len(STATIONS)],)).fetchone()
+            not bool(row[0])
+        sqlite_elapsed = time.perf_counter() - start
+        pool.close_all()
+
+    store = StationStateStore()
+    for station_id in STATIONS:
+        store.update(station_id, frame)
+    start = time.perf_counter()
+    for i in range(count):
+        store.pod_available(STATIONS[i % len(STATIONS)])
+    store_elapsed = time.perf_counter() - start
+
+    print(f"lookups:              {count}")
+    print(f"SQLite (pooled conn): {count / sqlite_elapsed:12.0f} lookups/s")
+    print(f"StationStateStore:    {count / store_elapsed:12.0f} lookups/s")
+    print(f"speedup:              {sqlite_elapsed / store_elapsed:12.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Load test for the priority dispatch queue.
+
+Queues thousands of requests from many stations (one "hot" station sending
+half of them), measures insert / reprioritise / cancel / take throughput, then
+drains the queue one dispatch at a time on a simulated clock and compares
+per-station waiting with the old two-deque FIFO (high first, then normal).
+
+The scaling table times SCALING_OPS reprioritise, cancel and position calls
+against queues of each of SCALING_SIZES entries: with O(log n) operations
+the cost per call stays flat as the queue grows (the journal commit is the
+same in every row).
+
+    python benchmarks/bench_priority_queue.py [requests] [stations]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from collections import defaultdict, deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool  # noqa: E402
+from dispatch_queue import DispatchQueue  # noqa: E402
+
+SERVICE_SECONDS = 30.0
+ARRIVAL_SPREAD = 600.0   # all requests arrive within the first ten minutes
+SCALING_SIZES = (1000, 4000, 16000)
+SCALING_OPS = 500
+
+
+def make_requests(count, stations, seed=11):
+    rng = random.Random(seed)
+    requests = []
+    for i in range(count):
+        sender = 1 if rng.random() < 0.5 else rng.randint(2, stations)
+        receiver = rng.choice([s for s in range(1, stations + 1) if s != sender])
+        priority = 'high' if rng.random() < 0.1 else 'low'
+        requests.append({'from': sender, 'to': receiver, 'priority': priority,
+                         'arrival': rng.uniform(0, ARRIVAL_SPREAD)})
+    requests.sort(key=lambda r: r['arrival'])
+    return requests
+
+
+def report(label, waits):
+    per_station = {s: sum(w) / len(w) for s, w in waits.items()}
+    hot = per_station.pop(1)
+    others = sorted(per_station.values())
+    print(f"{label:22s} hot station mean wait {hot / 60:7.1f} min, "
+          f"other stations mean {sum(others) / len(others) / 60:7.1f} min, "
+          f"worst other station {others[-1] / 60:7.1f} min")
+
+
+def drain_fifo(requests):
+    high, normal = deque(), deque()
+    waits = defaultdict(list)
+    now, index = 0.0, 0
+    while index < len(requests) or high or normal:
+        while index < len(requests) and requests[index]['arrival'] <= now:
+            request = requests[index]
+            (high if request['priority'] == 'high' else normal).append(request)
+            index += 1
+        if not high and not normal:
+            now = requests[index]['arrival']
+            continue
+        request = (high or normal).popleft()
+        waits[request['from']].append(now - request['arrival'])
+        now += SERVICE_SECONDS
+    return waits
+
+
+def drain_priority(pool, requests):
+    now = [0.0]
+    queue = DispatchQueue(pool, clock=lambda: now[0])
+    waits = defaultdict(list)
+    index = 0
+    while index < len(requests) or len(queue):
+        while index < len(requests) and requests[index]['arrival'] <= now[0]:
+            current = now[0]
+            now[0] = requests[index]['arrival']   # stamp with the real arrival time
+            queue.push(dict(requests[index]))
+            now[0] = current
+            index += 1
+        if not len(queue):
+            now[0] = requests[index]['arrival']
+            continue
+        request = next(queue.candidates())
+        queue.take(request)
+        queue.done(request)
+        waits[request['from']].append(now[0] - request['arrival'])
+        now[0] += SERVICE_SECONDS
+    return waits
+
+
+def per_call(operation, items):
+    start = time.perf_counter()
+    for item in items:
+        operation(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def scaling(directory, requests):
+    print(f"{'entries':>8s} {'reprioritise':>13s} {'cancel':>9s} {'position':>9s}  (us per call)")
+    for size in SCALING_SIZES:
+        pool = ConnectionPool(os.path.join(directory, f'scaling-{size}.db'))
+        DispatchQueue.init_schema(pool.thread_connection())
+        queue = DispatchQueue(pool)
+        for i in range(size):
+            queue.push(dict(requests[i % len(requests)]))
+        sample = random.Random(size).sample(list(queue.candidates()), SCALING_OPS)
+        position = per_call(queue.position, sample)
+        reprioritise = per_call(lambda dispatch: queue.reprioritise(dispatch['queue_id'], 'high'), sample)
+        cancel = per_call(lambda dispatch: queue.cancel(dispatch['queue_id']), sample)
+        print(f"{size:8d} {reprioritise:13.1f} {cancel:9.1f} {position:9.1f}")
+        pool.close_all()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    stations = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    requests = make_requests(count, stations)
+
+    with tempfile.TemporaryDirectory() as directory:
+        pool = ConnectionPool(os.path.join(directory, 'queue.db'))
+        DispatchQueue.init_schema(pool.thread_connection())
+
+        queue = DispatchQueue(pool)
+        start = time.perf_counter()
+        for request in requests:
+            queue.push(dict(request))
+        insert = time.perf_counter() - start
+
+        queued = list(queue.candidates())
+        start = time.perf_counter()
+        for dispatch in queued[::4]:
+            queue.reprioritise(dispatch['queue_id'], 'high')
+        reprioritise = time.perf_counter() - start
+        start = time.perf_counter()
+        for dispatch in queued[1::4]:
+            queue.cancel(dispatch['queue_id'])
+        cancel = time.perf_counter() - start
+        start = time.perf_counter()
+        taken = 0
+        for dispatch in list(queue.candidates()):
+            queue.take(dispatch)
+            taken += 1
+        take = time.perf_counter() - start
+
+        print(f"requests: {count}, stations: {stations}")
+        print(f"insert:       {count / insert:9.0f} ops/s")
+        print(f"reprioritise: {len(queued[::4]) / reprioritise:9.0f} ops/s")
+        print(f"cancel:       {len(queued[1::4]) / cancel:9.0f} ops/s")
+        print(f"take:         {taken / take:9.0f} ops/s (journal commit included in every op)")
+
+        pool.thread_connection().execute('DELETE FROM dispatch_queue')
+        pool.thread_connection().commit()
+        report('two-deque FIFO', drain_fifo(requests))
+        report('aging + fairness', drain_priority(pool, requests))
+        pool.close_all()
+
+        scaling(directory, requests)
+
+
+if __name__ == '__main__':
+    main()
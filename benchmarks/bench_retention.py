@@ -0,0 +1,121 @@
+"""
+History retention vs dispatch inserts: one unbounded
+`DELETE FROM history WHERE timestamp < ?` (the old cleanup) vs the
+RetentionEngine's batched deletes, while another thread inserts a history
+row every 10 ms the way execute_dispatch does.
+
+Reports how long the purge took and the insert latencies seen meanwhile;
+the worst one is how long a dispatch would have stalled.
+
+    python benchmarks/bench_retention.py [rows] [expired fraction]
+"""
+import os
+import sys
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool  # noqa: E402
+from history_query import HistoryQuery  # noqa: E402
+from retention import RetentionEngine, TIMESTAMP_FORMAT  # noqa: E402
+
+HISTORY_SCHEMA = '''CREATE TABLE history
+                    (task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     sender TEXT NOT NULL,
+                     receiver TEXT NOT NULL,
+                     priority TEXT NOT NULL,
+                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                     status TEXT DEFAULT 'pending',
+                     execution_details TEXT
+                     )'''
+HISTORY_INSERT = 'INSERT INTO history (sender, receiver, priority, timestamp, status) VALUES (?, ?, ?, ?, ?)'
+DISPATCH_INSERT = 'INSERT INTO history (sender, receiver, priority, status) VALUES (?, ?, ?, ?)'
+
+
+def load(path, count):
+    pool = ConnectionPool(path)
+    db = pool.thread_connection()
+    db.execute(HISTORY_SCHEMA)
+    rng = random.Random(19)
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    step = 365 * 86400 / count
+    with db:
+        db.executemany(HISTORY_INSERT, (
+            (str(rng.randint(1, 8)), str(rng.randint(1, 8)), 'normal',
+             (start + timedelta(seconds=i * step)).strftime(TIMESTAMP_FORMAT), 'completed')
+            for i in range(count)))
+        HistoryQuery.init_schema(db)
+    return pool
+
+
+class Dispatcher(threading.Thread):
+    """Inserts a history row every 10 ms and records how long each took"""
+
+    def __init__(self, pool):
+        super().__init__(daemon=True)
+        self.pool = pool
+        self.latencies = []
+        self.done = threading.Event()
+
+    def run(self):
+        db = self.pool.thread_connection()
+        while not self.done.is_set():
+            start = time.perf_counter()
+            db.execute(DISPATCH_INSERT, ('1', '2', 'normal', 'in_progress'))
+            db.commit()
+            self.latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+
+
+def measure(label, pool, purge):
+    dispatcher = Dispatcher(pool)
+    dispatcher.start()
+    time.sleep(0.2)
+    start = time.perf_counter()
+    deleted = purge()
+    elapsed = time.perf_counter() - start
+    time.sleep(0.2)
+    dispatcher.done.set()
+    dispatcher.join()
+    latencies = sorted(dispatcher.latencies)
+    print(f"{label:22s} {deleted:8d} rows in {elapsed:6.2f}s   inserts: {len(latencies):5d}  "
+          f"p50 {latencies[len(latencies) // 2]:7.2f} ms  p99 {latencies[int(len(latencies) * 0.99)]:8.2f} ms  "
+          f"max {latencies[-1]:8.2f} ms")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    fraction = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    days = int(365 * (1 - fraction))
+    print(f"{count} history rows over 365 days, expiring those older than {days} days")
+    with tempfile.TemporaryDirectory() as directory:
+        pool = load(os.path.join(directory, 'single.db'), count)
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime(TIMESTAMP_FORMAT)
+
+        def single_delete():
+            db = pool.thread_connection()
+            with db:
+                return db.execute('DELETE FROM history WHERE timestamp < ?', (cutoff,)).rowcount
+        measure('single DELETE', pool, single_delete)
+        pool.close_all()
+
+        pool = load(os.path.join(directory, 'batched.db'), count)
+        engine = RetentionEngine(pool, days={'history': days})
+        engine.start()
+
+        def batched():
+            job = engine.submit('history')
+            while engine.job(job['id'])['state'] in ('queued', 'running'):
+                time.sleep(0.05)
+            return engine.job(job['id'])['deleted']
+        measure('RetentionEngine', pool, batched)
+        engine.stop()
+        pool.close_all()
+
+
+if __name__ == '__main__':
+    main()
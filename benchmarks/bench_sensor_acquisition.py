@@ -0,0 +1,126 @@
+"""
+Sensor acquisition: old 50 ms polling loop vs edge-driven SensorMonitor.
+
+Runs on the fake GPIO backend. A driver thread produces position-sensor
+pulses of random width (some shorter than the 50 ms poll period, some with
+contact bounce) and both acquisition paths report which pulses they saw, how
+late, and how much CPU they used while the line was idle.
+
+    python benchmarks/bench_sensor_acquisition.py [pulses]
+"""
+import os
+import sys
+import random
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gpio_backend import FakeGPIO  # noqa: E402
+from sensor_monitor import SensorMonitor, SENSOR_PINS  # noqa: E402
+
+POLL_INTERVAL = 0.05
+IDLE_SECONDS = 2.0
+BOUNCE_SHARE = 0.3
+
+
+def read_sensors(gpio):
+    return {name: gpio.input(pin) == gpio.LOW for name, pin in SENSOR_PINS.items()}
+
+
+class LegacyPoller:
+    """publish_sensor_data() as it was: read every pin, compare dicts, sleep 50 ms"""
+
+    def __init__(self, gpio, on_frame):
+        self.gpio = gpio
+        self.on_frame = on_frame
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        previous = None
+        while self.running:
+            sensors = read_sensors(self.gpio)
+            if sensors != previous:
+                sensors['ts'] = time.time()
+                self.on_frame(sensors)
+                previous = {k: v for k, v in sensors.items() if k != 'ts'}
+            time.sleep(POLL_INTERVAL)
+
+
+def make_pulses(count, seed=3):
+    rng = random.Random(seed)
+    pulses = []
+    for _ in range(count):
+        width = rng.choice([0.01, 0.02, 0.03, 0.08, 0.15])
+        pulses.append((rng.choice(['P1', 'P2', 'P3', 'P4']), width, rng.random() < BOUNCE_SHARE))
+    return pulses
+
+
+def drive(gpio, pulses):
+    """Returns [(sensor, wall time of the leading edge)] per pulse"""
+    edges = []
+    for name, width, bounce in pulses:
+        pin = SENSOR_PINS[name]
+        edges.append((name, time.time()))
+        if bounce:
+            for _ in range(3):
+                gpio.set_input(pin, gpio.LOW)
+                time.sleep(0.0005)
+                gpio.set_input(pin, gpio.HIGH)
+                time.sleep(0.0005)
+        gpio.set_input(pin, gpio.LOW)
+        time.sleep(width)
+        gpio.set_input(pin, gpio.HIGH)
+        time.sleep(0.06)
+    return edges
+
+
+def run(label, factory, pulses):
+    gpio = FakeGPIO()
+    for pin in SENSOR_PINS.values():
+        gpio.setup(pin, gpio.IN)
+    frames = []
+    acquirer = factory(gpio, frames.append)
+    acquirer.start()
+
+    cpu_start = time.process_time()
+    time.sleep(IDLE_SECONDS)
+    idle_cpu = time.process_time() - cpu_start
+
+    edges = drive(gpio, pulses)
+    time.sleep(0.2)
+    acquirer.stop()
+
+    # A pulse is seen when some frame reports its sensor active after its leading edge
+    seen = 0
+    latencies = []
+    for index, (name, edge_at) in enumerate(edges):
+        window_end = edges[index + 1][1] if index + 1 < len(edges) else float('inf')
+        hits = [f['ts'] for f in frames if f.get(name) and edge_at <= f['ts'] < window_end]
+        if hits:
+            seen += 1
+            latencies.append(hits[0] - edge_at)
+    latencies.sort()
+    short = sum(1 for _, width, _ in pulses if width < POLL_INTERVAL)
+    print(f"{label:18s} pulses seen {seen:4d}/{len(pulses)} ({short} shorter than {POLL_INTERVAL * 1000:.0f} ms)  "
+          f"latency p50 {latencies[len(latencies) // 2] * 1000:6.1f} ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.1f} ms  "
+          f"idle CPU {idle_cpu / IDLE_SECONDS * 100:5.2f}%  frames {len(frames)}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    pulses = make_pulses(count)
+    run('50 ms polling', LegacyPoller, pulses)
+    run('edge + debounce', lambda gpio, on_frame: SensorMonitor(gpio, on_frame), pulses)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+SENSORDATA frame codecs: the JSON dict stations have always published vs the
+10-byte bin1 frame (bitmask + sequence number + monotonic timestamp).
+
+Encodes on the station side the way publish_sensor_frame does and decodes
+with sensor_codec.decode_sensor_frame, as the broker's ingest path does.
+Reports bytes on the wire and encode/decode throughput.
+
+    python benchmarks/bench_sensor_codec.py [frames]
+"""
+import os
+import sys
+import json
+import random
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sensor_codec import decode_sensor_frame, encode_binary  # noqa: E402
+from sensor_writer import SENSOR_KEYS  # noqa: E402
+
+
+def make_frames(count, seed=14):
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(count):
+        frame = {key: rng.random() < 0.3 for key in SENSOR_KEYS}
+        changed = rng.choice(SENSOR_KEYS)
+        frame['ts'] = time.time()
+        frame['edges'] = {changed: frame['ts'] - 0.004}
+        frames.append(frame)
+    return frames
+
+
+def json_encode(frames):
+    return [json.dumps(frame).encode() for frame in frames]
+
+
+def binary_encode(frames):
+    now_ms = time.monotonic() * 1000
+    return [encode_binary(frame, seq, now_ms) for seq, frame in enumerate(frames)]
+
+
+def measure(label, frames, encode):
+    start = time.perf_counter()
+    payloads = encode(frames)
+    encoded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for payload in payloads:
+        decode_sensor_frame(payload)
+    decoded = time.perf_counter() - start
+
+    size = sum(len(payload) for payload in payloads) / len(payloads)
+    print(f"{label:6s} {size:6.1f} bytes/frame  encode {len(frames) / encoded / 1000:7.0f} k/s  "
+          f"decode {len(frames) / decoded / 1000:7.0f} k/s")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    frames = make_frames(count)
+    print(f"{count} frames")
+    measure('json', frames, json_encode)
+    measure('bin1', frames, binary_encode)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Sensor event store: day-partitioned (station, ts_ms, mask, changed) rows vs one
+wide append-only table (station TEXT, timestamp TEXT, eight boolean columns,
+indexed on station + timestamp), the shape the sensor_data table would take if
+it simply stopped upserting.
+
+Loads `days` of synthetic frames for 4 stations (one frame every `interval`
+seconds each) in 64-frame transactions like the write-behind writer, then
+times "all P3 edges of station 2 in the last hour", a full day of one station,
+the hourly rollup, and expiring the oldest day.
+
+    python benchmarks/bench_sensor_history.py [days] [interval]
+"""
+import os
+import sys
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool  # noqa: E402
+from sensor_history import SensorHistory, DAY_MS, HOUR_MS, sensor_bit  # noqa: E402
+from sensor_writer import SENSOR_KEYS  # noqa: E402
+
+STATIONS = ('1', '2', '3', '4')
+BATCH = 64
+
+WIDE_SCHEMA = '''CREATE TABLE sensor_log
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  station_id TEXT NOT NULL,
+                  timestamp TEXT NOT NULL,
+                  S1 BOOLEAN, S2 BOOLEAN, S3 BOOLEAN, S4 BOOLEAN,
+                  P1 BOOLEAN, P2 BOOLEAN, P3 BOOLEAN, P4 BOOLEAN)'''
+WIDE_INDEX = 'CREATE INDEX idx_sensor_log ON sensor_log (station_id, timestamp)'
+WIDE_INSERT = 'INSERT INTO sensor_log VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+
+
+def frames(days, interval, now_ms, seed=16):
+    rng = random.Random(seed)
+    state = {station: {key: False for key in SENSOR_KEYS} for station in STATIONS}
+    ts = now_ms - days * DAY_MS
+    step = int(interval * 1000 / len(STATIONS))
+    while ts < now_ms:
+        station = rng.choice(STATIONS)
+        frame = dict(state[station])
+        flip = rng.choice(SENSOR_KEYS)
+        frame[flip] = not frame[flip]
+        state[station] = frame
+        yield station, ts, frame
+        ts += step
+
+
+def iso(ts_ms):
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def batches(iterable):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_partitioned(path, events, now_ms):
+    pool = ConnectionPool(path)
+    history = SensorHistory(pool, raw_days=10 ** 6, clock=lambda: now_ms / 1000)
+    db = pool.thread_connection()
+    SensorHistory.init_schema(db)
+    count = 0
+    start = time.perf_counter()
+    for batch in batches(events):
+        with db:
+            history.append(db, batch)
+        count += len(batch)
+    return pool, history, count, time.perf_counter() - start
+
+
+def load_wide(path, events):
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.execute(WIDE_SCHEMA)
+    db.execute(WIDE_INDEX)
+    start = time.perf_counter()
+    for batch in batches(events):
+        with db:
+            db.executemany(WIDE_INSERT, [(station, iso(ts)) + tuple(frame[key] for key in SENSOR_KEYS)
+                                         for station, ts, frame in batch])
+    return db, time.perf_counter() - start
+
+
+def timed(fn, repeat=20):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def wide_edges(db, station, start_ms, end_ms):
+    """P3 edges the only way the wide table allows: scan the range and compare neighbours"""
+    rows = db.execute('SELECT timestamp, P3 FROM sensor_log WHERE station_id = ? AND timestamp >= ? '
+                      'AND timestamp < ? ORDER BY timestamp', (station, iso(start_ms), iso(end_ms))).fetchall()
+    return [ts for (ts, level), (_, before) in zip(rows[1:], rows) if level != before]
+
+
+def size_mb(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix)) / 1e6
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    now_ms = int(time.time() * 1000) // HOUR_MS * HOUR_MS
+    hour = (now_ms - HOUR_MS, now_ms)
+    day = (now_ms - DAY_MS, now_ms)
+
+    with tempfile.TemporaryDirectory() as directory:
+        part_path = os.path.join(directory, 'partitioned.db')
+        wide_path = os.path.join(directory, 'wide.db')
+        pool, history, count, part_load = load_partitioned(part_path, frames(days, interval, now_ms), now_ms)
+        wide, wide_load = load_wide(wide_path, frames(days, interval, now_ms))
+        print(f"{count} frames, {days} days, {len(STATIONS)} stations")
+        print(f"{'':28s} {'partitioned':>14s} {'wide table':>14s}")
+        print(f"{'load (frames/s)':28s} {count / part_load:14.0f} {count / wide_load:14.0f}")
+        print(f"{'size (bytes/frame)':28s} {size_mb(part_path) * 1e6 / count:14.1f} "
+              f"{size_mb(wide_path) * 1e6 / count:14.1f}")
+
+        part_ms, part_edges = timed(lambda: history.events('2', *hour, sensor='P3', edges_only=True))
+        wide_ms, wide_result = timed(lambda: wide_edges(wide, '2', *hour))
+        print(f"{'P3 edges, station 2, 1 h':28s} {part_ms:11.2f} ms {wide_ms:11.2f} ms   "
+              f"({len(part_edges)} / {len(wide_result)} edges)")
+        part_ms, _ = timed(lambda: history.events('2', *day, limit=10 ** 6), repeat=5)
+        wide_ms, _ = timed(lambda: wide.execute('SELECT * FROM sensor_log WHERE station_id = ? AND timestamp >= ? '
+                                                'AND timestamp < ?', ('2', iso(day[0]), iso(day[1]))).fetchall(),
+                           repeat=5)
+        print(f"{'all frames, station 2, 24 h':28s} {part_ms:11.2f} ms {wide_ms:11.2f} ms")
+
+        db = pool.thread_connection()
+        start = time.perf_counter()
+        with db:
+            hours = history.rollup(db, now_ms)
+        print(f"{'hourly rollup (all data)':28s} {(time.perf_counter() - start) * 1000:11.2f} ms   ({hours} station-hours)")
+        rollup_ms, rollups = timed(lambda: history.rollups('2', now_ms - days * DAY_MS, now_ms))
+        print(f"{'rollups, station 2, all days':28s} {rollup_ms:11.2f} ms   ({len(rollups)} hours)")
+
+        history.raw_days = days - 1
+        start = time.perf_counter()
+        with db:
+            dropped = history.prune(db, now_ms + DAY_MS)
+        part_ms = (time.perf_counter() - start) * 1000
+        cutoff = iso(now_ms - (days - 2) * DAY_MS)
+        start = time.perf_counter()
+        with wide:
+            deleted = wide.execute('DELETE FROM sensor_log WHERE timestamp < ?', (cutoff,)).rowcount
+        wide_ms = (time.perf_counter() - start) * 1000
+        print(f"{'expire oldest day(s)':28s} {part_ms:11.2f} ms {wide_ms:11.2f} ms   "
+              f"({len(dropped)} tables dropped / {deleted} rows deleted)")
+        pool.close_all()
+        wide.close()
+
+
+if __name__ == '__main__':
+    main()
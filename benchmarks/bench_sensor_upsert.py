@@ -0,0 +1,111 @@
+"""
+Messages/second through the SENSORDATA upsert path.
+
+Compares the original behaviour (a fresh sqlite3.connect() per MQTT message,
+default rollback journal) with the pooled, thread-local WAL connections from
+db_pool, and with the SensorWriteBehind stage the MQTT callback now feeds. Runs against a throwaway database, never lan_monitoring.db.
+
+    python benchmarks/bench_sensor_upsert.py [messages]
+"""
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool  # noqa: E402
+from sensor_writer import SENSOR_UPSERT_SQL as UPSERT, SENSOR_KEYS as KEYS, SensorWriteBehind  # noqa: E402
+
+# Mirrors the sensor_data table from init_db() in app_com_rpi2.py
+SCHEMA = '''CREATE TABLE IF NOT EXISTS sensor_data
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             station_id TEXT NOT NULL UNIQUE,
+             S1 BOOLEAN, S2 BOOLEAN, S3 BOOLEAN, S4 BOOLEAN,
+             P1 BOOLEAN, P2 BOOLEAN, P3 BOOLEAN, P4 BOOLEAN,
+             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)'''
+
+
+def make_messages(count, stations=4):
+    messages = []
+    for i in range(count):
+        frame = {key: bool((i >> bit) & 1) for bit, key in enumerate(KEYS)}
+        messages.append((str(i % stations + 1), json.dumps(frame)))
+    return messages
+
+
+def params(station_id, payload):
+    data = json.loads(payload)
+    return (station_id,) + tuple(data.get(key, False) for key in KEYS)
+
+
+def run_baseline(database, messages):
+    start = time.perf_counter()
+    for station_id, payload in messages:
+        db = sqlite3.connect(database)
+        db.row_factory = sqlite3.Row
+        db.execute(UPSERT, params(station_id, payload))
+        db.commit()
+    return time.perf_counter() - start
+
+
+def run_pooled(database, messages):
+    pool = ConnectionPool(database)
+    start = time.perf_counter()
+    for station_id, payload in messages:
+        db = pool.thread_connection()
+        db.execute(UPSERT, params(station_id, payload))
+        db.commit()
+    elapsed = time.perf_counter() - start
+    pool.close_all()
+    return elapsed
+
+
+def run_write_behind(database, messages):
+    """Returns (callback seconds, seconds until everything is on disk, metrics)"""
+    pool = ConnectionPool(database)
+    writer = SensorWriteBehind(pool, max_queue=len(messages) + 1)
+    writer.start()
+    start = time.perf_counter()
+    for station_id, payload in messages:
+        data = json.loads(payload)
+        writer.submit(station_id, data)
+    callback = time.perf_counter() - start
+    writer.stop()
+    drained = time.perf_counter() - start
+    metrics = writer.metrics()
+    pool.close_all()
+    return callback, drained, metrics
+
+
+def fresh_database(directory, name):
+    path = os.path.join(directory, name)
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    messages = make_messages(count)
+    with tempfile.TemporaryDirectory() as directory:
+        baseline = run_baseline(fresh_database(directory, 'baseline.db'), messages)
+        pooled = run_pooled(fresh_database(directory, 'pooled.db'), messages)
+        callback, drained, metrics = run_write_behind(fresh_database(directory, 'writer.db'), messages)
+
+    print(f"messages:                     {count}")
+    print(f"connect per message:          {count / baseline:10.0f} msg/s")
+    print(f"pooled + WAL, inline upsert:  {count / pooled:10.0f} msg/s")
+    print(f"write-behind (callback side): {count / callback:10.0f} msg/s")
+    print(f"write-behind (drained):       {count / drained:10.0f} msg/s")
+    print(f"  rows written {metrics['rows_written']}, coalesce ratio {metrics['coalesce_ratio']:.1f}, "
+          f"avg flush {metrics['flush_latency_ms']['avg']:.2f} ms")
+    print(f"pooled vs connect-per-message: {baseline / pooled:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Sensor wait reaction time: the 100 ms polling loops vs SensorMonitor.wait_for().
+
+A driver thread flips a position sensor at random moments on the fake GPIO
+backend; the waiter records how long after the edge it woke up. Also
+reports the CPU used by the bare `pass` loops inching_cs.py had.
+
+    python benchmarks/bench_sensor_wait.py [waits]
+"""
+import os
+import sys
+import random
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gpio_backend import FakeGPIO  # noqa: E402
+from sensor_monitor import SensorMonitor, SENSOR_PINS  # noqa: E402
+
+P3 = SENSOR_PINS['P3']
+
+
+def poll_sleep(gpio, monitor):
+    while gpio.input(P3) == gpio.LOW:
+        time.sleep(0.1)
+
+
+def poll_spin(gpio, monitor):
+    while gpio.input(P3) == gpio.LOW:
+        pass
+
+
+def wait_for(gpio, monitor):
+    monitor.wait_for('P3', gpio.HIGH, timeout=5)
+
+
+def measure(label, waiter, waits, seed=5):
+    gpio = FakeGPIO()
+    for pin in SENSOR_PINS.values():
+        gpio.setup(pin, gpio.IN)
+    monitor = SensorMonitor(gpio, lambda frame: None)
+    monitor.start()
+    rng = random.Random(seed)
+    latencies = []
+    cpu = wall = 0.0
+    for _ in range(waits):
+        gpio.set_input(P3, gpio.LOW)
+        monitor.wait_for('P3', gpio.LOW, timeout=1)
+        delay = rng.uniform(0.05, 0.25)
+        edge = {}
+
+        def release():
+            time.sleep(delay)
+            edge['at'] = time.perf_counter()
+            gpio.set_input(P3, gpio.HIGH)
+
+        threading.Thread(target=release).start()
+        thread_cpu = time.thread_time()
+        started = time.perf_counter()
+        waiter(gpio, monitor)
+        woke = time.perf_counter()
+        cpu += time.thread_time() - thread_cpu
+        wall += woke - started
+        latencies.append((woke - edge['at']) * 1000)
+        time.sleep(0.01)
+    monitor.stop()
+    latencies.sort()
+    print(f"{label:24s} wake latency p50 {latencies[len(latencies) // 2]:6.1f} ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:6.1f} ms  max {latencies[-1]:6.1f} ms  "
+          f"waiter CPU {cpu / wall:5.1%}")
+
+
+def main():
+    waits = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print(f"{waits} waits, edge 50-250 ms after the wait starts")
+    measure('sleep(0.1) polling', poll_sleep, waits)
+    measure('bare pass loop', poll_spin, max(5, waits // 5))
+    measure('wait_for (edge events)', wait_for, waits)
+
+
+if __name__ == '__main__':
+    main()
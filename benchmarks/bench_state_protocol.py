@@ -0,0 +1,219 @@
+"""
+Bytes and events per dispatch reaching the station screens: the old
+per-concern events vs the versioned state patches (availability deltas
+and station_view patches).
+
+Every station has a page socket in its room and a dashboard socket on the
+'dispatch' topic; with the patches the page socket also follows the
+'availability' topic, as availability.js does. Each dispatch runs a
+three-station route in phases COALESCE_WINDOW apart (so FanOut's coalescing
+does not merge phases that are seconds apart on real hardware): start,
+progress messages, sensor frames as the pod passes (one of them sent
+twice, as a resync does), finish.
+
+The old events are what the broker sent before: system_status_changed,
+status per route station, dispatch_event, mqtt_message carrying the frame
+as a JSON string (parsed again in the browser) and pod_availability_changed.
+
+    python benchmarks/bench_state_protocol.py [stations] [dispatches]
+"""
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, request  # noqa: E402
+from flask_socketio import SocketIO, join_room  # noqa: E402
+from fanout import FanOut, COALESCE_WINDOW  # noqa: E402
+from availability import AvailabilityTracker  # noqa: E402
+from station_view import StationViews  # noqa: E402
+from sensor_writer import SENSOR_KEYS  # noqa: E402
+
+ROUTE_LENGTH = 3
+PROGRESS = ('moving', 'arrived')
+
+
+class Broker:
+    """The broker state both protocols are driven from"""
+
+    def __init__(self, stations):
+        self.stations = [str(i) for i in range(1, stations + 1)]
+        self.active = []
+        self.last = {'sender': None, 'receiver': None, 'task_id': None}
+        self.sensors = {station: dict.fromkeys(SENSOR_KEYS, False) for station in self.stations}
+
+    def pod(self, station):
+        return 'occupied' if self.sensors[station]['P1'] else 'available'
+
+    def collect(self):
+        return {
+            'busy': bool(self.active),
+            'current_dispatch': dict(self.active[-1]) if self.active else None,
+            'last_dispatch': dict(self.last),
+            'queue_depth': {'critical': 0, 'high': 0, 'normal': 0, 'low': 0},
+            'pods': {station: self.pod(station) for station in self.stations},
+        }
+
+
+def make_app(broker):
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode='threading')
+    fanout = FanOut(socketio, stations=lambda: broker.stations)
+
+    @socketio.on('join')
+    def join(data):
+        join_room(str(int(data['station_id'])))
+
+    @socketio.on('subscribe')
+    def subscribe(data):
+        fanout.subscribe(request.sid, data['topics'])
+
+    return app, socketio, fanout
+
+
+def connect(app, socketio, stations, patches):
+    clients = []
+    for station in range(1, stations + 1):
+        page = socketio.test_client(app)
+        page.emit('join', {'station_id': station})
+        if patches:
+            page.emit('subscribe', {'topics': ['availability']})
+        dashboard = socketio.test_client(app)
+        dashboard.emit('subscribe', {'topics': ['dispatch']})
+        clients += [page, dashboard]
+    return clients
+
+
+def frames(route):
+    """Sensor frames while the pod passes: the sender's pod leaves, every station's S1-S4 flick"""
+    sent = []
+    for station in route:
+        for key in ('S1', 'S2', 'S3', 'S4'):
+            sent.append((station, {key: True}))
+            sent.append((station, {key: False}))
+    sent.insert(3, sent[2])   # a resent frame
+    return sent
+
+
+class OldProtocol:
+    def __init__(self, broker, fanout):
+        self.broker, self.fanout = broker, fanout
+
+    def status(self):
+        active = self.broker.active
+        self.fanout.state('system_status_changed', {
+            'status': bool(active), 'current_dispatch': active[-1] if active else None,
+            'active_dispatches': list(active)}, all_stations=True, topics=('dispatch',))
+
+    def station_status(self, station, status):
+        self.fanout.emit('status', status, stations=[station])
+
+    def progress(self, sender, receiver, data):
+        self.fanout.emit('dispatch_event', {'from': sender, 'to': receiver, 'data': data},
+                         stations=[sender, receiver], topics=('dispatch',))
+
+    def frame(self, station, frame):
+        topic = f'PTS/SENSORDATA/{station}'
+        self.fanout.emit('mqtt_message', {'topic': topic, 'data': json.dumps(frame)}, stations=[station])
+        self.fanout.state('pod_availability_changed', {
+            'station_id': station, 'available': self.broker.pod(station) == 'available'}, stations=[station])
+
+
+class PatchProtocol:
+    def __init__(self, broker, fanout):
+        self.broker = broker
+        self.views = StationViews(lambda station, patch: fanout.emit('station_view', patch, stations=[station]))
+        self.availability = AvailabilityTracker(
+            broker.collect, lambda delta: fanout.emit('availability', delta, topics=('availability',)))
+        self.availability.refresh()
+
+    def status(self):
+        self.availability.refresh()
+
+    def station_status(self, station, status):
+        self.views.update(station, status=status)
+
+    def progress(self, sender, receiver, data):
+        progress = {'from': sender, 'to': receiver, 'data': data}
+        self.views.update(sender, dispatch=progress)
+        self.views.update(receiver, dispatch=progress)
+
+    def frame(self, station, frame):
+        self.views.update(station, sensors=dict(self.broker.sensors[station]))
+        self.availability.refresh()
+
+
+def run_dispatch(broker, protocol, task_id):
+    start = (task_id * ROUTE_LENGTH) % (len(broker.stations) - ROUTE_LENGTH + 1)
+    route = broker.stations[start:start + ROUTE_LENGTH]
+    sender, receiver = route[0], route[-1]
+    broker.sensors[sender]['P1'] = True   # pod placed
+    protocol.frame(sender, {'P1': True})
+    time.sleep(COALESCE_WINDOW * 2)
+
+    broker.active.append({'from': sender, 'to': receiver, 'priority': 'normal', 'task_id': task_id})
+    broker.last = {'sender': sender, 'receiver': receiver, 'task_id': task_id}
+    protocol.status()
+    for station in route:
+        if station == sender:
+            status = {'status': 'sending', 'destination': receiver, 'task_id': task_id}
+        elif station == receiver:
+            status = {'status': 'receiving', 'source': sender, 'task_id': task_id}
+        else:
+            status = {'status': 'standby'}
+        protocol.station_status(station, status)
+    broker.sensors[sender]['P1'] = False   # pod gone
+    protocol.frame(sender, {'P1': False})
+    time.sleep(COALESCE_WINDOW * 2)
+
+    for data in PROGRESS:
+        protocol.progress(sender, receiver, data)
+    for station, frame in frames(route):
+        broker.sensors[station].update(frame)
+        protocol.frame(station, dict(broker.sensors[station]))
+    time.sleep(COALESCE_WINDOW * 2)
+
+    broker.active.clear()
+    protocol.status()
+    for station in route:
+        protocol.station_status(station, {'status': 'standby'})
+    time.sleep(COALESCE_WINDOW * 2)
+
+
+def received(clients):
+    events = wire = 0
+    for client in clients:
+        for packet in client.get_received():
+            events += 1
+            wire += len('42' + json.dumps([packet['name']] + packet['args'], separators=(',', ':')))
+    return events, wire
+
+
+def measure(label, stations, count, patches):
+    broker = Broker(stations)
+    app, socketio, fanout = make_app(broker)
+    clients = connect(app, socketio, stations, patches)
+    protocol = PatchProtocol(broker, fanout) if patches else OldProtocol(broker, fanout)
+    received(clients)
+    for task_id in range(count):
+        run_dispatch(broker, protocol, task_id)
+    events, wire = received(clients)
+    by_event = {name: n for name, n in fanout.metrics()['deliveries_by_event'].items() if n}
+    print(f"{label:8s} {events / count:7.1f} events {wire / count:9.0f} bytes per dispatch  "
+          f"({wire / max(1, events):5.0f} bytes/event)  {by_event}")
+    for client in clients:
+        client.disconnect()
+
+
+def main():
+    stations = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print(f"{stations} stations ({stations * 2} sockets), {count} dispatches of {ROUTE_LENGTH} stations")
+    measure('events', stations, count, patches=False)
+    measure('patches', stations, count, patches=True)
+
+
+if __name__ == '__main__':
+    main()
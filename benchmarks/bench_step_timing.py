@@ -0,0 +1,65 @@
+"""
+Step pulse timing off-device: time.sleep bit-banging vs the busy-wait motion thread.
+
+Both backends drive a fake GPIO and record the rising edge of every pulse.
+Reports achieved step rate against the commanded one, period jitter, and the
+length of a full indexing revolution (ramped profile vs fixed slow mode).
+
+    python benchmarks/bench_step_timing.py [steps] [half_period_us]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gpio_backend import FakeGPIO  # noqa: E402
+from motion_backend import SleepBackend, SimulatedBackend, ramp  # noqa: E402
+
+REVOLUTION_STEPS = 300
+RAMP_STEPS = 40
+
+
+def measure(backend, delays):
+    backend.pulses.clear()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    backend.run(delays)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    periods = [b - a for a, b in zip(backend.pulses, backend.pulses[1:])]
+    return elapsed, cpu, periods
+
+
+def describe(label, commanded, elapsed, cpu, periods, steps):
+    errors = sorted(abs(p - commanded) * 1e6 for p in periods)
+    mean = sum(periods) / len(periods)
+    print(f"{label:22s} {steps / elapsed:8.0f} steps/s (commanded {1 / commanded:6.0f})  "
+          f"period mean {mean * 1e6:7.1f} us  |error| p50 {errors[len(errors) // 2]:7.1f} us  "
+          f"p99 {errors[int(len(errors) * 0.99)]:7.1f} us  max {errors[-1]:8.1f} us  CPU {cpu / elapsed:4.0%}")
+
+
+def main():
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    half_period = (int(sys.argv[2]) if len(sys.argv) > 2 else 300) / 1e6
+    commanded = 2 * half_period
+
+    legacy = SleepBackend(FakeGPIO(), 16, 19, record=True)
+    timed = SimulatedBackend()
+    print(f"{steps} steps at {half_period * 1e6:.0f} us half-period, realtime scheduling: {timed.realtime}")
+    for label, backend in (('time.sleep per edge', legacy), ('busy-wait thread', timed)):
+        elapsed, cpu, periods = measure(backend, [half_period] * steps)
+        describe(label, commanded, elapsed, cpu, periods, steps)
+
+    slow = half_period * 4
+    fixed = (slow,) * REVOLUTION_STEPS
+    ramped = ramp(half_period, slow, RAMP_STEPS) + (slow,) * (REVOLUTION_STEPS - RAMP_STEPS)
+    print("one settling revolution:")
+    for label, profile in (('fixed STEP_DELAY * 4', fixed), ('ramped from cruise', ramped)):
+        elapsed, _, _ = measure(timed, profile)
+        print(f"  {label:22s} {elapsed * 1000:7.1f} ms")
+    timed.close()
+
+
+if __name__ == '__main__':
+    main()
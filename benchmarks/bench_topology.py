@@ -0,0 +1,91 @@
+"""
+/api/network_architecture latency: the old handler (glob + stat every
+architecture file, json.load, CREATE TABLE IF NOT EXISTS per station and a
+commit, jsonify) vs TopologyService's cached bytes, both as a full 200 and
+as the 304 a browser gets when it revalidates with If-None-Match.
+
+Runs both handlers in one Flask app through the test client against the
+repository's network_architecture.json.
+
+    python benchmarks/bench_topology.py [requests]
+"""
+import os
+import sys
+import glob
+import json
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, Response, jsonify, request  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+from topology_service import TopologyService, ensure_component_tables  # noqa: E402
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_app(database):
+    app = Flask(__name__)
+    pool = ConnectionPool(database)
+    pool.init_app(app)
+    service = TopologyService(REPO)
+    service.reload()
+    with app.app_context():
+        db = pool.get_db()
+        ensure_component_tables(db, service.current().data)
+        db.commit()
+
+    @app.route('/old')
+    def old():
+        json_files = glob.glob(os.path.join(REPO, "network_architecture*.json"))
+        latest_file = max(json_files, key=os.path.getmtime)
+        with open(latest_file, 'r') as json_file:
+            data = json.load(json_file)
+        db = pool.get_db()
+        ensure_component_tables(db, data)
+        db.commit()
+        return jsonify(data)
+
+    @app.route('/new')
+    def new():
+        snapshot = service.current()
+        response = Response(snapshot.body, content_type='application/json')
+        response.set_etag(snapshot.etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+    return app, pool, service
+
+
+def measure(label, client, path, count, headers=None):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get(path, headers=headers or {})
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    print(f"{label:28s} {response.status_code}  {len(response.data):6d} bytes  "
+          f"p50 {latencies[len(latencies) // 2]:7.3f} ms  p99 {latencies[int(len(latencies) * 0.99)]:7.3f} ms")
+    return response
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as directory:
+        app, pool, service = make_app(os.path.join(directory, 'bench.db'))
+        client = app.test_client()
+        print(f"{count} requests each")
+        measure('old handler', client, '/old', count)
+        response = measure('cached, full response', client, '/new', count)
+        measure('cached, If-None-Match (304)', client, '/new', count,
+                headers={'If-None-Match': response.headers['ETag']})
+        start = time.perf_counter()
+        for _ in range(count):
+            service.reload()
+        print(f"{'watcher check (no change)':28s} {(time.perf_counter() - start) * 1000 / count:27.3f} ms")
+        pool.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+import sqlite3
+import threading
+import logging
+from queue import LifoQueue, Empty, Full
+
+from flask import g, has_app_context
+
+logger = logging.getLogger('Broker')
+
+# Pragmas applied to every connection we hand out.
+# WAL lets the history/dashboard readers run while the MQTT thread writes,
+# synchronous=NORMAL is durable under WAL except for power loss mid-checkpoint,
+# a negative cache_size is in KiB (8 MB page cache per connection).
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -8000),
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),
+)
+
+# Per-connection prepared statement cache (keyed on the SQL text), so keep the
+# hot queries as module-level constants instead of building them per call.
+STATEMENT_CACHE_SIZE = 256
+
+
+def connect(database):
+    """Open a tuned SQLite connection"""
+    conn = sqlite3.connect(database,
+                           timeout=5.0,
+                           check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    for name, value in SQLITE_PRAGMAS:
+        conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+
+class ConnectionPool:
+    """
+    Reusable SQLite connections for the broker.
+
+    Flask requests and Socket.IO events (which run inside an app context) borrow
+    a pooled connection that is returned on app context teardown. Long-lived
+    threads without an app context (paho network thread, scheduler) keep one
+    thread-local connection for their whole lifetime.
+
+    `wrap` is applied to every connection opened (async_runtime's
+    offload_connection routes their calls through its executor), and
+    `max_borrowed` caps the connections out at once; acquire() waits for
+    one to come back.
+    """
+
+    def __init__(self, database, max_idle=8, wrap=None, max_borrowed=None):
+        self.database = database
+        self._wrap = wrap
+        self._borrowed = threading.BoundedSemaphore(max_borrowed) if max_borrowed else None
+        self._idle = LifoQueue(maxsize=max_idle)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = set()
+        self.stats = {'opened': 0, 'reused': 0, 'closed': 0, 'waits': 0}
+
+    def _open(self):
+        conn = connect(self.database)
+        if self._wrap is not None:
+            conn = self._wrap(conn)
+        with self._lock:
+            self._all.add(conn)
+            self.stats['opened'] += 1
+        return conn
+
+    def _close(self, conn):
+        with self._lock:
+            self._all.discard(conn)
+            self.stats['closed'] += 1
+        conn.close()
+
+    def acquire(self):
+        """Borrow a connection from the pool, opening one if none is idle"""
+        if self._borrowed is not None and not self._borrowed.acquire(blocking=False):
+            with self._lock:
+                self.stats['waits'] += 1
+            self._borrowed.acquire()
+        try:
+            conn = self._idle.get_nowait()
+        except Empty:
+            try:
+                return self._open()
+            except BaseException:
+                self._return_slot()
+                raise
+        with self._lock:
+            self.stats['reused'] += 1
+        return conn
+
+    def release(self, conn):
+        """Return a borrowed connection, discarding any uncommitted work"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._idle.put_nowait(conn)
+            except Full:
+                self._close(conn)
+        finally:
+            self._return_slot()
+
+    def _return_slot(self):
+        if self._borrowed is not None:
+            self._borrowed.release()
+
+    def thread_connection(self):
+        """Connection owned by the calling thread, opened on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def get_db(self):
+        """Connection for the current context (app context or thread)"""
+        if has_app_context():
+            if '_db_conn' not in g:
+                g._db_conn = self.acquire()
+            return g._db_conn
+        return self.thread_connection()
+
+    def teardown(self, exception=None):
+        conn = g.pop('_db_conn', None)
+        if conn is not None:
+            self.release(conn)
+
+    def init_app(self, app):
+        app.teardown_appcontext(self.teardown)
+
+    def close_all(self):
+        with self._lock:
+            conns = list(self._all)
+        for conn in conns:
+            try:
+                self._close(conn)
+            except sqlite3.ProgrammingError:
+                pass
+        logger.info(f"Closed {len(conns)} database connections")
@@ -0,0 +1,124 @@
+import threading
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger('Broker')
+
+# Broker-side phase timings (from the watchdog) are stored under this station name
+BROKER_STATION = 'broker'
+
+PROFILE_SCHEMA = '''CREATE TABLE IF NOT EXISTS dispatch_profile
+                    (task_id INTEGER NOT NULL,
+                     station TEXT NOT NULL,
+                     seq INTEGER NOT NULL,
+                     step TEXT NOT NULL,
+                     kind TEXT,
+                     start_ms INTEGER,
+                     duration_ms INTEGER,
+                     PRIMARY KEY (task_id, station, seq)
+                     ) WITHOUT ROWID'''
+PROFILE_INDEX = 'CREATE INDEX IF NOT EXISTS idx_dispatch_profile_step ON dispatch_profile (station, step)'
+
+PROFILE_INSERT_SQL = '''INSERT OR REPLACE INTO dispatch_profile
+                        (task_id, station, seq, step, kind, start_ms, duration_ms)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+PERCENTILES = (50, 90, 99)
+SUMMARY_TASKS = 1000
+
+
+def _ms(value):
+    return None if value is None else int(round(value))
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, len(ordered) * p // 100)]
+
+
+class DispatchProfiler:
+    """
+    Stores the per-step traces stations ship in their ACKs, one integer row
+    per step (task, station, seq), next to the broker's own phase timings.
+    Station ids are stored normalised ('1', not 'passthrough-station-1').
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._phase_seq = defaultdict(int)   # task id -> next broker row
+
+    @staticmethod
+    def init_schema(db):
+        db.execute(PROFILE_SCHEMA)
+        db.execute(PROFILE_INDEX)
+
+    def record_trace(self, task_id, station, trace):
+        """trace is the compact form: {'operation', 't0', 'steps': [[step, kind, start_ms, ms], ...]}"""
+        if task_id is None or not trace:
+            return
+        rows = [(task_id, station, seq, step, kind, _ms(start_ms), _ms(duration_ms))
+                for seq, (step, kind, start_ms, duration_ms) in enumerate(trace.get('steps', []))]
+        db = self.pool.get_db()
+        with db:
+            db.executemany(PROFILE_INSERT_SQL, rows)
+
+    def record_phase(self, task_id, phase, seconds):
+        if task_id is None:
+            return
+        with self._lock:
+            seq = self._phase_seq[task_id]
+            self._phase_seq[task_id] += 1
+            if len(self._phase_seq) > 1024:
+                self._phase_seq.pop(next(iter(self._phase_seq)))
+        db = self.pool.get_db()
+        with db:
+            db.execute(PROFILE_INSERT_SQL,
+                       (task_id, BROKER_STATION, seq, phase, 'phase', None, _ms(seconds * 1000)))
+
+    @staticmethod
+    def prune(db):
+        """Drop profiles whose history row is gone; call after deleting history"""
+        return db.execute('DELETE FROM dispatch_profile WHERE task_id NOT IN '
+                          '(SELECT task_id FROM history)').rowcount
+
+    @staticmethod
+    def delete_tasks(db, task_ids):
+        """Drop the profiles of history rows being deleted, in the caller's transaction"""
+        db.execute(f"DELETE FROM dispatch_profile WHERE task_id IN ({', '.join('?' * len(task_ids))})",
+                   task_ids)
+
+    def profile(self, task_id):
+        """{station: [{'step', 'kind', 'start_ms', 'ms'}, ...]} for one task"""
+        rows = self.pool.get_db().execute(
+            'SELECT station, step, kind, start_ms, duration_ms FROM dispatch_profile '
+            'WHERE task_id = ? ORDER BY station, seq', (task_id,)
+        ).fetchall()
+        stations = defaultdict(list)
+        for row in rows:
+            stations[row['station']].append({'step': row['step'], 'kind': row['kind'],
+                                             'start_ms': row['start_ms'], 'ms': row['duration_ms']})
+        return dict(stations)
+
+    def summary(self, tasks=SUMMARY_TASKS):
+        """Duration percentiles per station and step over the most recent `tasks` tasks, slowest first"""
+        rows = self.pool.get_db().execute(
+            'SELECT station, step, kind, duration_ms FROM dispatch_profile '
+            'WHERE duration_ms IS NOT NULL AND task_id >= '
+            '(SELECT COALESCE(MIN(task_id), 0) FROM '
+            ' (SELECT DISTINCT task_id FROM dispatch_profile ORDER BY task_id DESC LIMIT ?))',
+            (tasks,)
+        ).fetchall()
+        samples = defaultdict(list)
+        for row in rows:
+            samples[(row['station'], row['step'], row['kind'])].append(row['duration_ms'])
+
+        summary = []
+        for (station, step, kind), durations in samples.items():
+            durations.sort()
+            entry = {'station': station, 'step': step, 'kind': kind, 'count': len(durations),
+                     'max_ms': durations[-1]}
+            for p in PERCENTILES:
+                entry[f'p{p}_ms'] = percentile(durations, p)
+            summary.append(entry)
+        summary.sort(key=lambda entry: entry['p90_ms'], reverse=True)
+        return summary
@@ -0,0 +1,250 @@
+import json
+import heapq
+import itertools
+import threading
+import time
+import logging
+from collections import Counter
+
+from sortedcontainers import SortedList
+
+logger = logging.getLogger('Broker')
+
+# Most urgent first. Kiosks send 'high' or 'low'; anything unknown is 'normal'.
+PRIORITY_LEVELS = ('critical', 'high', 'normal', 'low')
+DEFAULT_LEVEL = 'normal'
+
+# Waiting this long is worth one priority level, so low priority pods always run eventually
+AGING_SECONDS = 60.0
+# Spacing between consecutive queued requests from the same sender (round-robin between stations)
+FAIR_QUANTUM = 30.0
+
+# Replayed in-flight entries sort ahead of every live request
+REPLAY_TIER = 0
+QUEUE_TIER = 1
+
+QUEUE_SCHEMA = '''CREATE TABLE IF NOT EXISTS dispatch_queue
+                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   level TEXT NOT NULL,
+                   state TEXT NOT NULL DEFAULT 'pending',
+                   task_id INTEGER,
+                   payload TEXT NOT NULL,
+                   enqueued_at REAL NOT NULL
+                   )'''
+
+QUEUE_INSERT_SQL = 'INSERT INTO dispatch_queue (level, payload, enqueued_at) VALUES (?, ?, ?)'
+QUEUE_TAKE_SQL = "UPDATE dispatch_queue SET state = 'in_flight' WHERE id = ?"
+QUEUE_TASK_SQL = 'UPDATE dispatch_queue SET task_id = ?, payload = ? WHERE id = ?'
+QUEUE_LEVEL_SQL = 'UPDATE dispatch_queue SET level = ?, payload = ? WHERE id = ?'
+QUEUE_DELETE_SQL = 'DELETE FROM dispatch_queue WHERE id = ?'
+
+
+class _Entry:
+    __slots__ = ('sort_key', 'dispatch', 'level', 'base', 'live')
+
+    def __init__(self, sort_key, dispatch, level, base):
+        self.sort_key = sort_key
+        self.dispatch = dispatch
+        self.level = level
+        self.base = base
+        self.live = True
+
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
+
+
+class DispatchQueue:
+    """
+    Durable, heap-ordered dispatch queue journaled in the dispatch_queue table.
+
+    Each entry is ordered by a static key: its fair start time plus
+    `aging_seconds` per priority level below the top. A static key means aging
+    needs no re-heapify: a request waiting `aging_seconds` outranks one a
+    level higher that arrives now. The fair start time spaces consecutive
+    requests from one sender `fair_quantum` apart, so a busy station
+    interleaves with the others instead of starving them.
+
+    Insert, take, cancel and reprioritise are O(log n) (cancelled entries are
+    dropped lazily from the heap). The live keys are also kept in a SortedList,
+    so position() is an O(log n) rank query. Every change is committed to the
+    journal under one lock; recover() replays pending and in-flight entries.
+    """
+
+    def __init__(self, pool, levels=PRIORITY_LEVELS, aging_seconds=AGING_SECONDS,
+                 fair_quantum=FAIR_QUANTUM, clock=time.time):
+        self.pool = pool
+        self.levels = tuple(levels)
+        self.aging_seconds = aging_seconds
+        self.fair_quantum = fair_quantum
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._heap = []
+        self._entries = {}       # queue id -> live _Entry
+        # Sort keys of the live entries, for position()
+        self._order = SortedList()
+        self._in_flight = {}     # queue id -> dispatch
+        self._sender_base = {}   # sender -> fair start time of its latest request
+        self._depth = Counter()
+        self._sequence = itertools.count()
+
+    @staticmethod
+    def init_schema(db):
+        db.execute(QUEUE_SCHEMA)
+
+    def level_of(self, priority):
+        priority = str(priority).lower()
+        return priority if priority in self.levels else DEFAULT_LEVEL
+
+    def _fair_base(self, sender, enqueued_at):
+        previous = self._sender_base.get(sender)
+        base = enqueued_at if previous is None else max(enqueued_at, previous + self.fair_quantum)
+        self._sender_base[sender] = base
+        return base
+
+    def _insert(self, dispatch, level, base, tier=QUEUE_TIER):
+        key = base + self.levels.index(level) * self.aging_seconds
+        entry = _Entry((tier, key, next(self._sequence)), dispatch, level, base)
+        heapq.heappush(self._heap, entry)
+        self._order.add(entry.sort_key)
+        self._entries[dispatch['queue_id']] = entry
+        self._depth[level] += 1
+        return entry
+
+    def _discard(self, queue_id):
+        entry = self._entries.pop(queue_id, None)
+        if entry is None:
+            return None
+        entry.live = False
+        self._depth[entry.level] -= 1
+        self._order.remove(entry.sort_key)
+        # Lazy deletion; rebuild once dead entries dominate the heap
+        while self._heap and not self._heap[0].live:
+            heapq.heappop(self._heap)
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._entries):
+            self._heap = [e for e in self._heap if e.live]
+            heapq.heapify(self._heap)
+        return entry
+
+    def push(self, dispatch):
+        """Journal and enqueue a dispatch; sets dispatch['queue_id']"""
+        level = self.level_of(dispatch.get('priority'))
+        enqueued_at = self._clock()
+        with self._lock:
+            db = self.pool.get_db()
+            with db:
+                cursor = db.execute(QUEUE_INSERT_SQL, (level, json.dumps(dispatch), enqueued_at))
+            dispatch['queue_id'] = cursor.lastrowid
+            self._insert(dispatch, level, self._fair_base(dispatch.get('from'), enqueued_at))
+        return dispatch['queue_id']
+
+    def candidates(self):
+        """Pending dispatches in dequeue order, produced lazily from a heap snapshot"""
+        with self._lock:
+            heap = list(self._heap)
+        while heap:
+            entry = heapq.heappop(heap)
+            if entry.live:
+                yield entry.dispatch
+
+    def take(self, dispatch):
+        """Move a pending dispatch to in-flight"""
+        with self._lock:
+            db = self.pool.get_db()
+            with db:
+                db.execute(QUEUE_TAKE_SQL, (dispatch['queue_id'],))
+            self._discard(dispatch['queue_id'])
+            self._in_flight[dispatch['queue_id']] = dispatch
+
+    def set_task(self, dispatch):
+        """Record the history task id of an in-flight dispatch"""
+        with self._lock:
+            db = self.pool.get_db()
+            with db:
+                db.execute(QUEUE_TASK_SQL, (dispatch.get('task_id'), json.dumps(dispatch), dispatch['queue_id']))
+
+    def done(self, dispatch):
+        """Drop a finished (or failed) dispatch from the journal"""
+        with self._lock:
+            db = self.pool.get_db()
+            with db:
+                db.execute(QUEUE_DELETE_SQL, (dispatch['queue_id'],))
+            self._in_flight.pop(dispatch['queue_id'], None)
+
+    def cancel(self, queue_id):
+        """Remove a pending dispatch; returns it, or None if it is not pending"""
+        with self._lock:
+            if queue_id not in self._entries:
+                return None
+            db = self.pool.get_db()
+            with db:
+                db.execute(QUEUE_DELETE_SQL, (queue_id,))
+            return self._discard(queue_id).dispatch
+
+    def reprioritise(self, queue_id, priority):
+        """Change the priority of a pending dispatch, keeping its sender's turn"""
+        with self._lock:
+            entry = self._entries.get(queue_id)
+            if entry is None:
+                return None
+            level = self.level_of(priority)
+            dispatch = entry.dispatch
+            dispatch['priority'] = priority
+            db = self.pool.get_db()
+            with db:
+                db.execute(QUEUE_LEVEL_SQL, (level, json.dumps(dispatch), queue_id))
+            self._discard(queue_id)
+            self._insert(dispatch, level, entry.base, tier=entry.sort_key[0])
+            return dispatch
+
+    def position(self, dispatch):
+        """1-based position in dequeue order, None if not pending"""
+        with self._lock:
+            entry = self._entries.get(dispatch.get('queue_id'))
+            if entry is None:
+                return None
+            return 1 + self._order.bisect_left(entry.sort_key)
+
+    def depth(self):
+        with self._lock:
+            return {level: self._depth[level] for level in self.levels}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def recover(self):
+        """
+        Rebuild the queue from the journal after a restart. In-flight entries
+        were interrupted mid-dispatch with the pod possibly still in the tube:
+        they go back to pending ahead of everything else and are dispatched again.
+        Returns (pending, in_flight) counts.
+        """
+        with self._lock:
+            db = self.pool.get_db()
+            rows = db.execute(
+                'SELECT id, level, state, payload, enqueued_at FROM dispatch_queue ORDER BY id'
+            ).fetchall()
+            with db:
+                db.execute("UPDATE dispatch_queue SET state = 'pending', task_id = NULL "
+                           "WHERE state = 'in_flight'")
+
+            self._reset()
+            pending = in_flight = 0
+            for row in rows:
+                dispatch = json.loads(row['payload'])
+                dispatch['queue_id'] = row['id']
+                level = row['level'] if row['level'] in self.levels else DEFAULT_LEVEL
+                base = self._fair_base(dispatch.get('from'), row['enqueued_at'])
+                if row['state'] == 'in_flight':
+                    in_flight += 1
+                    dispatch['replayed_from'] = dispatch.pop('task_id', None)
+                    self._insert(dispatch, level, base, tier=REPLAY_TIER)
+                else:
+                    pending += 1
+                    self._insert(dispatch, level, base)
+
+        logger.info(f"Recovered dispatch queue: {pending} pending, {in_flight} interrupted in flight")
+        return pending, in_flight
@@ -0,0 +1,261 @@
+import json
+import threading
+import time
+import logging
+from collections import defaultdict, deque
+
+from station_state import STATION_TYPES, normalize_station_id
+
+logger = logging.getLogger('Broker')
+
+BLOWER_TYPES = ('side-channel-blower',)
+
+# Reserved by every dispatch when running serially (the old dispatch_in_progress behaviour)
+LOOP_RESOURCE = 'loop'
+
+# How far past a blocked request the scheduler looks for one it can backfill
+LOOKAHEAD = 256
+
+
+class Topology:
+    """
+    Tube network parsed from network_architecture.json.
+
+    Tube segments come from `connections` plus every hop listed in the
+    components' `paths`; the graph is undirected because pods travel both ways.
+    """
+
+    def __init__(self, data):
+        self.components = {c['id']: c.get('type') for c in data.get('components', []) if c.get('id')}
+        self.stations = {}   # station number ('1') -> component id
+        self.blowers = []
+        for comp_id, comp_type in self.components.items():
+            if comp_type in STATION_TYPES:
+                self.stations[normalize_station_id(comp_id)] = comp_id
+            elif comp_type in BLOWER_TYPES:
+                self.blowers.append(comp_id)
+
+        self.adjacency = defaultdict(set)
+        for connection in data.get('connections', []):
+            start = connection.get('start', {}).get('componentId')
+            end = connection.get('end', {}).get('componentId')
+            if start and end:
+                self._link(start, end)
+        for component in data.get('components', []):
+            for path in component.get('paths', []):
+                hops = [node.get('id') for node in path.get('path', [])]
+                for a, b in zip(hops, hops[1:]):
+                    if a and b:
+                        self._link(a, b)
+
+        self._routes = {}
+        self._resources = {}
+        self._all_resources = None
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r') as json_file:
+            return cls(json.load(json_file))
+
+    def _link(self, a, b):
+        self.adjacency[a].add(b)
+        self.adjacency[b].add(a)
+
+    def _bfs(self, start):
+        previous = {start: None}
+        order = deque([start])
+        while order:
+            node = order.popleft()
+            for neighbour in sorted(self.adjacency[node]):
+                if neighbour not in previous:
+                    previous[neighbour] = node
+                    order.append(neighbour)
+        return previous
+
+    def route(self, from_station, to_station):
+        """Component ids from sender to receiver (shortest path), or None"""
+        key = (normalize_station_id(from_station), normalize_station_id(to_station))
+        if key in self._routes:
+            return self._routes[key]
+
+        start = self.stations.get(key[0])
+        end = self.stations.get(key[1])
+        route = None
+        if start and end:
+            previous = self._bfs(start)
+            if end in previous:
+                route = [end]
+                while previous[route[-1]] is not None:
+                    route.append(previous[route[-1]])
+                route.reverse()
+        self._routes[key] = route
+        return route
+
+    def nearest_blower(self, route):
+        best = None
+        for node in route:
+            distances = self._bfs(node)
+            for blower in self.blowers:
+                if blower in distances:
+                    hops = self._hops(distances, blower)
+                    if best is None or hops < best[0]:
+                        best = (hops, blower)
+        return best[1] if best else None
+
+    @staticmethod
+    def _hops(previous, node):
+        hops = 0
+        while previous[node] is not None:
+            node = previous[node]
+            hops += 1
+        return hops
+
+    def segments(self, route):
+        return ['segment:' + '~'.join(sorted(pair)) for pair in zip(route, route[1:])]
+
+    def resources(self, from_station, to_station):
+        """
+        Everything a dispatch holds while it runs: the tube segments on its
+        route, every station on the route (sender, receiver and passthroughs)
+        and the blower that drives it. None if the stations are not connected.
+        """
+        key = (normalize_station_id(from_station), normalize_station_id(to_station))
+        if key not in self._resources:
+            route = self.route(*key)
+            if not route:
+                self._resources[key] = None
+            else:
+                resources = set(self.segments(route))
+                resources.update('station:' + node for node in route
+                                 if self.components.get(node) in STATION_TYPES)
+                blower = self.nearest_blower(route)
+                if blower:
+                    resources.add('blower:' + blower)
+                self._resources[key] = frozenset(resources)
+        return self._resources[key]
+
+    def all_resources(self):
+        if self._all_resources is None:
+            resources = {LOOP_RESOURCE}
+            for a, neighbours in self.adjacency.items():
+                for b in neighbours:
+                    resources.add('segment:' + '~'.join(sorted((a, b))))
+            resources.update('station:' + comp_id for comp_id in self.stations.values())
+            resources.update('blower:' + blower for blower in self.blowers)
+            self._all_resources = frozenset(resources)
+        return self._all_resources
+
+
+class DispatchScheduler:
+    """
+    Reserves topology resources per dispatch so that dispatches whose routes
+    share no segment, station or blower run at the same time.
+
+    Queued dispatches are started in queue order; a dispatch that cannot start
+    blocks its resources for everything behind it, so later requests only jump
+    ahead when they do not compete with an earlier waiting one.
+    """
+
+    def __init__(self, topology, concurrent=True, clock=time.monotonic, lookahead=LOOKAHEAD):
+        self.topology = topology
+        self.concurrent = concurrent
+        self.lookahead = lookahead
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._active = []                  # [(dispatch, resources, started_at)]
+        self._busy = set()
+        self._busy_seconds = defaultdict(float)
+        self._started_at = clock()
+        self.stats = {'started': 0, 'completed': 0, 'max_concurrent': 0}
+
+    def set_topology(self, topology):
+        with self._lock:
+            self.topology = topology
+
+    def resources_for(self, dispatch):
+        resources = self.topology.resources(dispatch['from'], dispatch['to'])
+        if resources is None:
+            # Unknown route: hold the whole loop rather than guess
+            logger.warning(f"No route from {dispatch['from']} to {dispatch['to']} in topology, running exclusively")
+            return self.topology.all_resources()
+        if not self.concurrent:
+            return resources | {LOOP_RESOURCE}
+        return resources
+
+    def select_runnable(self, candidates):
+        """
+        Reserve every dispatch in `candidates` (queue order) that can start now
+        and return them; the caller removes them from its queue. Stops once
+        every resource is taken or `lookahead` requests have been passed over.
+        """
+        started = []
+        blocked = set()
+        skipped = 0
+        with self._lock:
+            everything = self.topology.all_resources()
+            for dispatch in candidates:
+                resources = self.resources_for(dispatch)
+                if resources & self._busy or resources & blocked:
+                    blocked |= resources
+                    skipped += 1
+                    if (not self.concurrent or skipped >= self.lookahead
+                            or everything <= self._busy | blocked):
+                        break
+                    continue
+                self._reserve(dispatch, resources)
+                started.append(dispatch)
+        return started
+
+    def _reserve(self, dispatch, resources):
+        self._active.append((dispatch, resources, self._clock()))
+        self._busy |= resources
+        self.stats['started'] += 1
+        self.stats['max_concurrent'] = max(self.stats['max_concurrent'], len(self._active))
+
+    def find(self, task_id=None, receiver=None, sender=None):
+        """Active dispatch by task id, else by receiving (or sending) station"""
+        with self._lock:
+            for dispatch, _, _ in self._active:
+                if task_id is not None and dispatch.get('task_id') == task_id:
+                    return dispatch
+            for key, station in (('to', receiver), ('from', sender)):
+                if station is None:
+                    continue
+                station = normalize_station_id(station)
+                for dispatch, _, _ in self._active:
+                    if normalize_station_id(dispatch[key]) == station:
+                        return dispatch
+        return None
+
+    def release(self, dispatch):
+        """Free the resources held by an active dispatch"""
+        with self._lock:
+            for index, (active, resources, started_at) in enumerate(self._active):
+                if active is dispatch:
+                    del self._active[index]
+                    self._busy -= resources
+                    elapsed = self._clock() - started_at
+                    for resource in resources:
+                        self._busy_seconds[resource] += elapsed
+                    self.stats['completed'] += 1
+                    return True
+        return False
+
+    def active(self):
+        with self._lock:
+            return [dispatch for dispatch, _, _ in self._active]
+
+    def busy(self):
+        with self._lock:
+            return bool(self._active)
+
+    def utilisation(self):
+        """Fraction of wall time each segment/station/blower has been reserved"""
+        with self._lock:
+            now = self._clock()
+            window = max(now - self._started_at, 1e-9)
+            busy = defaultdict(float, self._busy_seconds)
+            for _, resources, started_at in self._active:
+                for resource in resources:
+                    busy[resource] += now - started_at
+            return {resource: seconds / window for resource, seconds in sorted(busy.items())}
@@ -0,0 +1,194 @@
+import bisect
+import threading
+import time
+import logging
+from collections import deque
+
+from motion_sequence import LOAD_TIMEOUT, MOVE_TIMEOUT, ARRIVAL_TIMEOUT
+
+logger = logging.getLogger('Broker')
+
+# dispatched:  broker issued the dispatch -> sender ACKs 'sending'
+# sending:     sender loading / indexing  -> sender ACKs 'send_completed' (pod launched)
+# in_transit:  pod in the tube            -> receiver ACKs 'arrived' (pod at P3)
+# receiving:   receiver unloading         -> receiver ACKs 'receive_completed'
+PHASES = ('dispatched', 'sending', 'in_transit', 'receiving')
+
+# Room on top of the station's own sensor waits for its moves, the blower
+# and the MQTT round trip
+STATION_MARGIN = 60.0
+# Longest a station keeps waiting on its sensors within each phase: the
+# sender's load and two moves, the receiver's wait for the pod (counted from
+# its own start, so it can cover all of the transit), the receiver's move to P4
+STATION_LIMITS = {
+    'sending': LOAD_TIMEOUT + 2 * MOVE_TIMEOUT + STATION_MARGIN,
+    'in_transit': ARRIVAL_TIMEOUT + STATION_MARGIN,
+    'receiving': MOVE_TIMEOUT + STATION_MARGIN,
+}
+# Used until a phase has MIN_SAMPLES completed measurements. A deadline
+# never drops below STATION_LIMITS, so the broker does not fail an
+# operation the station still treats as valid.
+DEFAULT_DEADLINES = dict({'dispatched': 15.0}, **STATION_LIMITS)
+MIN_SAMPLES = 20
+DEADLINE_QUANTILE = 0.99
+DEADLINE_MARGIN = 1.5
+MIN_DEADLINE = 5.0
+RECENT_SAMPLES = 500
+
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+
+
+class PhaseTimings:
+    """Histogram plus a window of recent durations for one phase"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.timeouts = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def record(self, seconds):
+        self.buckets[bisect.bisect_left(HISTOGRAM_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def quantile(self, q):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def describe(self):
+        labels = [f"le_{bound}" for bound in HISTOGRAM_BOUNDS] + ['le_inf']
+        return {
+            'count': self.count,
+            'timeouts': self.timeouts,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+class DispatchWatchdog:
+    """
+    Tracks every active dispatch through PHASES and fails the ones that
+    overrun their phase deadline.
+
+    Deadlines start from DEFAULT_DEADLINES and, once a phase has enough
+    samples, follow its measured p99 times DEADLINE_MARGIN, never below
+    the phase's STATION_LIMITS. `on_timeout` is
+    called from the watchdog thread with (key, dispatch, phase, elapsed);
+    `on_phase(key, phase, seconds)`, if given, with every completed phase.
+    """
+
+    def __init__(self, on_timeout, deadlines=None, check_interval=1.0, clock=time.monotonic, on_phase=None):
+        self.on_timeout = on_timeout
+        self.on_phase = on_phase
+        self.defaults = dict(DEFAULT_DEADLINES, **(deadlines or {}))
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tracked = {}   # key -> [dispatch, phase, phase_started_at]
+        self._timings = {phase: PhaseTimings() for phase in PHASES}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def track(self, key, dispatch):
+        with self._lock:
+            self._tracked[key] = [dispatch, PHASES[0], self._clock()]
+
+    def advance(self, key, phase):
+        """Move a dispatch to `phase`, recording how long the previous one took"""
+        now = self._clock()
+        with self._lock:
+            tracked = self._tracked.get(key)
+            if tracked is None:
+                return False
+            # ACKs can be duplicated or reordered; never move backwards
+            if PHASES.index(phase) <= PHASES.index(tracked[1]):
+                return False
+            completed, seconds = tracked[1], now - tracked[2]
+            self._timings[completed].record(seconds)
+            tracked[1] = phase
+            tracked[2] = now
+        self._phase_done(key, completed, seconds)
+        return True
+
+    def finish(self, key):
+        """Dispatch completed normally; records its last phase"""
+        now = self._clock()
+        with self._lock:
+            tracked = self._tracked.pop(key, None)
+            if tracked is None:
+                return
+            self._timings[tracked[1]].record(now - tracked[2])
+        self._phase_done(key, tracked[1], now - tracked[2])
+
+    def _phase_done(self, key, phase, seconds):
+        if self.on_phase is None:
+            return
+        try:
+            self.on_phase(key, phase, seconds)
+        except Exception as e:
+            logger.error(f"Phase callback failed for dispatch {key}: {e}")
+
+    def forget(self, key):
+        with self._lock:
+            self._tracked.pop(key, None)
+
+    def phase(self, key):
+        with self._lock:
+            tracked = self._tracked.get(key)
+            return tracked[1] if tracked else None
+
+    def deadline(self, phase):
+        with self._lock:
+            return self._deadline(phase)
+
+    def _deadline(self, phase):
+        timings = self._timings[phase]
+        if len(timings.recent) < MIN_SAMPLES:
+            return self.defaults[phase]
+        floor = STATION_LIMITS.get(phase, MIN_DEADLINE)
+        return max(floor, timings.quantile(DEADLINE_QUANTILE) * DEADLINE_MARGIN)
+
+    def check(self):
+        """Expire overdue dispatches; returns [(key, dispatch, phase, elapsed)]"""
+        now = self._clock()
+        expired = []
+        with self._lock:
+            for key, (dispatch, phase, started_at) in list(self._tracked.items()):
+                elapsed = now - started_at
+                if elapsed > self._deadline(phase):
+                    del self._tracked[key]
+                    self._timings[phase].timeouts += 1
+                    expired.append((key, dispatch, phase, elapsed))
+        for key, dispatch, phase, elapsed in expired:
+            logger.warning(f"Dispatch {key} timed out in phase '{phase}' after {elapsed:.1f}s")
+            try:
+                self.on_timeout(key, dispatch, phase, elapsed)
+            except Exception as e:
+                logger.error(f"Dispatch timeout handler failed for {key}: {e}")
+        return expired
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            self.check()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='dispatch-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def histograms(self):
+        with self._lock:
+            return {phase: dict(self._timings[phase].describe(), deadline=self._deadline(phase))
+                    for phase in PHASES}
@@ -0,0 +1,138 @@
+import time
+import logging
+import threading
+from collections import defaultdict, deque
+
+logger = logging.getLogger('Broker')
+
+# Dashboards and other station-less sockets subscribe to topics; each topic is a room
+TOPICS = ('dispatch', 'maintenance', 'stations', 'availability')
+TOPIC_ROOM_PREFIX = 'topic:'
+
+# State events to the same targets within this window collapse into the first and the latest
+COALESCE_WINDOW = 0.25
+RATE_SECONDS = 10
+
+
+def station_room(station_id):
+    return str(station_id)
+
+
+def topic_room(topic):
+    return TOPIC_ROOM_PREFIX + topic
+
+
+class FanOut:
+    """
+    Every server -> browser Socket.IO event goes through here, addressed to
+    the rooms that need it instead of to every socket.
+
+    Station screens sit in their station's room (handle_join); dashboards
+    and the page-wide sockets subscribe() to TOPICS. `stations` returns the
+    live station ids (registry plus topology) for events every station must
+    see. state() is for events that carry a current state rather than a
+    happening: a burst to the same targets within `coalesce_window` sends
+    the first at once and only the latest at the end of the window, and an
+    unchanged state inside the window is not sent again.
+    """
+
+    def __init__(self, socketio, stations=lambda: (), coalesce_window=COALESCE_WINDOW, clock=time.monotonic):
+        self.socketio = socketio
+        self.stations = stations
+        self.coalesce_window = coalesce_window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._windows = {}   # (event, rooms) -> [last sent data, pending data or None, timer]
+        self._per_second = deque(maxlen=RATE_SECONDS + 1)   # [second, emits, deliveries]
+        self._events = defaultdict(int)
+        self.stats = {'emits': 0, 'deliveries': 0, 'coalesced': 0, 'no_target': 0}
+
+    def rooms(self, stations=(), topics=(), all_stations=False):
+        if all_stations:
+            stations = self.stations()
+        rooms = {station_room(station) for station in stations if station is not None}
+        rooms.update(topic_room(topic) for topic in topics)
+        return sorted(rooms)
+
+    def subscribe(self, sid, topics):
+        """Join `sid` to the known topics among `topics`; returns those"""
+        accepted = [topic for topic in topics if topic in TOPICS]
+        for topic in accepted:
+            self.socketio.server.enter_room(sid, topic_room(topic), namespace='/')
+        return accepted
+
+    def _recipients(self, rooms, skip_sid):
+        """Sockets in `rooms`, or None when the manager cannot tell (then we emit anyway)"""
+        manager = self.socketio.server.manager
+        if '/' not in manager.rooms:
+            return 0   # nobody ever connected
+        try:
+            sids = {sid for sid, _ in manager.get_participants('/', rooms)}
+        except (KeyError, AttributeError, NotImplementedError):
+            return None
+        sids.discard(skip_sid)
+        return len(sids)
+
+    def _send(self, event, data, rooms, skip_sid=None):
+        if not rooms:
+            self.stats['no_target'] += 1
+            return 0
+        deliveries = self._recipients(rooms, skip_sid)
+        if deliveries != 0:
+            self.socketio.emit(event, data, to=rooms, skip_sid=skip_sid)
+        deliveries = deliveries or 0
+        second = int(self._clock())
+        with self._lock:
+            self.stats['emits'] += 1
+            self.stats['deliveries'] += deliveries
+            self._events[event] += deliveries
+            if not self._per_second or self._per_second[-1][0] != second:
+                self._per_second.append([second, 0, 0])
+            self._per_second[-1][1] += 1
+            self._per_second[-1][2] += deliveries
+        return deliveries
+
+    def emit(self, event, data, stations=(), topics=(), all_stations=False, skip_sid=None):
+        """Send now to the rooms of `stations` and `topics`; returns the number of sockets reached"""
+        return self._send(event, data, self.rooms(stations, topics, all_stations), skip_sid)
+
+    def state(self, event, data, stations=(), topics=(), all_stations=False):
+        """Send a state event, coalescing bursts per (event, targets)"""
+        rooms = self.rooms(stations, topics, all_stations)
+        key = (event, tuple(rooms))
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None:
+                self.stats['coalesced'] += 1
+                window[1] = None if data == window[0] else data
+                return
+            timer = threading.Timer(self.coalesce_window, self._close_window, (key,))
+            timer.daemon = True
+            self._windows[key] = [data, None, timer]
+        self._send(event, data, rooms)
+        timer.start()
+
+    def _close_window(self, key):
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                return
+            pending = window[1]
+            if pending is None:
+                del self._windows[key]
+                return
+            timer = threading.Timer(self.coalesce_window, self._close_window, (key,))
+            timer.daemon = True
+            self._windows[key] = [pending, None, timer]
+        self._send(key[0], pending, list(key[1]))
+        timer.start()
+
+    def metrics(self):
+        now = int(self._clock())
+        with self._lock:
+            recent = [entry for entry in self._per_second if now - RATE_SECONDS <= entry[0] < now]
+            return dict(self.stats,
+                        emits_per_second=sum(entry[1] for entry in recent) / RATE_SECONDS,
+                        deliveries_per_second=sum(entry[2] for entry in recent) / RATE_SECONDS,
+                        deliveries_by_event=dict(self._events),
+                        open_windows=len(self._windows))
@@ -0,0 +1,138 @@
+import os
+import queue
+import threading
+import time
+
+# Station scripts call load_gpio() instead of importing RPi.GPIO directly.
+# PTS_GPIO=fake selects the in-process simulator for benchmarks and bench tests
+# on a machine without GPIO.
+GPIO_BACKEND_ENV = 'PTS_GPIO'
+
+_loaded = {}
+
+
+class FakeGPIO:
+    """
+    In-process stand-in for the subset of RPi.GPIO the station scripts use.
+
+    Inputs idle HIGH (the sensors are active low) and are driven with
+    set_input(). Edge callbacks run on one dispatcher thread, as RPi.GPIO's
+    do, and honour `bouncetime`. With record_outputs=True every output()
+    is logged as (monotonic time, pin, level) in `outputs`.
+    """
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, record_outputs=False, clock=time.monotonic):
+        self.record_outputs = record_outputs
+        self.outputs = []
+        self._clock = clock
+        self._levels = {}
+        self._detect = {}    # pin -> [edge, callbacks, bouncetime, last_fired]
+        self._lock = threading.Lock()
+        self._events = queue.Queue()
+        self._dispatcher = None
+
+    # RPi.GPIO API
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode, pull_up_down=None, initial=None):
+        with self._lock:
+            if mode == self.OUT:
+                self._levels[pin] = self.LOW if initial is None else initial
+            else:
+                self._levels.setdefault(pin, self.HIGH)
+
+    def input(self, pin):
+        return self._levels.get(pin, self.HIGH)
+
+    def output(self, pin, level):
+        self._levels[pin] = self.HIGH if level else self.LOW
+        if self.record_outputs:
+            self.outputs.append((self._clock(), pin, self._levels[pin]))
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        with self._lock:
+            if pin in self._detect:
+                raise RuntimeError(f"Conflicting edge detection already enabled for GPIO {pin}")
+            self._detect[pin] = [edge, [callback] if callback else [], (bouncetime or 0) / 1000.0, None]
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='fake-gpio-events', daemon=True)
+                self._dispatcher.start()
+
+    def add_event_callback(self, pin, callback):
+        with self._lock:
+            self._detect[pin][1].append(callback)
+
+    def remove_event_detect(self, pin):
+        with self._lock:
+            self._detect.pop(pin, None)
+
+    def cleanup(self, *pins):
+        with self._lock:
+            for pin in pins or list(self._detect):
+                self._detect.pop(pin, None)
+
+    # Simulation hooks
+
+    def set_input(self, pin, level):
+        """Drive an input pin; fires edge callbacks like the real kernel edge detector"""
+        level = self.HIGH if level else self.LOW
+        with self._lock:
+            previous = self._levels.get(pin, self.HIGH)
+            self._levels[pin] = level
+            detect = self._detect.get(pin)
+            if detect is None or previous == level:
+                return
+            edge = self.RISING if level == self.HIGH else self.FALLING
+            if detect[0] not in (edge, self.BOTH):
+                return
+            now = self._clock()
+            if detect[3] is not None and now - detect[3] < detect[2]:
+                return
+            detect[3] = now
+            callbacks = list(detect[1])
+        for callback in callbacks:
+            self._events.put((callback, pin))
+
+    def _dispatch(self):
+        while True:
+            callback, pin = self._events.get()
+            try:
+                callback(pin)
+            except Exception as e:
+                print(f"Fake GPIO callback for pin {pin} failed: {e}")
+
+
+def load_gpio(backend=None):
+    """
+    The GPIO module for this process: 'rpi' (RPi.GPIO, the default) or 'fake'.
+    Every caller gets the same instance, so a fake input driven by a
+    benchmark is seen by the station code too.
+    """
+    backend = (backend or os.environ.get(GPIO_BACKEND_ENV, 'rpi')).lower()
+    if backend not in _loaded:
+        if backend == 'rpi':
+            import RPi.GPIO as GPIO
+            _loaded[backend] = GPIO
+        elif backend == 'fake':
+            _loaded[backend] = FakeGPIO()
+        else:
+            raise ValueError(f"Unknown GPIO backend '{backend}' (expected 'rpi' or 'fake')")
+    return _loaded[backend]
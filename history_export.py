@@ -0,0 +1,76 @@
+import io
+import csv
+import json
+import zlib
+
+# Columns of an export, in CSV order (the keys of HistoryQuery rows)
+EXPORT_COLUMNS = ('task_id', 'from', 'to', 'priority', 'status', 'timestamp', 'date', 'time')
+
+# format -> (content type, file extension)
+EXPORT_FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+# Rows encoded per chunk handed to the WSGI server: big enough that the
+# per-chunk overhead vanishes, small enough that memory stays flat
+CHUNK_ROWS = 500
+GZIP_LEVEL = 6
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _csv_chunks(rows, chunk_rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in _batches(rows, chunk_rows):
+        writer.writerows([row[column] for column in EXPORT_COLUMNS] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _ndjson_chunks(rows, chunk_rows):
+    for batch in _batches(rows, chunk_rows):
+        yield ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in batch)
+
+
+def _json_chunks(rows, chunk_rows):
+    """One JSON array, written a batch at a time"""
+    separator = '['
+    for batch in _batches(rows, chunk_rows):
+        yield separator + ','.join(json.dumps(row, separators=(',', ':')) for row in batch)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+ENCODERS = {'json': _json_chunks, 'ndjson': _ndjson_chunks, 'csv': _csv_chunks}
+
+
+def encode_rows(rows, fmt, chunk_rows=CHUNK_ROWS):
+    """Bytes chunks of `rows` (an iterable of row dicts) in an EXPORT_FORMATS format"""
+    for chunk in ENCODERS[fmt](rows, chunk_rows):
+        yield chunk.encode()
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """Compress a stream of bytes chunks into one gzip member as it goes"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,134 @@
+import base64
+import binascii
+from datetime import datetime, timedelta
+
+from station_state import normalize_station_id
+
+# Every filter is an equality on an indexed column plus the (timestamp, task_id)
+# keyset, so a page is an index range scan no matter how long the history is.
+# task_id is the rowid, which every index already carries as its tiebreaker.
+HISTORY_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history (timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_history_sender ON history (sender, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_history_receiver ON history (receiver, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_history_status ON history (status, timestamp)',
+)
+
+# date/time as the history page shows them, formatted by SQLite instead of two strptime calls
+# per row ('%y' is missing from older SQLite builds, hence the substr of '%Y')
+HISTORY_COLUMNS = '''task_id, sender AS "from", receiver AS "to", priority, status, timestamp,
+                     COALESCE(strftime('%d/%m/', timestamp) || substr(strftime('%Y', timestamp), 3), '') AS date,
+                     COALESCE(strftime('%H:%M', timestamp), '') AS time'''
+
+ORDERS = {'desc': ('<', 'DESC'), 'asc': ('>', 'ASC')}
+
+DEFAULT_PAGE = 100
+MAX_PAGE = 1000
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def parse_timestamp(value, end=False):
+    """
+    'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM[:SS]' as a history timestamp string. A
+    bare date used as the end of a range means the end of that day.
+    """
+    value = value.strip().replace('T', ' ')
+    moment = datetime.fromisoformat(value)   # raises ValueError
+    if end and len(value) == 10:
+        moment += timedelta(days=1)
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+
+def encode_cursor(row):
+    return base64.urlsafe_b64encode(f"{row['timestamp']}|{row['task_id']}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, task_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return timestamp, int(task_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+
+
+class HistoryQuery:
+    """
+    Filtered, keyset-paginated reads of the dispatch history, newest first by
+    default. page() returns one page and the cursor of the next; rows() walks
+    the whole selection a page at a time for exports.
+
+    Filters: station (sender or receiver), sender, receiver, priority,
+    status (one or a list), since/until (history timestamp strings,
+    until exclusive).
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    @staticmethod
+    def init_schema(db):
+        for statement in HISTORY_INDEXES:
+            db.execute(statement)
+
+    @staticmethod
+    def _where(sender=None, receiver=None, priority=None, status=None, since=None, until=None):
+        clauses = []
+        params = []
+        for column, value in (('sender', sender), ('receiver', receiver)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(normalize_station_id(value))
+        if priority is not None:
+            clauses.append('priority = ?')
+            params.append(priority)
+        if status:
+            statuses = [status] if isinstance(status, str) else list(status)
+            clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params += statuses
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('timestamp < ?')
+            params.append(until)
+        return clauses, params
+
+    def _select(self, order, cursor, limit, station=None, **filters):
+        """SQL and parameters for one page"""
+        comparison, direction = ORDERS[order]
+        clauses, params = self._where(**filters)
+        if cursor:
+            clauses.append(f'(timestamp, task_id) {comparison} (?, ?)')
+            params += list(decode_cursor(cursor))
+        order_by = f'ORDER BY timestamp {direction}, task_id {direction} LIMIT ?'
+        if station is None:
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+            return f'SELECT {HISTORY_COLUMNS} FROM history {where} {order_by}', params + [limit]
+        # sender OR receiver would sort every row of the station; instead take the
+        # page from each index and sort the two pages
+        station = normalize_station_id(station)
+        sides = []
+        for column in ('sender', 'receiver'):
+            where = ' AND '.join([f'{column} = ?'] + clauses)
+            sides.append(f'SELECT * FROM (SELECT task_id FROM history WHERE {where} {order_by})')
+        return (f"SELECT {HISTORY_COLUMNS} FROM history WHERE task_id IN ({' UNION '.join(sides)}) {order_by}",
+                [station] + params + [limit] + [station] + params + [limit] + [limit])
+
+    def page(self, limit=DEFAULT_PAGE, cursor=None, order='desc', **filters):
+        """([row dicts], next cursor or None). Raises ValueError for a bad cursor or order."""
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order {order!r}")
+        limit = max(1, min(int(limit), MAX_PAGE))
+        sql, params = self._select(order, cursor, limit + 1, **filters)
+        rows = self.pool.get_db().execute(sql, params).fetchall()
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return [dict(row) for row in rows[:limit]], next_cursor
+
+    def rows(self, order='desc', batch=MAX_PAGE, **filters):
+        """Every matching row, fetched `batch` at a time"""
+        cursor = None
+        while True:
+            rows, cursor = self.page(limit=batch, cursor=cursor, order=order, **filters)
+            yield from rows
+            if cursor is None:
+                return
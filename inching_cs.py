@@ -1,7 +1,13 @@
-import RPi.GPIO as GPIO
 import time
 import json
 import sys
+import itertools
+from gpio_backend import load_gpio
+from motion_backend import load_motion, ramp, accelerate
+from sensor_monitor import SensorMonitor
+from motion_sequence import LOAD_TIMEOUT, MOVE_TIMEOUT
+
+GPIO = load_gpio()
 
 # GPIO Pin Assignments
 PUL = 16  # Motor Clock
@@ -23,6 +29,13 @@ STEP_DELAY = 0.0005  # Adjust step delay for speed
 STEP_COUNT = 5       # Steps per loop iteration
 REVOLUTION_STEPS = 300  # Adjust based on motor steps per revolution
 
+# Motion profiles, precomputed (half-period per step)
+SLOW_DELAY = STEP_DELAY * 4  # Half speed, for settling on a sensor
+RAMP_STEPS = 40
+SETTLE_REVOLUTION = ramp(STEP_DELAY, SLOW_DELAY, RAMP_STEPS) + (SLOW_DELAY,) * (REVOLUTION_STEPS - RAMP_STEPS)
+EXTRA_BACKWARD = (SLOW_DELAY,) * (REVOLUTION_STEPS // 2)
+LEAVE_SENSOR = ramp(SLOW_DELAY, STEP_DELAY, RAMP_STEPS)[:STEP_COUNT]
+
 # GPIO Setup
 GPIO.setmode(GPIO.BCM)
 GPIO.setwarnings(False)
@@ -37,45 +50,45 @@ for pin in [S1, S2, S3, S4, P1, P2, P3, P4]:
 # Enable Motor
 GPIO.output(ENA, GPIO.LOW)
 
+motor = load_motion(GPIO, PUL, DIR)
+
+# Debounced sensor state for the waits below; nothing is published from this script
+sensors = SensorMonitor(GPIO, lambda frame: None, pins={
+    "S1": S1, "S2": S2, "S3": S3, "S4": S4, "P1": P1, "P2": P2, "P3": P3, "P4": P4})
+
+def wait_sensor(predicate, timeout, what):
+    """Sleep until predicate(sensor state) holds; sensor state is True when a sensor reads LOW"""
+    if not sensors.wait_until(predicate, timeout):
+        raise TimeoutError(f"Timed out after {timeout}s waiting for {what}")
+
 def move_motor(direction, stop_sensor, count_max, slow_extra=False):
-    GPIO.output(DIR, direction)
+    def sensor_reached():
+        return GPIO.input(stop_sensor) == GPIO.LOW
+
+    motor.set_direction(direction)
     count = 0
    
     while count < count_max:
-        if GPIO.input(stop_sensor) == GPIO.LOW:
-            count += 1
-            if count == 1:
-                print("First sensor trigger - Continuing rotation for 1 revolution at half speed")
-                for _ in range(REVOLUTION_STEPS):  # 1 revolution
-                    GPIO.output(PUL, GPIO.HIGH)
-                    time.sleep(STEP_DELAY * 4)  # Half speed
-                    GPIO.output(PUL, GPIO.LOW)
-                    time.sleep(STEP_DELAY * 4)
-                print("Returning back to sensor position at half speed")
-                GPIO.output(DIR, not direction)
-                while GPIO.input(stop_sensor) == GPIO.HIGH:
-                    for _ in range(STEP_COUNT):
-                        GPIO.output(PUL, GPIO.HIGH)
-                        time.sleep(STEP_DELAY * 4)  # Half speed on return
-                        GPIO.output(PUL, GPIO.LOW)
-                        time.sleep(STEP_DELAY * 4)
-                GPIO.output(DIR, direction)  # Restore original direction
-            
-            if count == 2 and slow_extra:  # Additional Backward motion
-                print("Extra backward motion at even slower speed")
-                GPIO.output(DIR, not direction)
-                for _ in range(REVOLUTION_STEPS // 2):  # Half revolution
-                    GPIO.output(PUL, GPIO.HIGH)
-                    time.sleep(STEP_DELAY * 4)  # Slower speed
-                    GPIO.output(PUL, GPIO.LOW)
-                    time.sleep(STEP_DELAY * 4)
-                GPIO.output(DIR, direction)  # Restore original direction
+        if not sensor_reached():
+            motor.run_until(sensor_reached, accelerate(STEP_DELAY, SLOW_DELAY, RAMP_STEPS), check_every=STEP_COUNT)
+            continue
+
+        count += 1
+        if count == 1:
+            print("First sensor trigger - Continuing rotation for 1 revolution at half speed")
+            motor.run(SETTLE_REVOLUTION)  # 1 revolution, decelerating to half speed
+            print("Returning back to sensor position at half speed")
+            motor.set_direction(not direction)
+            motor.run_until(sensor_reached, itertools.repeat(SLOW_DELAY), check_every=STEP_COUNT)
+            motor.set_direction(direction)  # Restore original direction
+        
+        if count == 2 and slow_extra:  # Additional Backward motion
+            print("Extra backward motion at even slower speed")
+            motor.set_direction(not direction)
+            motor.run(EXTRA_BACKWARD)  # Half revolution
+            motor.set_direction(direction)  # Restore original direction
             
-        for _ in range(STEP_COUNT):
-            GPIO.output(PUL, GPIO.HIGH)
-            time.sleep(STEP_DELAY)
-            GPIO.output(PUL, GPIO.LOW)
-            time.sleep(STEP_DELAY)
+        motor.run(LEAVE_SENSOR)
 
 def send_capsule():
     print("Send process started")
@@ -83,8 +96,7 @@ def send_capsule():
     
     status_updates.append({"status": "sending", "message": "Send process started", "sensors": get_sensor_status()})
     
-    while GPIO.input(P1) == GPIO.LOW:
-        pass
+    wait_sensor(lambda state: not state["P1"], LOAD_TIMEOUT, "capsule at P1")
     status_updates.append({"status": "sending", "message": "Capsule detected at P1", "sensors": get_sensor_status()})
     print("Capsule detected at P1")
     
@@ -92,20 +104,17 @@ def send_capsule():
     status_updates.append({"status": "sending", "message": "Capsule dropped at target position", "sensors": get_sensor_status()})
     print("Capsule dropped at target position")
     
-    while GPIO.input(P1) == GPIO.HIGH or GPIO.input(P2) == GPIO.LOW:
-        pass
+    wait_sensor(lambda state: state["P1"] and not state["P2"], MOVE_TIMEOUT, "capsule at P2")
     status_updates.append({"status": "sending", "message": "Capsule moved to P2 position", "sensors": get_sensor_status()})
     print("Capsule moved to P2 position")
     
     move_motor(GPIO.HIGH, S2, 3, slow_extra=True)
-    while GPIO.input(P3) == GPIO.LOW:
-        pass
+    wait_sensor(lambda state: not state["P3"], MOVE_TIMEOUT, "capsule at P3")
     move_motor(GPIO.LOW, S3, 2)
     status_updates.append({"status": "sending", "message": "Relay ON", "sensors": get_sensor_status()})
     print("Relay ON")
     GPIO.output(RELAY_PIN, GPIO.HIGH)
-    while GPIO.input(P4) == GPIO.LOW:
-        pass
+    wait_sensor(lambda state: not state["P4"], MOVE_TIMEOUT, "capsule at P4")
     move_motor(GPIO.HIGH, S4, 3, slow_extra=True)
     GPIO.output(RELAY_PIN, GPIO.LOW)
     status_updates.append({"status": "sending", "message": "Relay OFF", "sensors": get_sensor_status()})
@@ -125,16 +134,14 @@ def receive_capsule():
     
     status_updates.append({"status": "receiving", "message": "Receive process started", "sensors": get_sensor_status()})
     
-    while GPIO.input(P3) == GPIO.LOW:
-        pass
+    wait_sensor(lambda state: not state["P3"], LOAD_TIMEOUT, "package at P3")
     status_updates.append({"status": "receiving", "message": "Package detected at P3", "sensors": get_sensor_status()})
     
     move_motor(GPIO.LOW, S3, 3)
     status_updates.append({"status": "receiving", "message": "SUCTION HIGH - Capsule Picked", "sensors": get_sensor_status()})
     print("SUCTION HIGH - Capsule Picked")
     
-    while GPIO.input(P4) == GPIO.LOW:
-        pass
+    wait_sensor(lambda state: not state["P4"], MOVE_TIMEOUT, "capsule at P4")
     
     move_motor(GPIO.HIGH, S4, 3, slow_extra=True)
     status_updates.append({"status": "receiving", "message": "Moving capsule to final position", "sensors": get_sensor_status()})
@@ -170,6 +177,7 @@ def main():
         
         params = json.loads(sys.argv[1])
         mode = params.get('mode', '')
+        sensors.start()
         
         if mode == 'send':
             result = send_capsule()
@@ -199,5 +207,6 @@ if __name__ == "__main__":
         result = main()
         sys.exit(0 if result and result.get("status") == "success" else 1)
     finally:
+        sensors.stop()
         GPIO.output(ENA, GPIO.HIGH)  # Disable motor
         GPIO.cleanup()
\ No newline at end of file
@@ -1,11 +1,21 @@
 if(1):
-    import RPi.GPIO as GPIO
     import time
     import paho.mqtt.client as mqtt
     import json
     import threading
     import socket
     import os
+    from gpio_backend import load_gpio
+    from sensor_monitor import SensorMonitor
+    from motion_backend import load_motion, ramp, accelerate, MotionHalted
+    from motion_sequence import (SequenceEngine, Step, OperationAborted, compact_trace, join,
+                                 LOAD_TIMEOUT, MOVE_TIMEOUT, ARRIVAL_TIMEOUT)
+    from sensor_codec import FORMAT_JSON, FORMAT_BINARY, SEQ_MASK, encode_binary
+    import itertools
+    import functools
+
+    # RPi.GPIO on the station, PTS_GPIO=fake to run on a plain Linux box
+    GPIO = load_gpio()
 
     #  GPIO Pin Assignments
     PUL = 16  # Motor Clock
@@ -22,6 +32,8 @@ if(1):
     P3 = 27
     P4 = 22
 
+    SENSOR_PINS = {"S1": S1, "S2": S2, "S3": S3, "S4": S4, "P1": P1, "P2": P2, "P3": P3, "P4": P4}
+
     #Blow parameter 
     pump = "s"
 
@@ -31,6 +43,16 @@ if(1):
     REVOLUTION_STEPS = 300
 
     MTN_STEP_COUNT = 50
+    MTN_STEP_DELAY = 0.0005
+
+    # Motion profiles, precomputed (half-period per step)
+    SLOW_DELAY = STEP_DELAY * 4       # settling and homing speed
+    RAMP_STEPS = 40                   # SLOW_DELAY <-> STEP_DELAY
+    SETTLE_REVOLUTION = ramp(STEP_DELAY, SLOW_DELAY, RAMP_STEPS) + (SLOW_DELAY,) * (REVOLUTION_STEPS - RAMP_STEPS)
+    EXTRA_BACKWARD = (SLOW_DELAY,) * (REVOLUTION_STEPS // 2)
+    LEAVE_SENSOR = ramp(SLOW_DELAY, STEP_DELAY, RAMP_STEPS)[:STEP_COUNT]
+    JOG = (MTN_STEP_DELAY,) * MTN_STEP_COUNT
+
     # MQTT Configuration 
     BROKER_IP = "192.168.90.200"
     PORT = 1883
@@ -59,15 +81,27 @@ if(1):
 
     # Topics to publish to
     SENSOR_DATA_TOPIC = f"{mqtt_topic_base}SENSORDATA/{STATION_NUM}"
+    # Broker -> station: which frame format to publish sensor data in
+    SENSOR_FORMAT_TOPIC = f"{SENSOR_DATA_TOPIC}/format"
+    # Broker -> station: frames were lost, republish the current one
+    SENSOR_SYNC_TOPIC = f"{SENSOR_DATA_TOPIC}/sync"
     ACK_TOPIC = f"{mqtt_topic_base}ACK/{STATION_NUM}"
+    # Final step trace of every operation run for a dispatch, for the broker's profiler
+    TRACE_TOPIC = f"{mqtt_topic_base}TRACE/{STATION_NUM}"
     BLOWER_TOPIC = f"{mqtt_topic_base}blower"
 
     # ===== System State =====
-    current_task_id = None
     current_dispatch_mode = None  # 'send' or 'receive'
-    system_busy = False
-    sensor_data_thread = None
     sensor_data_running = False
+    # Frame formats offered to the broker in the online status; JSON until it picks one
+    SENSOR_FORMATS = (FORMAT_BINARY, FORMAT_JSON)
+    sensor_format = FORMAT_JSON
+    # Every frame is numbered; the heartbeat carries the last number so the broker sees lost frames
+    sensor_seq = itertools.count(1)
+    # New on every start: numbering restarts with it, and the broker resets its baseline when it changes
+    BOOT_ID = os.urandom(4).hex()
+    last_sensor_seq = None
+    sensor_publish_lock = threading.Lock()   # frames leave in sequence order
     heartbeat_thread = None
     heartbeat_running = False
 
@@ -86,6 +120,24 @@ if(1):
     # Enable the motor
     GPIO.output(ENA, GPIO.LOW)
 
+    # Single command executor: runs send/receive/self-test/passthrough/jog operations
+    # one at a time, at most COMMAND_QUEUE_DEPTH waiting behind the running one
+    COMMAND_QUEUE_DEPTH = 2
+    # The broker sends one dispatch on several topics; repeats within this window are the same command
+    DUPLICATE_WINDOW = 2.0
+    sequencer = SequenceEngine(
+        on_trace=lambda operation, trace: trace_finished(operation, trace),
+        on_error=lambda operation, step, error: operation_failed(operation, step, error),
+        on_finish=lambda operation: operation_finished(operation),
+        max_pending=COMMAND_QUEUE_DEPTH)
+
+    # Step pulse generator: pigpio waves when pigpiod runs, else busywait; PTS_MOTION overrides it.
+    # A stop command sets the sequencer's abort event, which halts the motor mid-move.
+    motor = load_motion(GPIO, PUL, DIR, halt=sequencer.aborted)
+
+    # Debounced sensor state: publishes changed frames and wakes wait_sensor() callers
+    sensor_monitor = SensorMonitor(GPIO, lambda frame: publish_sensor_frame(frame), pins=SENSOR_PINS)
+
     # ===== MQTT Client Setup =====
     client = mqtt.Client(client_id=CLIENT_ID)
     client.username_pw_set(username,password)
@@ -127,23 +179,48 @@ def publish_message(topic, message, qos=1, retain=False, max_retries=3):
     log(f"ERROR: Failed to publish to {topic} after {max_retries} attempts")
     return False
 
-def publish_sensor_data():
-        """Publish sensor data to MQTT broker only when data changes"""
-        global sensor_data_running
-        previous_sensors = None
+def publish_sensor_frame(frame):
+    """Send a changed sensor frame while connected to the broker, numbered, in the negotiated format"""
+    global last_sensor_seq
+    if not sensor_data_running:
+        return
+    with sensor_publish_lock:
+        seq = next(sensor_seq) & SEQ_MASK
+        if sensor_format == FORMAT_BINARY:
+            frame = encode_binary(frame, seq, time.monotonic() * 1000)
+        else:
+            frame["seq"] = seq
+        publish_message(SENSOR_DATA_TOPIC, frame, qos=0, retain=False)
+        last_sensor_seq = seq
 
-        while sensor_data_running:
-            try:
-                sensors = read_sensors()
+def publish_sensor_data():
+    """
+    Frames go out only when a debounced sensor level changes; on (re)connect
+    the current frame is sent so the broker is in sync.
+    """
+    if sensor_monitor.sampling:
+        log("Edge detection unavailable, sampling sensors instead")
+    publish_sensor_frame(sensor_monitor.frame())
 
-                if sensors != previous_sensors:
-                    publish_message(SENSOR_DATA_TOPIC, sensors, qos=0, retain=False)
-                    previous_sensors = sensors
+class SensorTimeout(Exception):
+    pass
 
-            except Exception as e:
-                log(f"Error publishing sensor data: {e}")
-            
-            time.sleep(0.05)  # Small delay to avoid busy loop (adjust as needed)
+def wait_sensor(sensor, level, timeout):
+    """
+    Block (no polling) until `sensor` reads GPIO `level`; raises SensorTimeout,
+    or OperationAborted when a stop command comes in meanwhile
+    """
+    active = level == GPIO.LOW
+    aborted = sequencer.aborted
+    if not sensor_monitor.wait_until(lambda state: state[sensor] == active or aborted.is_set(), timeout):
+        raise SensorTimeout(f"{sensor} did not read {'HIGH' if level else 'LOW'} within {timeout}s")
+    if aborted.is_set():
+        raise OperationAborted(sequencer.abort_reason)
+
+def pause(seconds):
+    """time.sleep that a stop command cuts short"""
+    if sequencer.aborted.wait(seconds):
+        raise OperationAborted(sequencer.abort_reason)
 
 def publish_heartbeat():
     """Publish heartbeat to broker to indicate the station is online"""
@@ -151,9 +228,15 @@ def publish_heartbeat():
     
     while heartbeat_running:
         try:
+            # Read after the frame it numbers has gone out, not while it is being published
+            with sensor_publish_lock:
+                sensor_seq = last_sensor_seq
             heartbeat_data = {
                 "node": STATION_NAME,
                 "status": "online",
+                "executor": sequencer.stats(),
+                "sensor_seq": sensor_seq,
+                "boot_id": BOOT_ID,
                 "timestamp": time.time()
             }
             publish_message(f"{mqtt_topic_base}HEARTBEAT/{STATION_NAME}", heartbeat_data, qos=0)
@@ -172,330 +255,256 @@ def move_motor(direction, stop_sensor, count_max, slow_extra=False):
         count_max: Number of times sensor should be triggered
         slow_extra: If True, perform extra slow movement
     """
-    GPIO.output(DIR, direction)
+    def sensor_reached():
+        return GPIO.input(stop_sensor) == GPIO.LOW
+
+    motor.set_direction(direction)
     count = 0
 
     while count < count_max:
-        if GPIO.input(stop_sensor) == GPIO.LOW:
-            count += 1
-            if count == 1:
-                #log(f"Sensor {stop_sensor} triggered - 1 revolution at half speed")
-                for _ in range(REVOLUTION_STEPS):
-                    GPIO.output(PUL, GPIO.HIGH)
-                    time.sleep(STEP_DELAY * 4)
-                    GPIO.output(PUL, GPIO.LOW)
-                    time.sleep(STEP_DELAY * 4)
-                
-                log("Reversing to sensor position")
-                GPIO.output(DIR, not direction)
-                while GPIO.input(stop_sensor) == GPIO.HIGH:
-                    for _ in range(STEP_COUNT):
-                        GPIO.output(PUL, GPIO.HIGH)
-                        time.sleep(STEP_DELAY * 4)
-                        GPIO.output(PUL, GPIO.LOW)
-                        time.sleep(STEP_DELAY * 4)
-                
-                GPIO.output(DIR, direction)
+        if not sensor_reached():
+            # Accelerate to full speed, checking the sensor every STEP_COUNT steps
+            motor.run_until(sensor_reached, accelerate(STEP_DELAY, SLOW_DELAY, RAMP_STEPS), check_every=STEP_COUNT)
+            continue
+
+        count += 1
+        if count == 1:
+            #log(f"Sensor {stop_sensor} triggered - 1 revolution at half speed")
+            motor.run(SETTLE_REVOLUTION)
             
-            if count == 2 and slow_extra:
-                log("Extra backward motion")
-                GPIO.output(DIR, not direction)
-                for _ in range(REVOLUTION_STEPS // 2):
-                    GPIO.output(PUL, GPIO.HIGH)
-                    time.sleep(STEP_DELAY * 4)
-                    GPIO.output(PUL, GPIO.LOW)
-                    time.sleep(STEP_DELAY * 4)
-                
-                GPIO.output(DIR, direction)
-
-        for _ in range(STEP_COUNT):
-            GPIO.output(PUL, GPIO.HIGH)
-            time.sleep(STEP_DELAY)
-            GPIO.output(PUL, GPIO.LOW)
-            time.sleep(STEP_DELAY)
-
-def send_capsule():
-    """Execute sending capsule procedure"""
-    global system_busy, current_task_id
-    
-    system_busy = True
-    log("Starting SEND procedure")
-    
-    # Notify system that we're beginning the send procedure
-    ack_data = {
-        "station": STATION_NAME,
-        "status": "sending",
-        "task_id": current_task_id,
-        "timestamp": time.time()
-    }
-    publish_message(ACK_TOPIC, ack_data)
-    
-    # Wait for capsule at P1
-    log("Waiting for capsule at P1...")
-    while GPIO.input(P1) == GPIO.LOW:  # Wait until sensor is triggered (LOW)
-        time.sleep(0.1)
-    
-    log("Capsule detected at P1")
-    
-    # Drop capsule
-    move_motor(GPIO.LOW, S1, 2)
-    log("Capsule dropped")
-    
-    # Wait for capsule at P2
-    while GPIO.input(P2) == GPIO.LOW:  # Wait until sensor is triggered (LOW)
-        time.sleep(0.1)
-    log("Capsule at P2")
-    
-    # Move to P3
-    move_motor(GPIO.HIGH, S2, 3, slow_extra=True)
-    
-    # Wait for capsule at P3
-    while GPIO.input(P3) == GPIO.LOW:  # Wait until sensor is triggered (LOW)
-        time.sleep(0.1)
-    log("Capsule at P3, activating blower")
-    
-    # Activate blower
-    publish_message(BLOWER_TOPIC, pump)
-    
-    # Notify system that sending is complete
-    completion_data = {
-        "type": "dispatch_completed",
-        "station": STATION_NAME,
-        "task_id": current_task_id,
-        "status": "completed",
-        "timestamp": time.time(),
-        "details": {
-            "operation": "send",
-            "sensors": read_sensors()
-        }
-    }
-    #publish_message(ACK_TOPIC, completion_data)
-    
-    log("Send procedure complete")
-    system_busy = False
-    current_task_id = None
+            log("Reversing to sensor position")
+            motor.set_direction(not direction)
+            motor.run_until(sensor_reached, itertools.repeat(SLOW_DELAY), check_every=STEP_COUNT)
+            motor.set_direction(direction)
+        
+        if count == 2 and slow_extra:
+            log("Extra backward motion")
+            motor.set_direction(not direction)
+            motor.run(EXTRA_BACKWARD)
+            motor.set_direction(direction)
 
-def receive_capsule():
-    """Execute receiving capsule procedure"""
-    global system_busy, current_task_id
-    
-    system_busy = True
-    log("Starting RECEIVE procedure")
-    
-    # Notify system that we're beginning the receive procedure
-    ack_data = {
-        "station": STATION_NAME,
-        "status": "receiving",
-        "task_id": current_task_id,
-        "timestamp": time.time()
-    }
-    publish_message(ACK_TOPIC, ack_data)
-    
-    # Wait for capsule at P3
-    log("Waiting for capsule at P3...")
-    while GPIO.input(P3) == GPIO.LOW:  # Wait until sensor is triggered (LOW)
-        time.sleep(0.1)
-    log("Capsule detected at P3")
-    publish_message(BLOWER_TOPIC, "stop")
-    log("Blower OFF")
-    
-    # Move motor to receive position
-    move_motor(GPIO.LOW, S3, 3)
-    
-    # Activate blower in suction mode
-    publish_message(BLOWER_TOPIC, pump)
-    time.sleep(0.2)
-    log("Blower SUCTION, capsule picked")
-    
-    # Wait for capsule at P4
-    while GPIO.input(P4) == GPIO.LOW:  # Wait until sensor is triggered (LOW)
-        time.sleep(0.1)
-    log("Capsule at P4")
-    
-    # Turn off blower
-    publish_message(BLOWER_TOPIC, "stop")
-    log("Blower OFF")
-    
-    # Move to final position
-    move_motor(GPIO.HIGH, S4, 3, slow_extra=True)
-    time.sleep(2)
-    log("Capsule received")
-    
-    # Reset position
-    move_motor(GPIO.LOW, S2, 1)
-    log("Reset complete")
-    
-    # Notify system that receiving is complete
-    completion_data = {
-        "type": "receive_completed",
-        "station": STATION_NAME,
-        "task_id": current_task_id,
-        "status": "completed",
-        "timestamp": time.time(),
-        "details": {
-            "operation": "receive",
-            "sensors": read_sensors()
-        }
-    }
-    publish_message(ACK_TOPIC, completion_data)
-    
-    log("Receive procedure complete")
-    system_busy = False
-    current_task_id = None
+        motor.run(LEAVE_SENSOR)
 
-def self_capsule():
-    """Execute Self test procedure"""
-    global system_busy, current_task_id
-    
-    system_busy = True
-    log("Starting SELF TEST procedure")
-    
-    # Notify system that we're beginning the send procedure
-    ack_data = {
-        "station": STATION_NAME,
-        "status": "SELF_TEST",
-        "task_id": current_task_id,
-        "timestamp": time.time()
-    }
-    publish_message(ACK_TOPIC, ack_data)
-    
-    # Wait for capsule at P1
-    log("Waiting for capsule at P1...")
-    while GPIO.input(P1) == GPIO.LOW:  # Wait until sensor is triggered (LOW)
-        time.sleep(0.1)
-    
-    log("Capsule detected at P1")
-    
-    # Drop capsule
-    move_motor(GPIO.LOW, S1, 2)
-    log("Capsule dropped")
-    
-    # Wait for capsule at P2
-    while GPIO.input(P2) == GPIO.LOW:  # Wait until sensor is triggered (LOW)
-        time.sleep(0.1)
-    log("Capsule at P2")
-    
-    # Move to P3
-    move_motor(GPIO.HIGH, S2, 3, slow_extra=True)
-    log("Capsule at p3")
-    
-    # Wait for capsule at P3
-    while GPIO.input(P3) == GPIO.LOW:  # Wait until sensor is triggered (LOW)
-        time.sleep(0.1)
-    log("Capsule at P3, moving to recive sequence")
-    move_motor(GPIO.LOW, S3, 2)
-    log("Blower on")
-    # Activate blower
-    publish_message(BLOWER_TOPIC, pump)
-    
-    # Wait for capsule at P4
-    while GPIO.input(P4) == GPIO.LOW:  # Wait until sensor is triggered (LOW)
-        time.sleep(0.1)
-    log("Capsule at P4")
-    
-    # Turn off blower
-    publish_message(BLOWER_TOPIC, "stop")
-    log("Blower OFF")
-    
-    # Move to final position
-    move_motor(GPIO.HIGH, S4, 3, slow_extra=True)
-    time.sleep(2)
-    log("Capsule received")
-    
-    # Reset position
-    move_motor(GPIO.LOW, S2, 1)
-    log("Reset complete")
+# ===== Motion Sequences =====
+# Each operation is a list of steps run by the sequence engine's executor thread.
+def move_step(name, direction, stop_sensor, count_max, slow_extra=False, overlap=False):
+    return Step(name, "move", lambda ctx: move_motor(direction, stop_sensor, count_max, slow_extra), overlap)
 
-    
-    # Notify system that sending is complete
-    completion_data = {
-        "type": "SELF_TEST_completed",
-        "station": STATION_NAME,
-        "task_id": current_task_id,
-        "status": "completed",
-        "timestamp": time.time(),
-        "details": {
-            "operation": "SELF_TEST",
-            "sensors": read_sensors()
-        }
-    }
-    publish_message(ACK_TOPIC, completion_data)
-    
-    log("Send procedure complete")
-    system_busy = False
-    current_task_id = None
+def wait_step(sensor, timeout):
+    return Step(f"wait_{sensor}", "wait", lambda ctx: wait_sensor(sensor, GPIO.HIGH, timeout))
 
-def passthrough():
+def blower_step(command):
+    name = "blower_on" if command == pump else f"blower_{command}"
+    return Step(name, "blower", lambda ctx: publish_message(BLOWER_TOPIC, command))
 
-    global system_busy, current_task_id
-    
-    system_busy = True
-    log("Starting passthrough procedure")
+def pause_step(name, seconds):
+    return Step(name, "pause", lambda ctx: pause(seconds))
 
-    # Notify system that we're beginning the passthrough procedure
-    ack_data = {
-        "station": STATION_NAME,
-        "status": "passthrough",
-        "task_id": current_task_id,
-        "timestamp": time.time()
-    }
-    publish_message(ACK_TOPIC, ack_data)
+def ack_step(status, ack_type=None, operation=None):
+    """Progress ACK; with an operation it is the completion ACK and carries the sensors and step trace"""
+    def publish(ctx):
+        ack_data = {
+            "station": STATION_NAME,
+            "status": status,
+            "task_id": ctx.get("task_id"),
+            "timestamp": time.time()
+        }
+        if ack_type:
+            ack_data["type"] = ack_type
+        if operation:
+            ack_data["details"] = {
+                "operation": operation,
+                "sensors": read_sensors(),
+                "trace": compact_trace(ctx["trace"])
+            }
+        publish_message(ACK_TOPIC, ack_data)
+    return Step(f"ack_{status}", "ack", publish)
 
+def pre_index(ctx):
+    """Bring the carrier back to S2 (where receive and self-test leave it at S4)"""
     if GPIO.input(S2) == GPIO.HIGH:
+        move_motor(GPIO.LOW, S2, 1)
 
-        log("[passthrough] Starting passthrough")
+def pre_index_step(overlap=True):
+    return Step("pre_index", "move", pre_index, overlap)
 
+def index_passthrough(ctx):
+    if GPIO.input(S2) == GPIO.HIGH:
         move_motor(GPIO.LOW, S1, 2, slow_extra=False)
-
-        log("[passthrough] system in s1 state")
-
         move_motor(GPIO.HIGH, S2, 3, slow_extra=False)
 
-        log("[passthrough] system in passthrough state")
-
-        
+# Operations leave the carrier where they finish; the next one pre-indexes it
+# back to S2 in the background while it waits for the pod, so the return move
+# is off the cycle time instead of delaying every completion.
+SEND_SEQUENCE = [
+    ack_step("sending"),
+    pre_index_step(),
+    wait_step("P1", LOAD_TIMEOUT),                        # capsule loaded
+    join("carrier_ready"),
+    move_step("drop_capsule", GPIO.LOW, S1, 2),
+    wait_step("P2", MOVE_TIMEOUT),
+    move_step("to_p3", GPIO.HIGH, S2, 3, slow_extra=True),
+    wait_step("P3", MOVE_TIMEOUT),
+    blower_step(pump),
+    # The pod has left; the broker's watchdog times the transit from here
+    ack_step("sent", "send_completed", "send"),
+]
+
+RECEIVE_SEQUENCE = [
+    ack_step("receiving"),
+    pre_index_step(),                                     # while the sender's blower drives the pod
+    wait_step("P3", ARRIVAL_TIMEOUT),
+    blower_step("stop"),
+    ack_step("arrived"),
+    join("carrier_ready"),
+    move_step("to_receive_position", GPIO.LOW, S3, 3),
+    blower_step(pump),                                    # suction picks the capsule
+    pause_step("suction", 0.2),
+    wait_step("P4", MOVE_TIMEOUT),
+    blower_step("stop"),
+    move_step("to_final_position", GPIO.HIGH, S4, 3, slow_extra=True),
+    pause_step("deliver", 2),
+    ack_step("completed", "receive_completed", "receive"),
+]
+
+SELF_TEST_SEQUENCE = [
+    ack_step("SELF_TEST"),
+    pre_index_step(),
+    wait_step("P1", LOAD_TIMEOUT),
+    join("carrier_ready"),
+    move_step("drop_capsule", GPIO.LOW, S1, 2),
+    wait_step("P2", MOVE_TIMEOUT),
+    move_step("to_p3", GPIO.HIGH, S2, 3, slow_extra=True),
+    wait_step("P3", MOVE_TIMEOUT),
+    move_step("to_receive_position", GPIO.LOW, S3, 2),
+    blower_step(pump),
+    wait_step("P4", MOVE_TIMEOUT),
+    blower_step("stop"),
+    move_step("to_final_position", GPIO.HIGH, S4, 3, slow_extra=True),
+    pause_step("deliver", 2),
+    ack_step("completed", "SELF_TEST_completed", "SELF_TEST"),
+]
+
+PASSTHROUGH_SEQUENCE = [
+    ack_step("passthrough"),
+    pre_index_step(overlap=False),
+    Step("index_passthrough", "move", index_passthrough),
+    ack_step("completed", "passthrough", "passthrough"),
+]
+
+# Operations that may leave the blower running when they abort
+BLOWER_OPERATIONS = ("receive", "self_test")
 
-    else:
-
-        print("[passthrough] system in passthrough state")
+# ===== MQTT MTN Helper Functions =====
+def move_left():
+    motor.set_direction(GPIO.LOW)  # Set direction
+    motor.run(JOG)
 
-        # Notify system that passthrough is complete
-    completion_data = {
-        "type": "passthrough",
+def move_right():
+    motor.set_direction(GPIO.HIGH)  # Set direction
+    motor.run(JOG)
+
+# Operation name -> steps. Jogs only start on an idle station, the rest queue.
+OPERATIONS = {
+    "send": SEND_SEQUENCE,
+    "receive": RECEIVE_SEQUENCE,
+    "self_test": SELF_TEST_SEQUENCE,
+    "passthrough": PASSTHROUGH_SEQUENCE,
+    "moveLeft": [Step("moveLeft", "move", lambda ctx: move_left())],
+    "moveRight": [Step("moveRight", "move", lambda ctx: move_right())],
+}
+JOG_OPERATIONS = ("moveLeft", "moveRight")
+
+def reply(command, status, task_id=None, **details):
+    """Tell the broker what became of a command: accepted, queued or rejected"""
+    message = {
+        "type": "command",
         "station": STATION_NAME,
-        "task_id": current_task_id,
-        "status": "completed",
-        "timestamp": time.time(),
-        "details": {
-            "operation": "passthrough",
-            "sensors": read_sensors()
-        }
+        "command": command,
+        "status": status,
+        "task_id": task_id,
+        "pending": sequencer.pending(),
+        "timestamp": time.time()
     }
-    publish_message(ACK_TOPIC, completion_data)
-    
-    log("Receive procedure complete")
-    system_busy = False
-    current_task_id = None
-
+    message.update(details)
+    publish_message(ACK_TOPIC, message)
+    return status
 
-# ===== MQTT MTN Helper Functions =====
-def move_left():
-    GPIO.output(DIR, GPIO.LOW)  # Set direction
+def run_operation(command, operation, task_id=None, received_at=None):
+    """
+    Hand an operation to the executor and reply with the outcome. Runs on
+    the MQTT thread, so it only queues; the motion happens on the executor.
+    """
+    existing = sequencer.find(operation)
+    if (existing is not None and (task_id is None or existing.context.get("task_id") in (None, task_id))
+            and (received_at or time.perf_counter()) - existing.received_at < DUPLICATE_WINDOW):
+        if task_id is not None:
+            existing.context["task_id"] = task_id
+        return reply(command, "accepted", task_id, operation=operation, duplicate=True)
+
+    if operation in JOG_OPERATIONS and sequencer.busy():
+        log(f"System busy, rejecting {operation}")
+        return reply(command, "rejected", task_id, operation=operation, reason="busy")
+
+    status = sequencer.submit(operation, OPERATIONS[operation], {"task_id": task_id}, received_at)
+    if status == "rejected":
+        log(f"Command queue full, rejecting {operation}")
+        return reply(command, status, task_id, operation=operation, reason="queue full")
+    log(f"{'Starting' if status == 'accepted' else 'Queued'} {operation.upper()} procedure")
+    return reply(command, status, task_id, operation=operation)
+
+def stop_operations(command):
+    """Preempt the running operation and drop the queued ones"""
+    preempted, cancelled = sequencer.abort("stopped by operator")
+    sensor_monitor.interrupt()
+    log(f"STOP: preempted {preempted or 'nothing'}, cancelled {len(cancelled)} queued")
+    for operation in cancelled:
+        operation_failed(operation, None, "cancelled by stop")
+    return reply(command, "accepted", preempted=preempted,
+                 cancelled=[operation.name for operation in cancelled])
+
+def operation_failed(operation, step, error):
+    """A step raised (a SensorTimeout, or a stop): stop safely and report it"""
+    if isinstance(error, MotionHalted):
+        error = sequencer.abort_reason or error
+    log(f"{operation.name.upper()} procedure aborted at {step}: {error}")
+    if operation.name in BLOWER_OPERATIONS:
+        publish_message(BLOWER_TOPIC, "stop")
+    details = {"operation": operation.name}
+    if "trace" in operation.context:
+        details["trace"] = compact_trace(operation.context["trace"])
+    publish_message(ACK_TOPIC, {
+        "type": f"{operation.name}_failed",
+        "station": STATION_NAME,
+        "task_id": operation.context.get("task_id"),
+        "status": "failed",
+        "operation": operation.name,
+        "reason": str(error),
+        "timestamp": time.time(),
+        "details": details
+    })
 
-    for _ in range(MTN_STEP_COUNT):
-        GPIO.output(PUL, GPIO.HIGH)
-        time.sleep(0.0005)  # Small delay for step pulse
-        GPIO.output(PUL, GPIO.LOW)
-        time.sleep(0.0005)
+def operation_finished(operation):
+    log(f"{operation.name.upper()} procedure complete")
 
-def move_right():
-    GPIO.output(DIR, GPIO.HIGH)  # Set direction
+def trace_finished(operation, trace):
+    """
+    The ACKs carry the trace as it stood when they went out; once the
+    operation is over the complete one replaces it on the broker
+    """
+    log_trace(trace)
+    task_id = operation.context.get("task_id")
+    if task_id is not None:
+        publish_message(TRACE_TOPIC, {
+            "station": STATION_NAME,
+            "task_id": task_id,
+            "trace": compact_trace(trace),
+            "timestamp": time.time()
+        })
 
-    for _ in range(MTN_STEP_COUNT):
-        GPIO.output(PUL, GPIO.HIGH)
-        time.sleep(0.0005)  # Small delay for step pulse
-        GPIO.output(PUL, GPIO.LOW)
-        time.sleep(0.0005)
+def log_trace(trace):
+    steps = ", ".join(f"{s['step']} {s.get('ms', 0):.0f}" + ("*" if s.get('overlap') else "") for s in trace['steps'])
+    log(f"Trace {trace['operation']} ({trace['total_ms']:.0f} ms, queued {trace['queued_ms']:.0f} ms): {steps}")
 
 # ===== MQTT Callback Functions =====
 def on_connect(client, userdata, flags, rc):
@@ -508,24 +517,31 @@ def on_connect(client, userdata, flags, rc):
         client.subscribe(DISPATCH_TOPIC)
         client.subscribe(STATUS_TOPIC)
         client.subscribe(MTN_TOPIC)
+        client.subscribe(SENSOR_FORMAT_TOPIC)
+        client.subscribe(SENSOR_SYNC_TOPIC)
+        
+        log(f"Subscribed to topics: {ACTION_TOPIC}, {SCRIPT_TOPIC}, {DISPATCH_TOPIC}, {STATUS_TOPIC}, {MTN_TOPIC}, "
+            f"{SENSOR_FORMAT_TOPIC}, {SENSOR_SYNC_TOPIC}")
         
-        log(f"Subscribed to topics: {ACTION_TOPIC}, {SCRIPT_TOPIC}, {DISPATCH_TOPIC}, {STATUS_TOPIC}, {MTN_TOPIC}")
+        # JSON until this broker asks for something else
+        global sensor_format
+        sensor_format = FORMAT_JSON
         
         # Publish station online status
         online_status = {
             "station": STATION_NAME,
             "status": "online",
             "ip": socket.gethostbyname(socket.gethostname()),
+            "sensor_formats": list(SENSOR_FORMATS),
+            "boot_id": BOOT_ID,
             "timestamp": time.time()
         }
         publish_message(STATUS_TOPIC, online_status)
         
-        # Start sensor data reporting thread
-        global sensor_data_thread, sensor_data_running
+        # Start sensor data reporting
+        global sensor_data_running
         sensor_data_running = True
-        sensor_data_thread = threading.Thread(target=publish_sensor_data)
-        sensor_data_thread.daemon = True
-        sensor_data_thread.start()
+        publish_sensor_data()
         
         # Start heartbeat thread
         global heartbeat_thread, heartbeat_running
@@ -555,6 +571,7 @@ def on_disconnect(client, userdata, rc):
 
 def on_message(client, userdata, message):
     """Handle incoming MQTT messages"""
+    received_at = time.perf_counter()
     topic = message.topic
     try:
         payload = message.payload.decode('utf-8')
@@ -562,121 +579,80 @@ def on_message(client, userdata, message):
         
         # Handle different message types based on topic
         if topic == ACTION_TOPIC:
-            handle_action_message(payload)
+            handle_action_message(payload, received_at)
         elif topic == SCRIPT_TOPIC:
-            handle_script_message(payload)
+            handle_script_message(payload, received_at)
         elif topic == DISPATCH_TOPIC:
-            handle_dispatch_message(payload)
+            handle_dispatch_message(payload, received_at)
         elif topic == STATUS_TOPIC:
             handle_status_message(payload)
         elif topic == MTN_TOPIC:
-            handle_mtn_message(payload)
+            handle_mtn_message(payload, received_at)
+        elif topic == SENSOR_FORMAT_TOPIC:
+            handle_format_message(payload)
+        elif topic == SENSOR_SYNC_TOPIC:
+            log("Broker lost sensor frames, resending the current one")
+            publish_sensor_data()
         else:
             log(f"Unhandled topic: {topic}")
     
     except Exception as e:
         log(f"Error processing message: {e}")
 
-def handle_action_message(payload):
-    """Handle action commands"""
-    global system_busy, current_dispatch_mode
-    
+# ACTION command -> operation
+ACTIONS = {
+    "dispatch": "send",
+    "send": "send",
+    "receive": "receive",
+    "passthrough": "passthrough",
+    "self": "self_test",
+}
+# MTN command -> operation
+MTN_ACTIONS = {
+    "self_test": "self_test",
+    "moveLeft": "moveLeft",
+    "moveRight": "moveRight",
+}
+
+def parse_action(payload):
+    """JSON {"action": ...} or the legacy plain string command"""
     try:
         data = json.loads(payload)
-        action = data.get('action')
-        
-        if system_busy:
-            log(f"System busy, ignoring action: {action}")
-            return
-        
-        if action == "dispatch":
-            current_dispatch_mode = "send"
-            motor_thread = threading.Thread(target=send_capsule)
-            motor_thread.start()
-        elif action == "receive":
-            current_dispatch_mode = "receive"
-            motor_thread = threading.Thread(target=receive_capsule)
-            motor_thread.start()
-        elif action == "passthrough":
-            current_dispatch_mode = "passthrough"
-            motor_thread = threading.Thread(target=passthrough)
-            motor_thread.start()
-        elif action == "self":
-            current_dispatch_mode = "self_capsule"
-            motor_thread = threading.Thread(target=self_capsule)
-            motor_thread.start()
-        else:
-            log(f"Unknown action: {action}")
-    
     except json.JSONDecodeError:
-        # Try legacy format (simple string command)
-        if payload == "send":
-            current_dispatch_mode = "send"
-            motor_thread = threading.Thread(target=send_capsule)
-            motor_thread.start()
-        elif payload == "receive":
-            current_dispatch_mode = "receive"
-            motor_thread = threading.Thread(target=receive_capsule)
-            motor_thread.start()
-        else:
-            log(f"Unknown command: {payload}")
+        return payload, {}
+    if not isinstance(data, dict):
+        return payload, {}
+    return data.get('action'), data
+
+def handle_command(action, commands, task_id, received_at):
+    """Stop preempts right here; anything else goes to the executor"""
+    global current_dispatch_mode
+    if action == "stop":
+        return stop_operations(action)
+    operation = commands.get(action)
+    if operation is None:
+        log(f"Unknown action: {action}")
+        return reply(action, "rejected", task_id, reason="unknown command")
+    current_dispatch_mode = operation
+    return run_operation(action, operation, task_id, received_at)
+
+def handle_action_message(payload, received_at=None):
+    """Handle action commands"""
+    action, data = parse_action(payload)
+    handle_command(action, ACTIONS, data.get('task_id'), received_at)
 
-def handle_mtn_message(payload):
-    global system_busy, current_dispatch_mode
-    
-    try:
-        data = json.loads(payload)
-        action = data.get('action')
-        
-        if system_busy:
-            log(f"System busy, ignoring action: {action}")
-            return
-        
-        if action == "self_test":
-            current_dispatch_mode = "self_capsule"
-            motor_thread = threading.Thread(target=self_capsule)
-            motor_thread.start()
-        elif action == "moveLeft":
-            current_dispatch_mode = "moveLeft"
-            motor_thread = threading.Thread(target=move_left)
-            motor_thread.start()
-        elif action == "moveRight":
-            current_dispatch_mode = "moveRight"
-            motor_thread = threading.Thread(target=move_right)
-            motor_thread.start()
-        else:
-            log(f"Unknown action: {action}")
-    
-    except json.JSONDecodeError:
-        # Try legacy format (simple string command)
-        if payload == "self_test":
-            current_dispatch_mode = "self_test"
-            motor_thread = threading.Thread(target=self_capsule)
-            motor_thread.start()
-        elif payload == "moveLeft":
-            current_dispatch_mode = "moveLeft"
-            motor_thread = threading.Thread(target=move_left)
-            motor_thread.start()
-        elif payload == "moveRight":
-            current_dispatch_mode = "moveRight"
-            motor_thread = threading.Thread(target=move_right)
-            motor_thread.start()
-        else:
-            log(f"Unknown command: {payload}")
+def handle_mtn_message(payload, received_at=None):
+    """Handle maintenance commands"""
+    action, data = parse_action(payload)
+    handle_command(action, MTN_ACTIONS, data.get('task_id'), received_at)
 
-def handle_script_message(payload):
+def handle_script_message(payload, received_at=None):
     """Handle script execution commands"""
-    global current_task_id, system_busy
-    
-    if system_busy:
-        log("System busy, ignoring script execution")
-        return
-    
     try:
         data = json.loads(payload)
         script_name = data.get('script')
         params = data.get('params', {})
-        current_task_id = data.get('task_id')
+        task_id = data.get('task_id')
         
         log(f"Script execution request: {script_name} with params: {params}")
         
@@ -685,14 +661,9 @@ def handle_script_message(payload):
         if script_name == 'master_v3.py':
             mode = params.get('mode')
             
-            if mode == 'send':
-                log("Executing send mode")
-                motor_thread = threading.Thread(target=send_capsule)
-                motor_thread.start()
-            elif mode == 'receive':
-                log("Executing receive mode")
-                motor_thread = threading.Thread(target=receive_capsule)
-                motor_thread.start()
+            if mode in ('send', 'receive'):
+                log(f"Executing {mode} mode")
+                run_operation(script_name, mode, task_id, received_at)
             else:
                 log(f"Unknown mode: {mode}")
         else:
@@ -701,31 +672,23 @@ def handle_script_message(payload):
     except json.JSONDecodeError:
         log(f"Invalid JSON format in script message: {payload}")
 
-def handle_dispatch_message(payload):
+def handle_dispatch_message(payload, received_at=None):
     """Handle dispatch requests"""
-    global current_task_id, system_busy
-    
-    if system_busy:
-        log("System busy, ignoring dispatch message")
-        return
-    
     try:
         data = json.loads(payload)
-        current_task_id = data.get('task_id')
+        task_id = data.get('task_id')
         from_id = data.get('from')
         to_id = data.get('to')
         
-        log(f"Dispatch request: Task {current_task_id} from {from_id} to {to_id}")
+        log(f"Dispatch request: Task {task_id} from {from_id} to {to_id}")
         
         # Determine if this station is the sender or receiver
         if from_id == STATION_NUM:
             log("This station is the sender")
-            motor_thread = threading.Thread(target=send_capsule)
-            motor_thread.start()
+            run_operation("dispatch", "send", task_id, received_at)
         elif to_id == STATION_NUM:
             log("This station is the receiver")
-            motor_thread = threading.Thread(target=receive_capsule)
-            motor_thread.start()
+            run_operation("dispatch", "receive", task_id, received_at)
         else:
             log("This station is not involved in this dispatch")
     
@@ -739,17 +702,30 @@ def handle_status_message(payload):
         status = data.get('status')
         
         log(f"System status update: {status}")
-        
-        # Update internal state based on status
-        if status == 'standby':
-            global system_busy
-            system_busy = False
     
     except json.JSONDecodeError:
         log(f"Invalid JSON format in status message: {payload}")
 
+def handle_format_message(payload):
+    """The broker picked a sensor frame format; switch and resend the current frame in it"""
+    global sensor_format
+    try:
+        fmt = json.loads(payload).get('format')
+    except (json.JSONDecodeError, AttributeError):
+        log(f"Invalid JSON format in sensor format message: {payload}")
+        return
+    if fmt not in SENSOR_FORMATS:
+        log(f"Broker asked for unsupported sensor format {fmt}, keeping {sensor_format}")
+        return
+    log(f"Sensor frames now sent as {fmt}")
+    sensor_format = fmt
+    publish_sensor_data()
+
 # ===== Main Function =====
 def main():
+    sensor_monitor.start()
+    sequencer.start()
+
     # Set up MQTT callbacks
     client.on_connect = on_connect
     client.on_disconnect = on_disconnect
@@ -784,6 +760,9 @@ if __name__ == "__main__":
         log("Interrupted by user. Shutting down...")
     finally:
         # Clean up GPIO
+        sequencer.stop()
+        sensor_monitor.stop()
+        motor.close()
         GPIO.output(ENA, GPIO.HIGH)  # Disable motor
         GPIO.cleanup()
         
@@ -0,0 +1,319 @@
+import functools
+import itertools
+import math
+import os
+import threading
+import time
+
+# Station scripts build their stepper with load_motion(); PTS_MOTION selects
+# the pulse generator: 'wave' (pigpio DMA waveforms), 'busywait', 'sleep' (the
+# original time.sleep bit-banging) or 'sim' (no hardware). Unset, it is 'wave'
+# when pigpiod is reachable and 'busywait' otherwise: at the stations' step
+# delays (below SPIN_THRESHOLD) busywait spins for every edge and holds a core.
+MOTION_BACKEND_ENV = 'PTS_MOTION'
+
+# Below this much time to the next edge the busy-wait backend stops sleeping and spins
+SPIN_THRESHOLD = 0.001
+# Falling further behind than this re-anchors the schedule instead of bursting catch-up pulses
+MAX_LATENESS = 0.002
+REALTIME_PRIORITY = 50
+# Fixed-length moves are sent to pigpio in waves of at most this share of
+# wave_get_max_pulses(): one wave clocks out while the next is queued, and
+# both come out of the same DMA pulse pool
+WAVE_POOL_SHARE = 4
+
+
+@functools.lru_cache(maxsize=64)
+def ramp(start_delay, end_delay, steps):
+    """
+    Half-period delays going from start_delay to end_delay in `steps` steps at
+    constant acceleration (v^2 grows linearly with the step index).
+    Computed once per shape.
+    """
+    if steps <= 0:
+        return ()
+    v0, v1 = 1.0 / start_delay, 1.0 / end_delay
+    a = (v1 * v1 - v0 * v0) / steps
+    return tuple(1.0 / math.sqrt(v0 * v0 + a * (n + 0.5)) for n in range(steps))
+
+
+def trapezoid(steps, cruise_delay, start_delay, ramp_steps):
+    """A move of exactly `steps` steps: ramp up, cruise, ramp down"""
+    ramp_steps = min(ramp_steps, steps // 2)
+    up = ramp(start_delay, cruise_delay, ramp_steps)
+    return up + (cruise_delay,) * (steps - 2 * ramp_steps) + up[::-1]
+
+
+def accelerate(cruise_delay, start_delay, ramp_steps):
+    """Unbounded profile for moves that end on a sensor: ramp up, then cruise"""
+    return itertools.chain(ramp(start_delay, cruise_delay, ramp_steps), itertools.repeat(cruise_delay))
+
+
+class MotionHalted(Exception):
+    """The halt event was set while the motor was moving"""
+
+
+class StepperBackend:
+    """
+    Drives a step/direction stepper driver. run() emits one PUL pulse per
+    entry of `delays` (half-period in seconds: HIGH for delay, LOW for delay)
+    and, when `stop` is given, calls it every `check_every` steps and returns
+    as soon as it is true. Returns the number of steps taken.
+
+    With record=True the rising-edge time of every pulse is appended to
+    `pulses` (time.perf_counter), which is how jitter is measured off-device.
+
+    `halt` is an optional threading.Event checked before every step; once it
+    is set, run() stops pulsing and raises MotionHalted. The station passes
+    its sequence engine's abort event so a stop command preempts a move.
+    """
+
+    def __init__(self, gpio, pul, dir_pin, record=False, halt=None):
+        self.gpio = gpio
+        self.pul = pul
+        self.dir_pin = dir_pin
+        self.record = record
+        self.halt = halt
+        self.pulses = []
+        self.stats = {'steps': 0, 'late': 0}
+
+    def set_direction(self, level):
+        self.gpio.output(self.dir_pin, level)
+
+    def run(self, delays, stop=None, check_every=1):
+        return self._run(iter(delays), stop, check_every)
+
+    def run_until(self, stop, delays, check_every=1):
+        """Move until stop() is true; `delays` is usually an accelerate() profile"""
+        return self._run(iter(delays), stop, check_every)
+
+    def _run(self, delays, stop, check_every):
+        raise NotImplementedError
+
+    def _halted(self, steps):
+        self.stats['steps'] += steps
+        self.stats['halted'] = self.stats.get('halted', 0) + 1
+        return MotionHalted(f"motor halted after {steps} steps")
+
+    def close(self):
+        pass
+
+
+class SleepBackend(StepperBackend):
+    """The original bit-banging: time.sleep between every edge"""
+
+    def _run(self, delays, stop, check_every):
+        gpio, pul, halt = self.gpio, self.pul, self.halt
+        steps = 0
+        for delay in delays:
+            if halt is not None and halt.is_set():
+                raise self._halted(steps)
+            if stop is not None and steps % check_every == 0 and stop():
+                break
+            gpio.output(pul, gpio.HIGH)
+            if self.record:
+                self.pulses.append(time.perf_counter())
+            time.sleep(delay)
+            gpio.output(pul, gpio.LOW)
+            time.sleep(delay)
+            steps += 1
+        self.stats['steps'] += steps
+        return steps
+
+
+class BusyWaitBackend(StepperBackend):
+    """
+    Pulses from a dedicated motion thread timed against an absolute schedule
+    (sleep until SPIN_THRESHOLD before an edge, then spin), so sleep jitter no
+    longer accumulates into the step rate. With realtime=True the thread asks
+    for SCHED_FIFO (off by default: a spinning FIFO thread can starve
+    everything else on a single-core Pi) and `realtime` says whether it got it.
+    """
+
+    def __init__(self, gpio, pul, dir_pin, record=False, realtime=False, halt=None):
+        super().__init__(gpio, pul, dir_pin, record, halt)
+        self.want_realtime = realtime
+        self.realtime = False
+        self._jobs = []
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._worker, name='motion', daemon=True)
+        self._thread.start()
+
+    def _worker(self):
+        if self.want_realtime:
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(REALTIME_PRIORITY))
+                self.realtime = True
+            except (AttributeError, OSError):
+                pass
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    self._cond.wait()
+                job = self._jobs.pop(0)
+            if job is None:
+                return
+            delays, stop, check_every, done = job
+            try:
+                done['steps'] = self._train(delays, stop, check_every)
+            except Exception as e:
+                done['error'] = e
+            done['event'].set()
+
+    def _run(self, delays, stop, check_every):
+        done = {'event': threading.Event()}
+        with self._cond:
+            self._jobs.append((delays, stop, check_every, done))
+            self._cond.notify()
+        done['event'].wait()
+        if 'error' in done:
+            raise done['error']
+        return done['steps']
+
+    @staticmethod
+    def _wait_until(deadline):
+        remaining = deadline - time.perf_counter()
+        if remaining > SPIN_THRESHOLD:
+            time.sleep(remaining - SPIN_THRESHOLD)
+        while time.perf_counter() < deadline:
+            pass
+
+    def _train(self, delays, stop, check_every):
+        gpio, pul, high, low = self.gpio, self.pul, self.gpio.HIGH, self.gpio.LOW
+        pulses = self.pulses if self.record else None
+        halt = self.halt
+        steps = 0
+        edge = time.perf_counter()
+        for delay in delays:
+            if halt is not None and halt.is_set():
+                raise self._halted(steps)
+            if stop is not None and steps % check_every == 0 and stop():
+                break
+            self._wait_until(edge)
+            now = time.perf_counter()
+            if now - edge > MAX_LATENESS:
+                self.stats['late'] += 1
+                edge = now
+            gpio.output(pul, high)
+            if pulses is not None:
+                pulses.append(time.perf_counter())
+            self._wait_until(edge + delay)
+            gpio.output(pul, low)
+            edge += 2 * delay
+            steps += 1
+        self._wait_until(edge)   # hold the last LOW half-period
+        self.stats['steps'] += steps
+        return steps
+
+    def close(self):
+        with self._cond:
+            self._jobs.append(None)
+            self._cond.notify()
+
+
+class WaveBackend(StepperBackend):
+    """
+    pigpio DMA waveforms: the profile is built into waves chained with
+    WAVE_MODE_ONE_SHOT_SYNC, so the next wave is queued while the current one
+    is still being clocked out and edge timing is done by the DMA engine, not
+    Python. Sensor-terminated moves are cut into `check_every`-step waves and
+    stop() is seen up to one wave late; fixed-length moves use the largest
+    waves the pulse pool allows (`max_steps`). halt is polled while waves
+    play. Needs the pigpiod daemon; `record` is not supported.
+    """
+
+    def __init__(self, gpio, pul, dir_pin, record=False, pi=None, halt=None):
+        super().__init__(gpio, pul, dir_pin, record, halt)
+        import pigpio
+        self._pigpio = pigpio
+        self.pi = pi or pigpio.pi()
+        if not self.pi.connected:
+            raise RuntimeError("pigpiod is not running")
+        self.pi.set_mode(pul, pigpio.OUTPUT)
+        # Two pulses (HIGH, LOW) per step
+        self.max_steps = max(1, self.pi.wave_get_max_pulses() // (2 * WAVE_POOL_SHARE))
+
+    def set_direction(self, level):
+        self.pi.write(self.dir_pin, 1 if level else 0)
+
+    def _wave(self, chunk):
+        pigpio, mask = self._pigpio, 1 << self.pul
+        pulses = []
+        for delay in chunk:
+            micros = max(1, int(delay * 1e6))
+            pulses.append(pigpio.pulse(mask, 0, micros))
+            pulses.append(pigpio.pulse(0, mask, micros))
+        self.pi.wave_add_generic(pulses)
+        return self.pi.wave_create()
+
+    def _run(self, delays, stop, check_every):
+        pi = self.pi
+        size = min(max(check_every, 1), self.max_steps) if stop is not None else self.max_steps
+        steps = 0
+        sent = []
+        while True:
+            self._check_halt(sent, steps)
+            if stop is not None and stop():
+                break
+            chunk = list(itertools.islice(delays, size))
+            if not chunk:
+                break
+            wave_id = self._wave(chunk)
+            pi.wave_send_using_mode(wave_id, self._pigpio.WAVE_MODE_ONE_SHOT_SYNC)
+            sent.append(wave_id)
+            steps += len(chunk)
+            # One wave clocking out, one queued behind it: wait for the older to finish
+            while len(sent) > 1 and pi.wave_tx_at() == sent[0]:
+                self._check_halt(sent, steps)
+                time.sleep(0.0005)
+            if len(sent) > 1:
+                pi.wave_delete(sent.pop(0))
+        while pi.wave_tx_busy():
+            self._check_halt(sent, steps)
+            time.sleep(0.0005)
+        for wave_id in sent:
+            pi.wave_delete(wave_id)
+        self.stats['steps'] += steps
+        return steps
+
+    def _check_halt(self, sent, steps):
+        if self.halt is None or not self.halt.is_set():
+            return
+        self.pi.wave_tx_stop()
+        for wave_id in sent:
+            self.pi.wave_delete(wave_id)
+        raise self._halted(steps)
+
+    def close(self):
+        self.pi.wave_tx_stop()
+
+
+class SimulatedBackend(BusyWaitBackend):
+    """BusyWaitBackend on a fake GPIO, recording every pulse; for benchmarks and bench tests"""
+
+    def __init__(self, gpio=None, pul=16, dir_pin=19, record=True, realtime=False, halt=None):
+        if gpio is None:
+            from gpio_backend import FakeGPIO
+            gpio = FakeGPIO()
+        super().__init__(gpio, pul, dir_pin, record, realtime, halt)
+
+
+MOTION_BACKENDS = {
+    'busywait': BusyWaitBackend,
+    'wave': WaveBackend,
+    'sleep': SleepBackend,
+    'sim': SimulatedBackend,
+}
+
+
+def load_motion(gpio, pul, dir_pin, backend=None, halt=None):
+    backend = backend or os.environ.get(MOTION_BACKEND_ENV)
+    if backend is None:
+        try:
+            return WaveBackend(gpio, pul, dir_pin, halt=halt)
+        except (ImportError, RuntimeError):
+            return BusyWaitBackend(gpio, pul, dir_pin, halt=halt)
+    backend = backend.lower()
+    if backend not in MOTION_BACKENDS:
+        raise ValueError(f"Unknown motion backend '{backend}' (expected one of {', '.join(MOTION_BACKENDS)})")
+    return MOTION_BACKENDS[backend](gpio, pul, dir_pin, halt=halt)
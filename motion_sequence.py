@@ -0,0 +1,289 @@
+import collections
+import queue
+import threading
+import time
+
+# Operations allowed to wait behind the running one; further submissions are rejected
+MAX_PENDING = 2
+LATENCY_SAMPLES = 200
+
+# Station sensor wait limits (seconds); a procedure that runs out aborts and
+# reports it. The broker's watchdog derives its phase deadlines from these.
+LOAD_TIMEOUT = 300        # operator places the pod at P1
+MOVE_TIMEOUT = 30         # carrier / pod moves between sensors
+ARRIVAL_TIMEOUT = 420     # receiver waits for the sender to load and launch
+
+
+def compact_trace(trace):
+    """Wire form of a (possibly still running) trace: [step, kind, start_ms, ms] per step"""
+    return {
+        'operation': trace['operation'],
+        't0': trace['t0'],
+        'steps': [[s['step'], s['kind'], s['start_ms'], s.get('ms')] for s in trace['steps']],
+    }
+
+
+class Step:
+    """One step of a station operation; `action(context)` runs on the executor"""
+
+    __slots__ = ('name', 'kind', 'action', 'overlap')
+
+    def __init__(self, name, kind, action, overlap=False):
+        self.name = name
+        self.kind = kind
+        self.action = action
+        self.overlap = overlap
+
+
+def join(name='join'):
+    """Wait for every overlapped step started so far"""
+    return Step(name, 'join', None)
+
+
+class Operation:
+    __slots__ = ('name', 'steps', 'context', 'submitted_at', 'received_at')
+
+    def __init__(self, name, steps, context, submitted_at, received_at=None):
+        self.name = name
+        self.steps = steps
+        self.context = context
+        self.submitted_at = submitted_at
+        self.received_at = submitted_at if received_at is None else received_at
+
+
+class OperationAborted(Exception):
+    """Raised in an operation preempted by SequenceEngine.abort()"""
+
+
+class SequenceEngine:
+    """
+    Runs station operations, each a list of Steps, one at a time on a single
+    executor thread instead of a thread per command.
+
+    A step with overlap=True is handed to the background lane and the
+    operation carries on with its next step, e.g. pre-indexing the carrier
+    while the station waits for the pod. Overlapped steps are joined at the
+    next join() step and always before the operation ends, so the next
+    operation never starts with the motor still moving.
+
+    Every operation produces a trace: per step its start offset and duration
+    in ms (monotonic clock), whether it overlapped and the error if it
+    failed, plus the wall-clock start 't0'. Steps see the trace so far as
+    context['trace'], so a completion ACK can carry it.
+    on_trace(operation, trace) receives the final one, with every
+    overlapped step joined; on_error(operation, step_name, exc) is called
+    when a step raises, after which the rest of the operation is skipped.
+
+    At most `max_pending` operations wait behind the running one. abort()
+    drops them and sets `aborted`, which the running operation sees between
+    steps; long steps (motor moves, sensor waits) watch the event themselves.
+    It is cleared when the next operation starts.
+    """
+
+    def __init__(self, on_trace=None, on_error=None, on_finish=None, clock=time.perf_counter,
+                 wall_clock=time.time, max_pending=MAX_PENDING):
+        self.on_trace = on_trace
+        self.on_error = on_error
+        self.on_finish = on_finish
+        self.max_pending = max_pending
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._background = queue.Queue()
+        self._current = None
+        self._thread = None
+        self._lane = None
+        self.aborted = threading.Event()
+        self.abort_reason = None
+        self.last_trace = None
+        self.counters = {'accepted': 0, 'queued': 0, 'rejected': 0, 'cancelled': 0, 'aborted': 0}
+        self._latency = collections.deque(maxlen=LATENCY_SAMPLES)   # command received -> operation started
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._execute, name='sequence-executor', daemon=True)
+        self._lane = threading.Thread(target=self._run_background, name='sequence-overlap', daemon=True)
+        self._thread.start()
+        self._lane.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+
+    def submit(self, name, steps, context=None, received_at=None):
+        """
+        Queue an operation. Returns 'accepted' when it starts right away,
+        'queued' when it waits behind another and 'rejected' when max_pending
+        operations are already waiting. received_at is the clock() reading
+        when the command arrived, so start latency covers the handoff too.
+        """
+        operation = Operation(name, list(steps), dict(context or {}), self._clock(), received_at)
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                status = 'rejected'
+            else:
+                status = 'queued' if self._current is not None or self._pending else 'accepted'
+                self._pending.append(operation)
+                self._cond.notify()
+            self.counters[status] += 1
+        return status
+
+    def find(self, name):
+        """The most recently queued operation called `name`, else the running one if it is"""
+        with self._cond:
+            for operation in reversed(self._pending):
+                if operation.name == name:
+                    return operation
+            current = self._current
+            return current if current is not None and current.name == name else None
+
+    def abort(self, reason='aborted'):
+        """
+        Drop every waiting operation and preempt the running one.
+        Returns (name of the preempted operation or None, [dropped operations]).
+        """
+        with self._cond:
+            cancelled = list(self._pending)
+            self._pending.clear()
+            current = self._current
+            if current is not None:
+                self.abort_reason = reason
+                self.aborted.set()
+                self.counters['aborted'] += 1
+            self.counters['cancelled'] += len(cancelled)
+        return (current.name if current is not None else None), cancelled
+
+    def busy(self):
+        with self._cond:
+            return self._current is not None or bool(self._pending)
+
+    def pending(self):
+        return len(self._pending)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.counters, pending=len(self._pending),
+                         running=self._current.name if self._current is not None else None)
+            latency = sorted(self._latency)
+        if latency:
+            stats['start_latency_ms'] = {
+                'p50': latency[len(latency) // 2],
+                'p99': latency[min(len(latency) - 1, len(latency) * 99 // 100)],
+                'max': latency[-1],
+            }
+        return stats
+
+    def _run_background(self):
+        while True:
+            step, context, record, done = self._background.get()
+            try:
+                step.action(context)
+            except Exception as e:
+                record['error'] = str(e)
+                record['_exc'] = e
+            record['ms'] = round((self._clock() - record['_started']) * 1000, 1)
+            done.set()
+
+    @staticmethod
+    def _join(overlapped):
+        """Wait for the overlapped steps; re-raise the first failure on the executor"""
+        for record, done in overlapped:
+            done.wait()
+        failed = [record for record, _ in overlapped if '_exc' in record]
+        overlapped.clear()
+        if failed:
+            raise _OverlapFailed(failed[0]['step'], failed[0]['_exc'])
+
+    def _execute(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                operation = self._current = self._pending.popleft()
+                self.aborted.clear()
+                self.abort_reason = None
+            try:
+                self._run(operation)
+            finally:
+                with self._cond:
+                    self._current = None
+                if self.on_finish:
+                    self.on_finish(operation)
+
+    def _run(self, operation):
+        started = self._clock()
+        steps = []
+        trace = {
+            'operation': operation.name,
+            't0': self._wall_clock(),
+            'queued_ms': round((started - operation.received_at) * 1000, 1),
+            'steps': steps,
+            'ok': True,
+        }
+        operation.context['trace'] = trace
+        with self._cond:
+            self._latency.append(trace['queued_ms'])
+        overlapped = []   # [(record, done event)]
+        current = None
+        try:
+            for step in operation.steps:
+                current = step.name
+                if self.aborted.is_set():
+                    raise OperationAborted(self.abort_reason)
+                now = self._clock()
+                record = {'step': step.name, 'kind': step.kind, 'start_ms': round((now - started) * 1000, 1)}
+                steps.append(record)
+                if step.kind == 'join':
+                    self._join(overlapped)
+                elif step.overlap:
+                    record['overlap'] = True
+                    record['_started'] = now
+                    done = threading.Event()
+                    overlapped.append((record, done))
+                    self._background.put((step, operation.context, record, done))
+                    continue
+                else:
+                    try:
+                        step.action(operation.context)
+                    except Exception as e:
+                        record['error'] = str(e)
+                        raise
+                record['ms'] = round((self._clock() - now) * 1000, 1)
+            current = 'join'
+            self._join(overlapped)
+        except _OverlapFailed as e:
+            self._fail(trace, operation, e.step, e.error)
+        except Exception as e:
+            # Let overlapped steps finish before the error handler touches the hardware
+            for _, done in overlapped:
+                done.wait()
+            self._fail(trace, operation, current, e)
+        trace['total_ms'] = round((self._clock() - started) * 1000, 1)
+        for record in steps:
+            record.pop('_started', None)
+            record.pop('_exc', None)
+        self.last_trace = trace
+        if self.on_trace:
+            self.on_trace(operation, trace)
+
+    def _fail(self, trace, operation, step_name, error):
+        trace['ok'] = False
+        trace['failed_step'] = step_name
+        if self.on_error:
+            try:
+                self.on_error(operation, step_name, error)
+            except Exception as e:
+                print(f"Sequence error handler failed: {e}")
+
+
+class _OverlapFailed(Exception):
+    def __init__(self, step, error):
+        super().__init__(f"{step}: {error}")
+        self.step = step
+        self.error = error
@@ -0,0 +1,208 @@
+import os
+import gzip
+import json
+import time
+import logging
+import itertools
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from queue import Queue
+
+logger = logging.getLogger('Broker')
+
+# table -> (key column, timestamp column). Rows go oldest first through the
+# timestamp index, so each batch is a short range scan plus deletes by key.
+# history's timestamp index comes with HistoryQuery.init_schema.
+RETENTION_TABLES = {
+    'history': ('task_id', 'timestamp'),
+    'script_executions': ('id', 'execution_time'),
+}
+RETENTION_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_script_executions_time ON script_executions (execution_time)',
+)
+
+DEFAULT_RETENTION_DAYS = 90
+# Small transactions with a pause in between, so execute_dispatch's insert
+# never waits behind a long delete for the write lock (and keys stay under
+# the 999 bound variables older SQLite builds allow per statement)
+BATCH_SIZE = 500
+BATCH_PAUSE = 0.01
+RECENT_JOBS = 20
+
+# Timestamps are SQLite CURRENT_TIMESTAMP, i.e. UTC
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_STOP = object()
+
+
+class RetentionEngine:
+    """
+    Deletes rows past their table's retention period on a background
+    worker, BATCH_SIZE rows per transaction, pausing between batches.
+
+    `days` maps table -> retention in days (DEFAULT_RETENTION_DAYS for the
+    rest). With an `archive_dir` every batch is appended to a gzipped NDJSON
+    file there, and synced, before it is deleted. `on_delete` maps table ->
+    callable(db, keys) run in the same transaction, for rows in other tables
+    that hang off the deleted ones.
+
+    submit() queues a job and returns its progress dict; jobs() lists the
+    recent ones.
+    """
+
+    def __init__(self, pool, days=None, archive_dir=None, on_delete=None,
+                 batch_size=BATCH_SIZE, pause=BATCH_PAUSE, clock=time.time):
+        self.pool = pool
+        self.days = {table: DEFAULT_RETENTION_DAYS for table in RETENTION_TABLES}
+        self.days.update(days or {})
+        self.archive_dir = archive_dir
+        self.on_delete = on_delete or {}
+        self.batch_size = batch_size
+        self.pause = pause
+        self._clock = clock
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._jobs = deque(maxlen=RECENT_JOBS)
+        self._thread = None
+        self.stats = {'jobs': 0, 'failed': 0, 'batches': 0, 'deleted': 0, 'archived': 0}
+
+    @staticmethod
+    def init_schema(db):
+        for statement in RETENTION_INDEXES:
+            db.execute(statement)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop after the current batch; queued jobs are dropped"""
+        if not self._thread:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, table, days=None, archive=True):
+        """
+        Queue the removal of `table` rows older than `days` (the table's
+        retention by default). A job already waiting or running for the same
+        table and period is returned instead of queueing another.
+        """
+        if table not in RETENTION_TABLES:
+            raise ValueError(f"No retention for table {table!r}")
+        days = self.days[table] if days is None else days
+        with self._lock:
+            for job in self._jobs:
+                if job['table'] == table and job['days'] == days and job['state'] in ('queued', 'running'):
+                    return dict(job)
+            job = {'id': next(self._ids), 'table': table, 'days': days, 'state': 'queued',
+                   'archive': bool(archive and self.archive_dir), 'archive_file': None,
+                   'cutoff': None, 'total': None, 'deleted': 0, 'batches': 0,
+                   'queued_at': self._clock(), 'started_at': None, 'finished_at': None, 'error': None}
+            self._jobs.append(job)
+        self._queue.put(job)
+        return dict(job)
+
+    def submit_all(self):
+        """Every table at its configured retention (the daily job)"""
+        return [self.submit(table) for table in RETENTION_TABLES]
+
+    def jobs(self):
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs)]
+
+    def job(self, job_id):
+        with self._lock:
+            for job in self._jobs:
+                if job['id'] == job_id:
+                    return dict(job)
+        return None
+
+    def _update(self, job, **changes):
+        with self._lock:
+            job.update(changes)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+            self._update(job, state='running', started_at=self._clock())
+            try:
+                self._purge(job)
+            except Exception as e:
+                logger.error(f"Retention job {job['id']} on {job['table']} failed after "
+                             f"{job['deleted']} rows: {e}")
+                self.stats['failed'] += 1
+                self._update(job, state='failed', error=str(e), finished_at=self._clock())
+                continue
+            self.stats['jobs'] += 1
+            self._update(job, state='done', finished_at=self._clock())
+            logger.info(f"Retention: deleted {job['deleted']} {job['table']} rows older than {job['days']} days"
+                        + (f", archived to {job['archive_file']}" if job['archive_file'] else ''))
+
+    def _purge(self, job):
+        table = job['table']
+        key, column = RETENTION_TABLES[table]
+        cutoff = datetime.fromtimestamp(self._clock(), tz=timezone.utc) - timedelta(days=job['days'])
+        cutoff = cutoff.strftime(TIMESTAMP_FORMAT)
+        db = self.pool.thread_connection()
+        total = db.execute(f'SELECT COUNT(*) FROM "{table}" WHERE "{column}" < ?', (cutoff,)).fetchone()[0]
+        self._update(job, cutoff=cutoff, total=total)
+        if not total:
+            return
+
+        archive = None
+        if job['archive']:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            started = datetime.fromtimestamp(job['started_at'], tz=timezone.utc)
+            path = os.path.join(self.archive_dir, f"{table}_{started:%Y%m%dT%H%M%S}_{job['id']}.ndjson.gz")
+            archive = gzip.open(path, 'ab')
+            self._update(job, archive_file=path)
+        try:
+            while self._batch(db, job, table, key, column, cutoff, archive):
+                time.sleep(self.pause)
+        finally:
+            if archive is not None:
+                archive.close()
+
+    def _batch(self, db, job, table, key, column, cutoff, archive):
+        """Archive and delete one batch in its own transaction; False when nothing is left"""
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            rows = db.execute(f'SELECT * FROM "{table}" WHERE "{column}" < ? ORDER BY "{column}", "{key}" LIMIT ?',
+                              (cutoff, self.batch_size)).fetchall()
+            if rows:
+                keys = [row[key] for row in rows]
+                if archive is not None:
+                    archive.write(''.join(json.dumps(dict(row), separators=(',', ':')) + '\n'
+                                          for row in rows).encode())
+                    archive.flush()
+                    os.fsync(archive.fileno())
+                placeholders = ', '.join('?' * len(keys))
+                db.execute(f'DELETE FROM "{table}" WHERE "{key}" IN ({placeholders})', keys)
+                hook = self.on_delete.get(table)
+                if hook is not None:
+                    hook(db, keys)
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        if not rows:
+            return False
+        self.stats['batches'] += 1
+        self.stats['deleted'] += len(rows)
+        if archive is not None:
+            self.stats['archived'] += len(rows)
+        self._update(job, deleted=job['deleted'] + len(rows), batches=job['batches'] + 1)
+        return len(rows) == self.batch_size
+
+    def metrics(self):
+        with self._lock:
+            running = [dict(job) for job in self._jobs if job['state'] in ('queued', 'running')]
+        return dict(self.stats, days=dict(self.days), archive_dir=self.archive_dir, pending=running)
@@ -0,0 +1,69 @@
+import json
+import struct
+
+from sensor_writer import SENSOR_KEYS   # bit i of the mask is SENSOR_KEYS[i]
+
+# Frame formats a station can be asked to publish on PTS/SENSORDATA/<id>
+FORMAT_JSON = 'json'
+FORMAT_BINARY = 'bin1'
+
+# bin1: magic, sensor bitmask, sequence number, monotonic timestamp (ms, wraps after ~49 days).
+# JSON frames always start with '{', so the first byte tells the formats apart.
+BINARY_MAGIC = 0xB1
+BINARY_FRAME = struct.Struct('<BBII')
+BINARY_FRAME_SIZE = BINARY_FRAME.size   # 10 bytes
+
+SEQ_MASK = 0xFFFFFFFF
+TS_MASK = 0xFFFFFFFF
+
+
+def sensor_mask(frame):
+    mask = 0
+    for bit, key in enumerate(SENSOR_KEYS):
+        if frame.get(key):
+            mask |= 1 << bit
+    return mask
+
+
+def encode_binary(frame, seq, ts_ms):
+    """bin1 frame for the S1..P4 booleans in `frame`"""
+    return BINARY_FRAME.pack(BINARY_MAGIC, sensor_mask(frame), seq & SEQ_MASK, int(ts_ms) & TS_MASK)
+
+
+def decode_binary(payload):
+    magic, mask, seq, ts_ms = BINARY_FRAME.unpack(payload)
+    if magic != BINARY_MAGIC:
+        raise ValueError(f"Not a bin1 sensor frame (magic 0x{magic:02x})")
+    frame = {key: bool(mask >> bit & 1) for bit, key in enumerate(SENSOR_KEYS)}
+    frame['seq'] = seq
+    frame['ts_mono'] = ts_ms
+    return frame
+
+
+def encode_json(frame):
+    return json.dumps(frame, separators=(',', ':'))
+
+
+def is_binary(payload):
+    return len(payload) == BINARY_FRAME_SIZE and payload[0] == BINARY_MAGIC
+
+
+def decode_sensor_frame(payload):
+    """
+    A SENSORDATA payload (bytes) in either format as a frame dict.
+    Raises ValueError for anything that is neither.
+    """
+    if is_binary(payload):
+        return decode_binary(payload)
+    frame = json.loads(payload)   # json.JSONDecodeError is a ValueError
+    if not isinstance(frame, dict):
+        raise ValueError("Sensor frame is not a JSON object")
+    return frame
+
+
+def negotiate(offered, preferred):
+    """First format in `preferred` the station offered; stations that offer nothing speak JSON"""
+    for fmt in preferred:
+        if fmt in (offered or ()):
+            return fmt
+    return FORMAT_JSON
@@ -0,0 +1,232 @@
+import re
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+from sensor_codec import sensor_mask
+from sensor_writer import SENSOR_KEYS
+
+logger = logging.getLogger('Broker')
+
+# One table per UTC day: dropping a day is the retention, queries touch only the days in range
+PARTITION_PREFIX = 'sensor_events_'
+PARTITION_RE = re.compile(r'^sensor_events_(\d{8})$')
+PARTITION_SCHEMA = '''CREATE TABLE IF NOT EXISTS "{table}"
+                      (station INTEGER NOT NULL,
+                       ts_ms INTEGER NOT NULL,
+                       mask INTEGER NOT NULL,
+                       changed INTEGER NOT NULL,
+                       PRIMARY KEY (station, ts_ms)
+                       ) WITHOUT ROWID'''
+EVENT_INSERT_SQL = 'INSERT OR REPLACE INTO "{table}" (station, ts_ms, mask, changed) VALUES (?, ?, ?, ?)'
+
+# Hourly rollups outlive the raw events: frames and edges per sensor per station-hour
+ROLLUP_SCHEMA = '''CREATE TABLE IF NOT EXISTS sensor_rollup_hourly
+                   (station INTEGER NOT NULL,
+                    hour INTEGER NOT NULL,
+                    frames INTEGER NOT NULL,
+                    {edges},
+                    PRIMARY KEY (station, hour)
+                    ) WITHOUT ROWID'''.format(edges=', '.join(f'{key}_edges INTEGER NOT NULL' for key in SENSOR_KEYS))
+ROLLUP_SELECT = '''SELECT station, ts_ms / 3600000 AS hour, COUNT(*) AS frames, {edges}
+                   FROM "{{table}}" WHERE ts_ms >= ? AND ts_ms < ?
+                   GROUP BY station, hour'''.format(
+    edges=', '.join(f'SUM((changed >> {bit}) & 1)' for bit in range(len(SENSOR_KEYS))))
+ROLLUP_INSERT_SQL = 'INSERT OR REPLACE INTO sensor_rollup_hourly VALUES ({})'.format(
+    ', '.join('?' * (3 + len(SENSOR_KEYS))))
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+RAW_RETENTION_DAYS = 90
+ROLLUP_RETENTION_DAYS = 730
+
+
+def partition_name(ts_ms):
+    day = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc)
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def partition_start(table):
+    day = datetime.strptime(PARTITION_RE.match(table).group(1), '%Y%m%d').replace(tzinfo=timezone.utc)
+    return int(day.timestamp() * 1000)
+
+
+def sensor_bit(sensor):
+    return 1 << SENSOR_KEYS.index(sensor)
+
+
+def unpack_mask(mask):
+    return {key: bool(mask >> bit & 1) for bit, key in enumerate(SENSOR_KEYS)}
+
+
+class SensorHistory:
+    """
+    Append-only store of every sensor frame as (station, ts_ms, mask, changed):
+    the S1..P4 bitmask and which bits flipped since the station's previous
+    frame. Rows land in one WITHOUT ROWID table per UTC day keyed on
+    (station, ts_ms), so "P3 edges for station 2 in the last hour" is a
+    primary-key range scan of one or two small tables.
+
+    append() is called by the sensor write-behind thread inside its flush
+    transaction. maintain() rolls finished hours up into sensor_rollup_hourly
+    and drops whole day tables past `raw_days`.
+    """
+
+    def __init__(self, pool, raw_days=RAW_RETENTION_DAYS, rollup_days=ROLLUP_RETENTION_DAYS,
+                 clock=time.time):
+        self.pool = pool
+        self.raw_days = raw_days
+        self.rollup_days = rollup_days
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._partitions = None   # known day tables, loaded on first use
+        self._last_mask = {}      # station -> mask of its last stored frame (writer thread only)
+        self.stats = {'events': 0, 'partitions_dropped': 0, 'hours_rolled_up': 0}
+
+    @staticmethod
+    def init_schema(db):
+        db.execute(ROLLUP_SCHEMA)
+
+    def _known_partitions(self, db):
+        """Copy of the set of day tables (the writer adds to it while requests read)"""
+        with self._lock:
+            if self._partitions is None:
+                rows = db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?",
+                                  (PARTITION_PREFIX + '%',)).fetchall()
+                self._partitions = {row[0] for row in rows if PARTITION_RE.match(row[0])}
+            return set(self._partitions)
+
+    def _ensure_partition(self, db, table):
+        with self._lock:
+            known = self._partitions is not None and table in self._partitions
+        if not known:
+            db.execute(PARTITION_SCHEMA.format(table=table))
+            self._known_partitions(db)
+            with self._lock:
+                self._partitions.add(table)
+
+    def _previous_mask(self, db, station):
+        mask = self._last_mask.get(station)
+        if mask is None:
+            for table in sorted(self._known_partitions(db), reverse=True):
+                row = db.execute(f'SELECT mask FROM "{table}" WHERE station = ? ORDER BY ts_ms DESC LIMIT 1',
+                                 (station,)).fetchone()
+                if row is not None:
+                    mask = row[0]
+                    break
+        return mask
+
+    def append(self, db, events):
+        """
+        Store (station_id, ts_ms, frame) events, oldest first, on `db` inside
+        the caller's transaction
+        """
+        by_table = {}
+        for station_id, ts_ms, frame in events:
+            try:
+                station = int(station_id)
+            except ValueError:
+                continue
+            mask = sensor_mask(frame)
+            previous = self._previous_mask(db, station)
+            changed = 0 if previous is None else previous ^ mask
+            self._last_mask[station] = mask
+            by_table.setdefault(partition_name(ts_ms), []).append((station, ts_ms, mask, changed))
+        for table, rows in by_table.items():
+            self._ensure_partition(db, table)
+            db.executemany(EVENT_INSERT_SQL.format(table=table), rows)
+            self.stats['events'] += len(rows)
+
+    def _tables_between(self, db, start_ms, end_ms):
+        first = partition_start(partition_name(start_ms))
+        return sorted(table for table in self._known_partitions(db)
+                      if first <= partition_start(table) < end_ms)
+
+    def events(self, station, start_ms, end_ms, sensor=None, edges_only=False, limit=10000):
+        """
+        Frames of one station in [start_ms, end_ms), oldest first. With a
+        sensor and edges_only, only the frames where that sensor flipped.
+        """
+        db = self.pool.get_db()
+        bit = sensor_bit(sensor) if sensor else None
+        where = 'station = ? AND ts_ms >= ? AND ts_ms < ?'
+        params = [int(station), start_ms, end_ms]
+        if edges_only:
+            where += ' AND changed & ? != 0'
+            params.append(bit if bit is not None else (1 << len(SENSOR_KEYS)) - 1)
+        events = []
+        for table in self._tables_between(db, start_ms, end_ms):
+            rows = db.execute(f'SELECT ts_ms, mask, changed FROM "{table}" WHERE {where} ORDER BY ts_ms LIMIT ?',
+                              params + [limit - len(events)]).fetchall()
+            for ts_ms, mask, changed in rows:
+                event = {'ts': ts_ms, 'mask': mask, 'changed': changed}
+                if bit is not None:
+                    event[sensor] = bool(mask & bit)
+                else:
+                    event['sensors'] = unpack_mask(mask)
+                events.append(event)
+            if len(events) >= limit:
+                break
+        return events
+
+    def rollups(self, station, start_ms, end_ms):
+        rows = self.pool.get_db().execute(
+            'SELECT * FROM sensor_rollup_hourly WHERE station = ? AND hour >= ? AND hour < ? ORDER BY hour',
+            (int(station), start_ms // HOUR_MS, -(-end_ms // HOUR_MS))
+        ).fetchall()
+        return [{'hour': row['hour'] * HOUR_MS, 'frames': row['frames'],
+                 'edges': {key: row[f'{key}_edges'] for key in SENSOR_KEYS}} for row in rows]
+
+    def rollup(self, db, now_ms):
+        """Roll up every finished hour since the last rolled-up one"""
+        row = db.execute('SELECT MAX(hour) FROM sensor_rollup_hourly').fetchone()
+        tables = sorted(self._known_partitions(db))
+        if not tables:
+            return 0
+        start = row[0] * HOUR_MS if row[0] is not None else partition_start(tables[0])
+        end = now_ms // HOUR_MS * HOUR_MS
+        hours = 0
+        for table in self._tables_between(db, start, end):
+            rows = db.execute(ROLLUP_SELECT.format(table=table), (start, end)).fetchall()
+            db.executemany(ROLLUP_INSERT_SQL, [tuple(row) for row in rows])
+            hours += len(rows)
+        self.stats['hours_rolled_up'] += hours
+        return hours
+
+    def prune(self, db, now_ms):
+        """Drop day tables entirely older than the raw retention; trim old rollups"""
+        cutoff = now_ms - self.raw_days * DAY_MS
+        dropped = [table for table in self._known_partitions(db) if partition_start(table) + DAY_MS <= cutoff]
+        for table in dropped:
+            db.execute(f'DROP TABLE IF EXISTS "{table}"')
+        with self._lock:
+            self._partitions.difference_update(dropped)
+        db.execute('DELETE FROM sensor_rollup_hourly WHERE hour < ?',
+                   ((now_ms - self.rollup_days * DAY_MS) // HOUR_MS,))
+        self.stats['partitions_dropped'] += len(dropped)
+        return dropped
+
+    def maintain(self):
+        """Hourly job: roll up, then drop expired partitions"""
+        now_ms = int(self._clock() * 1000)
+        db = self.pool.thread_connection()
+        try:
+            with db:
+                hours = self.rollup(db, now_ms)
+                dropped = self.prune(db, now_ms)
+        except Exception as e:
+            logger.error(f"Sensor history maintenance failed: {e}")
+            return
+        if dropped:
+            logger.info(f"Sensor history: rolled up {hours} station-hours, dropped {', '.join(sorted(dropped))}")
+
+    def reset(self):
+        """Forget cached partitions and masks, e.g. after the tables were dropped behind our back"""
+        with self._lock:
+            self._partitions = None
+        self._last_mask.clear()
+
+    def metrics(self):
+        return dict(self.stats, partitions=len(self._partitions or ()))
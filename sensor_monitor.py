@@ -0,0 +1,176 @@
+import threading
+import time
+
+# Sensor name -> BCM pin, as wired on every station (all active low)
+SENSOR_PINS = {
+    'S1': 23, 'S2': 24, 'S3': 25, 'S4': 26,
+    'P1': 4, 'P2': 17, 'P3': 27, 'P4': 22,
+}
+
+DEBOUNCE_SECONDS = 0.005
+SAMPLE_INTERVAL = 0.002
+
+
+class SensorMonitor:
+    """
+    Edge-driven acquisition of the station sensors.
+
+    Each pin gets a GPIO.BOTH edge callback that only notes the edge. A
+    settle thread reads the pin once it has been quiet for `debounce`
+    seconds, and calls on_frame(frame) whenever a settled level differs from
+    the last published one. A frame has the usual S1..P4 booleans, plus
+    'ts' (publish time) and 'edges' (time of the first edge of each changed
+    sensor, before debouncing). Pulses shorter than `debounce` count as
+    bounce.
+
+    wait_for()/wait_until() block on the same condition variable, so motion
+    sequences wake within the debounce window of an edge without polling.
+
+    Where the kernel refuses edge detection (RuntimeError from
+    add_event_detect), a sampler thread reads the pins every
+    `sample_interval` and feeds the same edge path instead.
+    """
+
+    def __init__(self, gpio, on_frame, pins=SENSOR_PINS, debounce=DEBOUNCE_SECONDS,
+                 sample_interval=SAMPLE_INTERVAL, clock=time.monotonic, wall_clock=time.time):
+        self.gpio = gpio
+        self.on_frame = on_frame
+        self.pins = dict(pins)
+        self.debounce = debounce
+        self.sample_interval = sample_interval
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._names = {pin: name for name, pin in self.pins.items()}
+        self._cond = threading.Condition()
+        self._pending = {}   # pin -> [first edge wall time, last edge monotonic time]
+        self._state = {}
+        self._running = False
+        self._threads = []
+        self._listeners = []
+        self.sampling = False
+        self.stats = {'edges': 0, 'bounces': 0, 'frames': 0}
+
+    def _active(self, pin):
+        return self.gpio.input(pin) == self.gpio.LOW
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        with self._cond:
+            self._state = {name: self._active(pin) for name, pin in self.pins.items()}
+        try:
+            for pin in self.pins.values():
+                self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=self._edge)
+        except RuntimeError:
+            for pin in self.pins.values():
+                self.gpio.remove_event_detect(pin)
+            self.sampling = True
+            self._spawn(self._sample, 'sensor-sampler')
+        self._spawn(self._settle, 'sensor-settle')
+        self._emit(self.frame())
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if not self.sampling:
+            for pin in self.pins.values():
+                self.gpio.remove_event_detect(pin)
+
+    def add_listener(self, callback):
+        """callback(name, active, edge_time) for every settled change, on the settle thread"""
+        self._listeners.append(callback)
+
+    def state(self):
+        with self._cond:
+            return dict(self._state)
+
+    def wait_until(self, predicate, timeout=None):
+        """
+        Block until predicate(state) is true for the debounced sensor state;
+        False if `timeout` seconds pass first
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: predicate(self._state), timeout)
+
+    def wait_for(self, sensor, level, timeout=None):
+        """Block until `sensor` reads GPIO `level`; False on timeout"""
+        active = level == self.gpio.LOW
+        return self.wait_until(lambda state: state[sensor] == active, timeout)
+
+    def interrupt(self):
+        """Wake every wait_until() caller to re-check its predicate (e.g. after an abort)"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def frame(self, edges=None):
+        with self._cond:
+            frame = dict(self._state)
+        frame['ts'] = self._wall_clock()
+        frame['edges'] = edges or {}
+        return frame
+
+    def _edge(self, pin):
+        with self._cond:
+            self.stats['edges'] += 1
+            pending = self._pending.get(pin)
+            if pending is None:
+                self._pending[pin] = [self._wall_clock(), self._clock()]
+                self._cond.notify_all()
+            else:
+                pending[1] = self._clock()   # Still bouncing: restart the settle window
+
+    def _sample(self):
+        levels = {pin: self.gpio.input(pin) for pin in self.pins.values()}
+        while self._running:
+            for pin in self.pins.values():
+                level = self.gpio.input(pin)
+                if level != levels[pin]:
+                    levels[pin] = level
+                    self._edge(pin)
+            time.sleep(self.sample_interval)
+
+    def _settle(self):
+        while True:
+            changed = {}
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                now = self._clock()
+                settle_at = min(last for _, last in self._pending.values()) + self.debounce
+                if settle_at > now:
+                    self._cond.wait(settle_at - now)
+                    continue
+                for pin, (first, last) in list(self._pending.items()):
+                    if last + self.debounce > now:
+                        continue
+                    del self._pending[pin]
+                    name = self._names[pin]
+                    active = self._active(pin)
+                    if active == self._state[name]:
+                        self.stats['bounces'] += 1
+                        continue
+                    self._state[name] = active
+                    changed[name] = (active, first)
+                if changed:
+                    self._cond.notify_all()
+            for name, (active, edge_time) in changed.items():
+                for listener in self._listeners:
+                    listener(name, active, edge_time)
+            if changed:
+                self._emit(self.frame({name: edge_time for name, (_, edge_time) in changed.items()}))
+
+    def _emit(self, frame):
+        self.stats['frames'] += 1
+        try:
+            self.on_frame(frame)
+        except Exception as e:
+            print(f"Sensor frame handler failed: {e}")
@@ -0,0 +1,186 @@
+import threading
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger('Broker')
+
+SENSOR_KEYS = ('S1', 'S2', 'S3', 'S4', 'P1', 'P2', 'P3', 'P4')
+
+SENSOR_UPSERT_SQL = '''
+    INSERT INTO sensor_data
+    (station_id, S1, S2, S3, S4, P1, P2, P3, P4)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(station_id) DO UPDATE SET
+        S1 = excluded.S1,
+        S2 = excluded.S2,
+        S3 = excluded.S3,
+        S4 = excluded.S4,
+        P1 = excluded.P1,
+        P2 = excluded.P2,
+        P3 = excluded.P3,
+        P4 = excluded.P4,
+        timestamp = CURRENT_TIMESTAMP
+    '''
+
+
+def sensor_row(station_id, frame):
+    """Parameters for SENSOR_UPSERT_SQL from a SENSORDATA frame"""
+    return (str(station_id),) + tuple(bool(frame.get(key, False)) for key in SENSOR_KEYS)
+
+
+class SensorWriteBehind:
+    """
+    Write-behind stage for SENSORDATA upserts.
+
+    The MQTT callback only calls submit(), which keeps the latest frame per
+    station (last write wins) under a lock; with a fixed set of stations this
+    cannot overflow, so no station's frame is ever lost to another's. A
+    dedicated writer thread flushes them in a single transaction every
+    `flush_interval` seconds or after `max_batch` frames, whichever comes
+    first.
+
+    With a `history` (sensor_history.SensorHistory) every frame, not just the
+    latest, is also appended to the event store in the same transaction.
+    Those events wait in a buffer of up to `max_queue`; past that the oldest
+    is discarded and counted in `history_dropped`.
+    """
+
+    def __init__(self, pool, flush_interval=0.05, max_batch=64, max_queue=1024, history=None):
+        self.pool = pool
+        self.history = history
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._pending = {}       # station id -> latest frame
+        self._events = deque()   # (station id, ts_ms, frame) for the history
+        self._received = 0       # frames since the last flush
+        self._deadline = None
+        self._stopping = False
+        self._stats = {
+            'enqueued': 0,
+            'history_dropped': 0,
+            'frames_flushed': 0,
+            'rows_written': 0,
+            'flushes': 0,
+            'flush_errors': 0,
+            'max_queue_depth': 0,
+            'flush_seconds_total': 0.0,
+            'flush_seconds_max': 0.0,
+            'flush_seconds_last': 0.0,
+        }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='sensor-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Flush whatever is pending and stop the writer thread"""
+        if not self._thread:
+            return
+        with self._wake:
+            self._stopping = True
+            self._wake.notify()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, station_id, frame):
+        """Hand a sensor frame over for persistence. Never blocks on the database."""
+        station_id = str(station_id)
+        with self._wake:
+            self._pending[station_id] = frame
+            if self.history is not None:
+                if len(self._events) >= self.max_queue:
+                    self._events.popleft()
+                    self._stats['history_dropped'] += 1
+                self._events.append((station_id, int(time.time() * 1000), frame))
+            self._received += 1
+            self._stats['enqueued'] += 1
+            if self._received > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = self._received
+            if self._deadline is None:
+                self._deadline = time.monotonic() + self.flush_interval
+                self._wake.notify()
+            elif self._received >= self.max_batch:
+                self._wake.notify()
+        return True
+
+    def _take(self):
+        """Block until a flush is due; returns (pending, received, events, running)"""
+        with self._wake:
+            while not self._stopping:
+                if self._deadline is None:
+                    self._wake.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining <= 0 or self._received >= self.max_batch:
+                    break
+                self._wake.wait(remaining)
+            pending, received, events = self._pending, self._received, list(self._events)
+            self._pending = {}
+            self._events.clear()
+            self._received = 0
+            self._deadline = None
+            return pending, received, events, not self._stopping
+
+    def _run(self):
+        running = True
+        while running:
+            pending, received, events, running = self._take()
+            if pending:
+                self._flush(pending, received, events)
+
+    def _flush(self, pending, received, events=()):
+        rows = [sensor_row(station_id, frame) for station_id, frame in pending.items()]
+        start = time.perf_counter()
+        try:
+            db = self.pool.thread_connection()
+            with db:
+                db.executemany(SENSOR_UPSERT_SQL, rows)
+                if events:
+                    self.history.append(db, events)
+        except Exception as e:
+            logger.error(f"Sensor write-behind flush failed ({len(rows)} rows): {e}")
+            with self._lock:
+                self._stats['flush_errors'] += 1
+            return
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            stats = self._stats
+            stats['flushes'] += 1
+            stats['frames_flushed'] += received
+            stats['rows_written'] += len(rows)
+            stats['flush_seconds_total'] += elapsed
+            stats['flush_seconds_last'] = elapsed
+            if elapsed > stats['flush_seconds_max']:
+                stats['flush_seconds_max'] = elapsed
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            depth = self._received
+        flushes = stats['flushes']
+        return {
+            'queue_depth': depth,
+            'max_queue_depth': stats['max_queue_depth'],
+            'enqueued': stats['enqueued'],
+            'history_dropped': stats['history_dropped'],
+            'flushes': flushes,
+            'flush_errors': stats['flush_errors'],
+            'rows_written': stats['rows_written'],
+            'coalesce_ratio': (stats['frames_flushed'] / stats['rows_written']
+                               if stats['rows_written'] else 1.0),
+            'flush_latency_ms': {
+                'last': stats['flush_seconds_last'] * 1000,
+                'avg': (stats['flush_seconds_total'] / flushes * 1000) if flushes else 0.0,
+                'max': stats['flush_seconds_max'] * 1000,
+            },
+        }
@@ -0,0 +1,31 @@
+// Dispatch availability pushed by the broker (system busy, current and last
+// dispatch, queue depth, pod state per station): GET /api/availability,
+// then 'availability' patches from the 'availability' topic.
+window.Availability = (function () {
+  const availability = VersionedState({
+    event: 'availability',
+    url: () => '/api/availability',
+    topics: ['availability']
+  });
+
+  function podAvailable(stationId) {
+    const state = availability.current();
+    return !!state && !!state.pods && state.pods[stationId] === 'available';
+  }
+
+  // The shape /api/live_tracking returns, for the dashboard; while busy,
+  // the dispatch in progress
+  function liveTracking() {
+    const state = availability.current();
+    const dispatch = state && state.current_dispatch;
+    const last = (state && state.last_dispatch) || {};
+    return {
+      system_status: !!state && state.busy,
+      sender: dispatch ? dispatch.from : (last.sender || null),
+      receiver: dispatch ? dispatch.to : (last.receiver || null),
+      task_id: dispatch ? dispatch.task_id : (last.task_id || null)
+    };
+  }
+
+  return Object.assign({}, availability, { podAvailable, liveTracking });
+})();
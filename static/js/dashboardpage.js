@@ -124,6 +124,7 @@ document.addEventListener('DOMContentLoaded', function () {
     reconnectionDelay: 1000,
     reconnectionAttempts: 10
   });
+  Availability.attach(socket);
 
   Promise.all([fetchCurrentStation(), fetchNetworkArchitecture()]).then(([station, stations]) => {
     const sendEmptyPodButton = document.querySelector('.request-card .send-button');
@@ -154,6 +155,10 @@ document.addEventListener('DOMContentLoaded', function () {
       showConfirmationPopup('Empty Pod Request Sent Successfully!');
     });
 
+    socket.on('empty_pod_request_failed', function (data) {
+      showConfirmationPopup(data.reason);
+    });
+
     socket.on('empty_pod_request', function (data) {
       const fromStation = data.requesterStation;
       const stationNumber = fromStation.split('-').pop(); // gets '1' from 'passthrough-station-1'
@@ -237,6 +242,8 @@ document.addEventListener('DOMContentLoaded', function () {
 
     socket.on('connect', function () {
       console.log('Dashboard connected to Socket.IO server');
+      // Empty pod requests only reach sockets subscribed to them
+      socket.emit('subscribe', { topics: ['dispatch'] });
     });
 
 
@@ -244,26 +251,19 @@ document.addEventListener('DOMContentLoaded', function () {
       console.error('Socket.IO connection error:', error);
     });
 
-    socket.on('system_status_changed', function (data) {
-      console.log("🛰️ System status changed:", data);
+    // Live tracking follows the pushed availability
+    Availability.subscribe(function (availability, changes) {
+      if (!changes || !('busy' in changes || 'current_dispatch' in changes || 'last_dispatch' in changes)) return;
+      console.log("🛰️ Availability changed:", changes);
 
       // ✅ Always switch to Dashboard if dispatch starts
-      if (data.status === true && typeof showdashboardpage === 'function') {
+      if (changes.busy === true && typeof showdashboardpage === 'function') {
         console.log("🚨 Dispatch started. Switching to Dashboard...");
         showdashboardpage();
       }
 
       // Update the UI regardless of whether we switched
-      if (typeof updateDashboardUI === 'function') {
-        updateDashboardUI(data);
-      }
-    });
-
-
-    socket.on('dispatch_event', function (data) {
-      console.log('Dispatch event received:', data);
-      updateDashboardUI(data);
-
+      updateDashboardUI(Availability.liveTracking());
     });
   });
 });
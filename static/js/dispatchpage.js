@@ -29,6 +29,13 @@ document.addEventListener("DOMContentLoaded", function () {
     reconnectionDelay: 1000,
     reconnectionAttempts: 10
   });
+  Availability.attach(socket);
+  Availability.subscribe(function (availability, changes) {
+    checkDispatchPermission();
+    const hadPod = podAvailable;
+    checkPodAvailability();
+    if (changes && changes.pods && podAvailable && !hadPod) podPlaced();
+  });
   let wasDisconnected = false;
   socket.on('connect', function () {
     console.log('Connected to Socket.IO server');
@@ -37,8 +44,6 @@ document.addEventListener("DOMContentLoaded", function () {
     location.reload(); // Full page refresh
   }
     socket.emit('join', { station_id: currentStationNumber });
-    checkDispatchPermission();
-    checkPodAvailability();
   });
 
   socket.on('disconnect', () => {
@@ -60,65 +65,12 @@ document.addEventListener("DOMContentLoaded", function () {
 
 
 
-  socket.on('system_status_changed', function (data) {
-    dispatchAllowed = !data.status;
-    updateDispatchUI(data.current_dispatch);
-  });
-
-  socket.on('status', function (data) {
-    console.log("Received status:", data);
-    if (data.status === 'standby') {
-      dispatchAllowed = true;
-      updateDispatchUI();
-    }
-  });
-
   socket.on('dispatch_done', function (data) {
     dispatchAllowed = true;
     updateDispatchUI();
     showNotification(`Task ${data.task_id} completed!`, 'success');
   });
 
-  // socket.on('pod_availability_changed', function ({ station_id, available }) {
-  //   if (parseInt(station_id) === currentStationNumber) {
-  //     const btn = document.getElementById("Dispatch-Btn");
-  //     podAvailable = available;
-  //     updateDispatchUI();
-  //     if (available===true){
-  //       if (!btn.classList.contains("active")) {
-  //         console.log("Not in Dispatch Page");
-  //         btn.click();
-  //       }
-  //       else{
-  //         console.log("Already in Dispatch Page");
-  //       }
-  //     }
-      
-            
-  //     console.log(`Pod availability updated: ${available}`);
-  //   }
-  // });
-  
-  socket.on('pod_availability_changed', function ({ station_id, available }) {
-    if (parseInt(station_id) === currentStationNumber) {
-      const btn = document.getElementById("Dispatch-Btn");
-      console.log("Active button",getActiveButton());
-      console.log("System State",state);
-      podAvailable = available;
-      updateDispatchUI();
-      if (getActiveButton()!="Dispatch-Btn" && getActiveButton()!="Maintainance-Btn")
-      { 
-      if (available===true && state == "standby"){
-          btn.click();
-          console.log(`Pod availability updated: ${available}`);
-        }
-      }
-      else{
-      console.log("Pod Data Received but Ignored..!!"); 
-    } 
-    }
-  });
-
   fetch('/api/network_architecture')
     .then(resp => resp.json())
     .then(data => {
@@ -184,27 +136,34 @@ document.addEventListener("DOMContentLoaded", function () {
     .catch(err => console.error('Error loading architecture:', err));
 });
 
+// A pod put into this station brings up the dispatch page, unless the
+// operator is on it or in maintenance, or a dispatch is running
+function podPlaced() {
+  const btn = document.getElementById("Dispatch-Btn");
+  console.log("Active button", getActiveButton());
+  console.log("System State", state);
+  if (getActiveButton() != "Dispatch-Btn" && getActiveButton() != "Maintainance-Btn") {
+    if (state == "standby") {
+      btn.click();
+      console.log("Pod placed, showing the dispatch page");
+    }
+  } else {
+    console.log("Pod Data Received but Ignored..!!");
+  }
+}
+
+// Both read the state Availability keeps current; nothing is fetched
 function checkDispatchPermission() {
-  fetch('/api/check_dispatch_allowed')
-    .then(res => res.json())
-    .then(data => {
-      dispatchAllowed = data.allowed;
-      updateDispatchUI();
-    });
+  const availability = Availability.current();
+  if (!availability) return;
+  dispatchAllowed = !availability.busy;
+  updateDispatchUI();
 }
 
 function checkPodAvailability() {
-  fetch(`/api/check_pod_available/${currentStationNumber}`)
-    .then(res => res.json())
-    .then(data => {
-      podAvailable = data.available;
-      updateDispatchUI();
-    })
-    .catch(err => {
-      console.error('Error checking pod availability:', err);
-      podAvailable = false;
-      updateDispatchUI();
-    });
+  if (!Availability.current()) return;
+  podAvailable = Availability.podAvailable(currentStationNumber);
+  updateDispatchUI();
 }
 
 function updateDispatchUI(currentDispatch = null) {
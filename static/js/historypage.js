@@ -1,37 +1,77 @@
 document.addEventListener("DOMContentLoaded", function() {
-    let logs = [];
+    let nextCursor = null;
+    let loading = false;
+    let generation = 0;   // bumped by every reload so a stale page is dropped
+    let order = "desc";
+    let filter = {};
 
-    // Fetch logs dynamically
-    fetch('/get_logs')
-        .then(response => response.json())
-        .then(data => {
-            logs = data;
-            renderLogs(logs);
-        });
+    const PAGE_SIZE = 100;
+    const tableBody = document.getElementById("log-table");
+    const tableContainer = document.querySelector(".history-container .table-container");
+
+    function historyParams(extra) {
+        const params = new URLSearchParams(Object.assign({}, filter, extra));
+        return params.toString();
+    }
+
+    // Fetch one page of logs; next_cursor in the reply points at the page after it
+    function loadPage(reset) {
+        if (!reset && (loading || nextCursor === null)) return;
+        if (reset) generation++;
+        const requested = generation;
+        loading = true;
+        const extra = { limit: PAGE_SIZE, order: order };
+        if (!reset) extra.cursor = nextCursor;
+        fetch(`/api/history?${historyParams(extra)}`)
+            .then(response => response.json())
+            .then(data => {
+                if (requested !== generation) return;
+                if (reset) {
+                    tableBody.innerHTML = "";
+                }
+                nextCursor = data.next_cursor || null;
+                renderLogs(data.logs || []);
+            })
+            .catch(error => console.error("Error fetching logs:", error))
+            .finally(() => { if (requested === generation) loading = false; });
+    }
 
     function renderLogs(data) {
-        const tableBody = document.getElementById("log-table");
-        tableBody.innerHTML = "";
-        data.forEach(log => {
-            let row = `<tr>
+        const rows = data.map(log => `<tr>
                 <td>${log.task_id}</td>
                 <td>${log.from}</td>
                 <td>${log.to}</td>
                 <td>${log.date}</td>
                 <td>${log.time}</td>
-            </tr>`;
-            tableBody.innerHTML += row;
+            </tr>`).join("");
+        tableBody.insertAdjacentHTML("beforeend", rows);
+    }
+
+    loadPage(true);
+
+    // Next page when the table is scrolled near its end
+    if (tableContainer) {
+        tableContainer.addEventListener("scroll", function() {
+            if (this.scrollTop + this.clientHeight >= this.scrollHeight - 50) loadPage(false);
         });
     }
 
-    // Sorting logic
+    // Sorting logic: task ids and times rise together, so both map to the server's order
     document.querySelectorAll("input[name='sort']").forEach(radio => {
         radio.addEventListener("change", function() {
-            if (this.id === "sort-id-asc") logs.sort((a, b) => a.task_id - b.task_id);
-            if (this.id === "sort-id-desc") logs.sort((a, b) => b.task_id - a.task_id);
-            if (this.id === "sort-time-asc") logs.sort((a, b) => (a.time > b.time ? 1 : -1));
-            if (this.id === "sort-time-desc") logs.sort((a, b) => (a.time < b.time ? 1 : -1));
-            renderLogs(logs);
+            order = (this.id === "sort-id-asc" || this.id === "sort-time-asc") ? "asc" : "desc";
+            loadPage(true);
+        });
+    });
+
+    // Filters run on the server: incoming/outgoing are relative to this station
+    document.querySelectorAll("input[name='filter']").forEach(radio => {
+        radio.addEventListener("change", function() {
+            filter = {};
+            if (this.id === "filter-incoming" && window.STATION_ID) filter.receiver = window.STATION_ID;
+            if (this.id === "filter-outgoing" && window.STATION_ID) filter.sender = window.STATION_ID;
+            if (this.id === "filter-abort") filter.status = "failed,interrupted";
+            loadPage(true);
         });
     });
 
@@ -57,52 +97,62 @@ document.addEventListener("DOMContentLoaded", function() {
                 return;
             }
 
-            try {
-                // Create new PDF document
-                const { jsPDF } = window.jspdf;
-                const doc = new jsPDF();
+            fetch(`/api/download_history?${historyParams({})}`)
+                .then(response => response.json())
+                .then(allLogs => generatePdf(allLogs))
+                .catch(error => {
+                    console.error("Error fetching history:", error);
+                    alert("Error fetching history. Please try again.");
+                });
+        });
+    }
+
+    function generatePdf(allLogs) {
+        try {
+            // Create new PDF document
+            const { jsPDF } = window.jspdf;
+            const doc = new jsPDF();
 
-                // Add title
-                doc.setFontSize(16);
-                doc.text("Teller Loop History Report", 14, 15);
-                
-                // Add date
-                doc.setFontSize(10);
-                const currentDate = new Date().toLocaleDateString();
-                doc.text(`Generated on: ${currentDate}`, 14, 22);
+            // Add title
+            doc.setFontSize(16);
+            doc.text("Teller Loop History Report", 14, 15);
+            
+            // Add date
+            doc.setFontSize(10);
+            const currentDate = new Date().toLocaleDateString();
+            doc.text(`Generated on: ${currentDate}`, 14, 22);
 
-                // Prepare table data
-                const tableData = logs.map(log => [
-                    log.task_id,
-                    log.from,
-                    log.to,
-                    log.date,
-                    log.time
-                ]);
+            // Prepare table data
+            const tableData = allLogs.map(log => [
+                log.task_id,
+                log.from,
+                log.to,
+                log.date,
+                log.time
+            ]);
 
-                // Add table using autoTable plugin
-                doc.autoTable({
-                    head: [['Task ID', 'From', 'To', 'Date', 'Time']],
-                    body: tableData,
-                    startY: 30,
-                    theme: 'grid',
-                    styles: {
-                        fontSize: 8,
-                        cellPadding: 2
-                    },
-                    headStyles: {
-                        fillColor: [50, 50, 50],
-                        textColor: 255
-                    }
-                });
+            // Add table using autoTable plugin
+            doc.autoTable({
+                head: [['Task ID', 'From', 'To', 'Date', 'Time']],
+                body: tableData,
+                startY: 30,
+                theme: 'grid',
+                styles: {
+                    fontSize: 8,
+                    cellPadding: 2
+                },
+                headStyles: {
+                    fillColor: [50, 50, 50],
+                    textColor: 255
+                }
+            });
 
-                // Save the PDF
-                doc.save(`teller_loop_history_${new Date().toISOString().split('T')[0]}.pdf`);  
-                console.log("PDF generated successfully");
-            } catch (error) {
-                console.error("Error generating PDF:", error);
-                alert("Error generating PDF. Please check console for details.");
-            }
-        });
+            // Save the PDF
+            doc.save(`teller_loop_history_${new Date().toISOString().split('T')[0]}.pdf`);  
+            console.log("PDF generated successfully");
+        } catch (error) {
+            console.error("Error generating PDF:", error);
+            alert("Error generating PDF. Please check console for details.");
+        }
     }
 });
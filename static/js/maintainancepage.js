@@ -20,87 +20,24 @@ document.addEventListener("DOMContentLoaded", function () {
         });
     }
 
-    // Call functions to check system status at load
-    checkMaintenancePermission();
-    checkPodAvailability();
+    // System status and pod state follow the pushed availability
+    Availability.attach(socket);
+    Availability.subscribe(function () {
+        checkMaintenancePermission();
+        checkPodAvailability();
+    });
 
     // Socket event listeners
     socket.on('connect', function () {
         console.log('Connected to Socket.IO server');
         socket.emit('join', { station_id: STATION_ID });
-        checkMaintenancePermission();
-        checkPodAvailability();
-    });
-
-    socket.on('system_status_changed', function (data) {
-        mt_maintenanceAllowed = !data.status;
-        updateMaintenanceUI(data.current_dispatch);
-    });
-
-    socket.on('status', function (data) {
-        console.log("Received status:", data);
-        if (data.status === 'standby') {
-            mt_maintenanceAllowed = true;
-            updateMaintenanceUI();
-        }
     });
 
-    socket.on('pod_availability_changed', function ({ station_id, available }) {
-        if (parseInt(station_id) === STATION_ID) {
-            mt_podAvailable = available;
-            updateMaintenanceUI();
-            console.log(`Pod availability updated: ${available}`);
-        }
-    });
-
-    socket.on('mqtt_message', function(data) {
-        if (data.topic.includes("SENSORDATA")){
-            console.log("SensorData", data);
-            let sensordata = JSON.parse(data.data);
-            Object.entries(sensordata).forEach(([key, value]) => {
-                // Map sensor key to parent box ID
-                const sensorToBoxMap = {
-                    'S1': 'idx-status1',
-                    'S2': 'idx-status3',
-                    'S3': 'idx-status2',
-                    'S4': 'idx-status4',
-                    'P1': 'status1',
-                    'P2': 'status2',
-                    'P3': 'status3',
-                    'P4': 'status4'
-                };
-
-                const indicatorEl = document.getElementById(key);
-                const boxId = sensorToBoxMap[key];
-                const boxEl = boxId ? document.getElementById(boxId) : null;
-
-                console.log(value);
-
-                // Update indicator color
-                if (indicatorEl) {
-                    indicatorEl.classList.remove('green', 'gray');
-                    if (key.startsWith("S")){
-                        indicatorEl.classList.add(value ? 'green' : 'gray');
-                    }
-                    if (key.startsWith("P")){
-                        indicatorEl.classList.add(value ? 'gray' : 'green');
-                    }
-                }
-
-                // Update parent box color
-                if (boxEl) {
-                    boxEl.classList.remove('green', 'gray');
-                    // Apply coloring based on the same logic as indicators
-                    if (key.startsWith("S")){
-                         // For S sensors, true is green, false is gray
-                        boxEl.classList.add(value ? 'green' : 'gray');
-                    } else if (key.startsWith("P")){
-                        // For P sensors, true is gray, false is green
-                        boxEl.classList.add(value ? 'gray' : 'green');
-                    }
-                }
-            });
-        }
+    // Sensor indicators follow this station's view
+    StationView.attach(socket);
+    StationView.subscribe(function (view, changes) {
+        const sensors = changes ? changes.sensors : view.sensors;
+        if (sensors) showSensors(sensors);
     });
 
     // Air slider functionality
@@ -176,32 +113,62 @@ document.addEventListener("DOMContentLoaded", function () {
     // Initialize status box interactions
     initStatusBoxInteractions();
 });
+// Colour the sensor indicators and their boxes; `sensors` may be only the changed ones
+function showSensors(sensors) {
+    // Map sensor key to parent box ID
+    const sensorToBoxMap = {
+        'S1': 'idx-status1',
+        'S2': 'idx-status3',
+        'S3': 'idx-status2',
+        'S4': 'idx-status4',
+        'P1': 'status1',
+        'P2': 'status2',
+        'P3': 'status3',
+        'P4': 'status4'
+    };
+
+    Object.entries(sensors).forEach(([key, value]) => {
+        const indicatorEl = document.getElementById(key);
+        const boxId = sensorToBoxMap[key];
+        const boxEl = boxId ? document.getElementById(boxId) : null;
+
+        // Update indicator color
+        if (indicatorEl) {
+            indicatorEl.classList.remove('green', 'gray');
+            if (key.startsWith("S")){
+                indicatorEl.classList.add(value ? 'green' : 'gray');
+            }
+            if (key.startsWith("P")){
+                indicatorEl.classList.add(value ? 'gray' : 'green');
+            }
+        }
+
+        // Update parent box color
+        if (boxEl) {
+            boxEl.classList.remove('green', 'gray');
+            // Apply coloring based on the same logic as indicators
+            if (key.startsWith("S")){
+                 // For S sensors, true is green, false is gray
+                boxEl.classList.add(value ? 'green' : 'gray');
+            } else if (key.startsWith("P")){
+                // For P sensors, true is gray, false is green
+                boxEl.classList.add(value ? 'gray' : 'green');
+            }
+        }
+    });
+}
+
 function checkMaintenancePermission() {
-    fetch('/api/check_dispatch_allowed')
-        .then(res => res.json())
-        .then(data => {
-            mt_maintenanceAllowed = data.allowed;
-            updateMaintenanceUI();
-        })
-        .catch(err => {
-            console.error('Error checking maintenance permission:', err);
-            mt_maintenanceAllowed = false;
-            updateMaintenanceUI();
-        });
+    const availability = Availability.current();
+    if (!availability) return;
+    mt_maintenanceAllowed = !availability.busy;
+    updateMaintenanceUI();
 }
 
 function checkPodAvailability() {
-    fetch(`/api/check_pod_available/${STATION_ID}`)
-        .then(res => res.json())
-        .then(data => {
-            mt_podAvailable = data.available;
-            updateMaintenanceUI();
-        })
-        .catch(err => {
-            console.error('Error checking pod availability:', err);
-            mt_podAvailable = false;
-            updateMaintenanceUI();
-        });
+    if (!Availability.current()) return;
+    mt_podAvailable = Availability.podAvailable(STATION_ID);
+    updateMaintenanceUI();
 }
 
 function updateMaintenanceUI(currentDispatch = null) {
@@ -129,15 +129,16 @@ function toggleScreensOnClick(buttonid) {
     db_request.style.display = 'flex';
     setActiveNav("Dashboard");
   
-    fetch('/api/live_tracking')
-      .then(response => response.json())
-      .then(data => {
-        console.log("Live Tracking Data:", data);
-        state = data.system_status === true ? "active" : "standby";
-        toggleTrackingInfo();
-        if (typeof updateDashboardUI === 'function') updateDashboardUI(data);
-      })
-      .catch(error => console.error("Error fetching live tracking:", error));
+    const showTracking = () => {
+      const data = Availability.liveTracking();
+      console.log("Live Tracking Data:", data);
+      state = data.system_status === true ? "active" : "standby";
+      toggleTrackingInfo();
+      if (typeof updateDashboardUI === 'function') updateDashboardUI(data);
+    };
+    // Pushed state when we have it, the snapshot on first load
+    if (Availability.current()) showTracking();
+    else Availability.load().then(showTracking);
   };
 
   function showdispatchpage(){
@@ -270,6 +271,7 @@ socket.on('notify_maintenance_exited', function(data) {
 
   socket.on('connect', () => {
     console.log("✅ Socket connected");
+    socket.emit('subscribe', { topics: ['maintenance'] });
     if (wasDisconnected) {
       // Reconnected after a disconnection
       console.log("🔄 Reconnected — refreshing page...");
@@ -0,0 +1,8 @@
+// This station's view pushed by the broker (dispatch status, sensors, last
+// dispatch progress): GET /api/station_view/<id>, then 'station_view'
+// patches in the station's room, which the pages join on connect.
+window.StationView = VersionedState({
+  event: 'station_view',
+  url: () => `/api/station_view/${window.STATION_ID}`,
+  accept: patch => String(patch.station) === String(window.STATION_ID)
+});
@@ -0,0 +1,116 @@
+// A piece of broker state the page follows through versioned patches:
+// {version, changes} events on the socket, applied in version order on top
+// of a snapshot fetched from `url()`. A patch that skips a version means one
+// was missed, so the snapshot is fetched again. Dict values arrive as only
+// the entries that changed, and null removes one.
+//
+// options: event, url (function), topics (fanout topics to subscribe to),
+// accept(patch) (false for patches meant for someone else)
+window.VersionedState = function (options) {
+  let state = null;
+  let loading = null;
+  let attached = null;
+  let pending = [];
+  const listeners = [];
+
+  function isObject(value) {
+    return value !== null && typeof value === 'object' && !Array.isArray(value);
+  }
+
+  function notify(changes) {
+    listeners.forEach(fn => {
+      try {
+        fn(state, changes);
+      } catch (err) {
+        console.error(`${options.event} listener failed:`, err);
+      }
+    });
+  }
+
+  function merge(patch) {
+    Object.entries(patch.changes).forEach(([key, value]) => {
+      if (isObject(value) && isObject(state[key])) {
+        const merged = Object.assign({}, state[key]);
+        Object.entries(value).forEach(([name, entry]) => {
+          if (entry === null) delete merged[name];
+          else merged[name] = entry;
+        });
+        state[key] = merged;
+      } else {
+        state[key] = value;
+      }
+    });
+    state.version = patch.version;
+  }
+
+  function load() {
+    if (!loading) {
+      loading = fetch(options.url())
+        .then(res => res.json())
+        .then(snapshot => {
+          // Patches may have arrived while the snapshot was in flight
+          if (!state || snapshot.version >= state.version) state = snapshot;
+          const waiting = pending.sort((a, b) => a.version - b.version);
+          pending = [];
+          waiting.forEach(patch => {
+            if (patch.version === state.version + 1) merge(patch);
+          });
+          notify(null);
+          return state;
+        })
+        .catch(err => {
+          console.error(`Error loading ${options.event}:`, err);
+          return state;
+        })
+        .finally(() => { loading = null; });
+    }
+    return loading;
+  }
+
+  function apply(patch) {
+    if (options.accept && !options.accept(patch)) return;
+    if (loading) {
+      pending.push(patch);
+      return;
+    }
+    if (!state || patch.version > state.version + 1) {
+      pending.push(patch);
+      load();
+      return;
+    }
+    if (patch.version <= state.version) return;
+    merge(patch);
+    notify(patch.changes);
+  }
+
+  function subscribeTopics(socket) {
+    if (options.topics) socket.emit('subscribe', { topics: options.topics });
+  }
+
+  // One socket per page carries the patches; later callers share it
+  function attach(socket) {
+    if (attached) return;
+    attached = socket;
+    socket.on('connect', function () {
+      subscribeTopics(socket);
+      load();
+    });
+    socket.on(options.event, apply);
+    if (socket.connected) {
+      subscribeTopics(socket);
+      load();
+    }
+  }
+
+  // fn(state, changes); changes is null after a full snapshot
+  function subscribe(fn) {
+    listeners.push(fn);
+    if (state) fn(state, null);
+  }
+
+  function current() {
+    return state;
+  }
+
+  return { attach, load, subscribe, current };
+};
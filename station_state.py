@@ -0,0 +1,203 @@
+import threading
+import time
+
+from sensor_writer import SENSOR_KEYS
+
+# Frame sequence numbers are uint32 on the wire and wrap
+SEQ_MODULUS = 1 << 32
+# The firmware numbers frames from 1 after every start
+BOOT_SEQ = 0
+
+# Component types in network_architecture.json that are stations
+STATION_TYPES = ('passthrough-station', 'bottom-loading-station')
+
+
+def normalize_station_id(station_id):
+    """'passthrough-station-2', 'bottom-loading-station-2', '2' and 2 all refer to station '2'"""
+    station_id = str(station_id)
+    for station_type in STATION_TYPES:
+        if station_id.startswith(station_type + '-'):
+            return station_id[len(station_type) + 1:]
+    return station_id
+
+
+class StationState:
+    __slots__ = ('station_id', 'sensors', 'updated_at', 'last_seen', 'online', 'sensor_format',
+                 'last_seq', 'boot_id', 'resync_pending', 'stream')
+
+    def __init__(self, station_id):
+        self.station_id = station_id
+        self.sensors = dict.fromkeys(SENSOR_KEYS, False)
+        self.updated_at = None   # monotonic time of the last sensor frame
+        self.last_seen = None    # monotonic time of the last frame or heartbeat
+        self.online = False
+        self.sensor_format = None   # negotiated SENSORDATA frame format
+        self.last_seq = None        # sequence number of the last applied frame
+        self.boot_id = None         # firmware start the numbering belongs to
+        self.resync_pending = False
+        self.stream = {'frames': 0, 'gaps': 0, 'missed': 0, 'resets': 0, 'duplicates': 0, 'resyncs': 0}
+
+
+class StationStateStore:
+    """
+    Authoritative, in-process view of every station's sensors.
+
+    Updated from the SENSORDATA stream (and heartbeats for liveness); SQLite only
+    keeps a persistence snapshot. Stations publish frames only when a sensor
+    changes, so staleness is judged on the last frame *or* heartbeat: a station
+    not heard from within `stale_after` seconds is reported as unknown.
+
+    Frames go out at QoS 0 with a sequence number. Each frame is a full
+    snapshot, so a gap seen when the next frame arrives is already healed by
+    it and is only counted. The dangerous loss is the latest frame: the
+    heartbeat carries the station's last sequence number, and when it is
+    ahead of the last applied frame touch() asks for a resync and the
+    station reads as unknown until a frame comes in.
+
+    Numbering restarts at 1 whenever the firmware does, so the online
+    status and heartbeats carry a boot ID and a new one puts the baseline
+    back to BOOT_SEQ (a first frame that happens to repeat the old last
+    number is not a duplicate). Firmware without a boot ID is only caught
+    by the numbering going backwards.
+    """
+
+    def __init__(self, stale_after=30.0, clock=time.monotonic):
+        self.stale_after = stale_after
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stations = {}
+
+    def _state(self, station_id):
+        station_id = normalize_station_id(station_id)
+        state = self._stations.get(station_id)
+        if state is None:
+            state = self._stations[station_id] = StationState(station_id)
+        return state
+
+    def update(self, station_id, frame):
+        """Apply a SENSORDATA frame; False for a duplicate that was dropped"""
+        now = self._clock()
+        seq = frame.get('seq')
+        with self._lock:
+            state = self._state(station_id)
+            if seq is not None and not self._check_seq(state, seq):
+                return False
+            state.resync_pending = False
+            state.stream['frames'] += 1
+            for key in SENSOR_KEYS:
+                state.sensors[key] = bool(frame.get(key, False))
+            state.updated_at = now
+            state.last_seen = now
+            state.online = True
+        return True
+
+    @staticmethod
+    def _ahead(seq, last):
+        return 0 < (seq - last) % SEQ_MODULUS < SEQ_MODULUS // 2
+
+    @staticmethod
+    def _check_seq(state, seq):
+        last, state.last_seq = state.last_seq, seq
+        if last is None:
+            return True
+        ahead = (seq - last) % SEQ_MODULUS
+        if ahead == 0:
+            state.last_seq = last
+            state.stream['duplicates'] += 1
+            return False
+        if ahead < SEQ_MODULUS // 2:
+            if ahead > 1:
+                state.stream['gaps'] += 1
+                state.stream['missed'] += ahead - 1
+        else:
+            # Numbering went backwards: firmware without a boot ID restarted
+            state.stream['resets'] += 1
+        return True
+
+    def seed(self, station_id, frame):
+        """Load a persisted snapshot; the station stays unknown until it is heard from"""
+        with self._lock:
+            state = self._state(station_id)
+            for key in SENSOR_KEYS:
+                state.sensors[key] = bool(frame.get(key, False))
+
+    def touch(self, station_id, sensor_seq=None, boot_id=None):
+        """
+        Record a heartbeat / online status from the station firmware. With
+        the heartbeat's sensor_seq, returns True when frames were lost and
+        the station should be asked to resync.
+        """
+        now = self._clock()
+        with self._lock:
+            state = self._state(station_id)
+            state.last_seen = now
+            state.online = True
+            if boot_id is not None and boot_id != state.boot_id:
+                if state.boot_id is not None:
+                    state.last_seq = BOOT_SEQ
+                    state.stream['resets'] += 1
+                state.boot_id = boot_id
+            if sensor_seq is None:
+                return False
+            # A heartbeat that is behind raced the frame it numbered; only one ahead means a loss
+            if state.last_seq is not None and not self._ahead(sensor_seq, state.last_seq):
+                return False
+            state.resync_pending = True
+            state.stream['resyncs'] += 1
+            return True
+
+    def set_format(self, station_id, sensor_format):
+        with self._lock:
+            self._state(station_id).sensor_format = sensor_format
+
+    def mark_offline(self, station_id):
+        with self._lock:
+            self._state(station_id).online = False
+
+    def _is_stale(self, state, now):
+        return (not state.online or state.last_seen is None or state.resync_pending
+                or now - state.last_seen > self.stale_after)
+
+    def pod_available(self, station_id):
+        """
+        True/False for a live station (P1 clear means a pod can be dispatched),
+        None when the station is unknown or stale.
+        """
+        now = self._clock()
+        with self._lock:
+            state = self._stations.get(normalize_station_id(station_id))
+            if state is None or self._is_stale(state, now):
+                return None
+            return not state.sensors['P1']
+
+    def get(self, station_id):
+        now = self._clock()
+        with self._lock:
+            state = self._stations.get(normalize_station_id(station_id))
+            if state is None:
+                return None
+            return self._describe(state, now)
+
+    def stream_stats(self):
+        """Sequence counters per station"""
+        with self._lock:
+            return {station_id: dict(state.stream, last_seq=state.last_seq, resync_pending=state.resync_pending)
+                    for station_id, state in self._stations.items()}
+
+    def snapshot(self):
+        now = self._clock()
+        with self._lock:
+            return {station_id: self._describe(state, now)
+                    for station_id, state in self._stations.items()}
+
+    def _describe(self, state, now):
+        return {
+            'station_id': state.station_id,
+            'sensors': dict(state.sensors),
+            'online': state.online,
+            'sensor_format': state.sensor_format,
+            'stream': dict(state.stream, last_seq=state.last_seq, resync_pending=state.resync_pending),
+            'stale': self._is_stale(state, now),
+            'age': None if state.updated_at is None else now - state.updated_at,
+            'last_seen_age': None if state.last_seen is None else now - state.last_seen,
+        }
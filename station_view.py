@@ -0,0 +1,59 @@
+import json
+import threading
+
+from availability import diff_state
+from station_state import normalize_station_id
+
+
+class StationViews:
+    """
+    What a station's own screens show, kept on the broker per station:
+    its dispatch status (sending/receiving/standby), its sensors and the
+    last progress message of a dispatch through it. System-wide state is
+    the AvailabilityTracker's.
+
+    update() merges fields into a station's view and, when that changed
+    anything, bumps the station's version and hands `publish` the station
+    and a patch, {'station': id, 'version': n, 'changes': {...}}, to apply
+    on top of version n - 1 (diff_state, so a sensor frame only carries
+    the sensors that changed). Versions count per station. snapshot() is
+    the full view at its version, for a screen's first load and for one
+    that missed a patch.
+    """
+
+    def __init__(self, publish):
+        self.publish = publish
+        self._lock = threading.Lock()
+        self._views = {}
+        self._versions = {}
+        self.stats = {'updates': 0, 'unchanged': 0, 'patches': 0, 'patch_bytes': 0, 'snapshots': 0}
+
+    def update(self, station_id, **fields):
+        """Returns the patch published, or None when nothing changed"""
+        station_id = normalize_station_id(station_id)
+        with self._lock:
+            self.stats['updates'] += 1
+            view = self._views.get(station_id, {})
+            changes = diff_state(view, dict(view, **fields))
+            if not changes:
+                self.stats['unchanged'] += 1
+                return None
+            self._views[station_id] = dict(view, **fields)
+            version = self._versions[station_id] = self._versions.get(station_id, 0) + 1
+            patch = {'station': station_id, 'version': version, 'changes': changes}
+            self.stats['patches'] += 1
+            self.stats['patch_bytes'] += len(json.dumps(patch))
+            # Under the lock, so a station's patches go out in version order
+            self.publish(station_id, patch)
+        return patch
+
+    def snapshot(self, station_id):
+        station_id = normalize_station_id(station_id)
+        with self._lock:
+            self.stats['snapshots'] += 1
+            return dict(self._views.get(station_id, {}), station=station_id,
+                        version=self._versions.get(station_id, 0))
+
+    def metrics(self):
+        with self._lock:
+            return dict(self.stats, stations=len(self._views))
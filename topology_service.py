@@ -0,0 +1,155 @@
+import os
+import glob
+import json
+import hashlib
+import logging
+import threading
+
+from dispatch_scheduler import Topology, STATION_TYPES
+
+logger = logging.getLogger('Broker')
+
+ARCHITECTURE_PATTERN = 'network_architecture*.json'
+CHECK_INTERVAL = 2.0
+
+COMPONENT_TABLE_SCHEMA = '''CREATE TABLE IF NOT EXISTS "component_{comp_id}"
+                            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                             positional_sensor_1 BOOLEAN NOT NULL,
+                             positional_sensor_2 BOOLEAN NOT NULL,
+                             positional_sensor_3 BOOLEAN NOT NULL,
+                             positional_sensor_4 BOOLEAN NOT NULL,
+                             positional_sensor_5 BOOLEAN NOT NULL,
+                             positional_sensor_6 BOOLEAN NOT NULL,
+                             positional_sensor_7 BOOLEAN NOT NULL,
+                             positional_sensor_8 BOOLEAN NOT NULL
+                             )'''
+
+
+def station_components(data):
+    """Ids of the station components, the ones that get a component_<id> table"""
+    return [component['id'] for component in data.get('components', [])
+            if component.get('type') in STATION_TYPES and component.get('id')]
+
+
+def ensure_component_tables(db, data):
+    for comp_id in station_components(data):
+        db.execute(COMPONENT_TABLE_SCHEMA.format(comp_id=comp_id))
+
+
+class TopologySnapshot:
+    """One parsed architecture file: the raw dict, the route model and the bytes served for it"""
+
+    __slots__ = ('path', 'signature', 'data', 'topology', 'body', 'etag')
+
+    def __init__(self, path, signature, data):
+        self.path = path
+        self.signature = signature
+        self.data = data
+        self.topology = Topology(data)
+        self.body = json.dumps(data, separators=(',', ':')).encode()
+        self.etag = hashlib.sha1(self.body).hexdigest()
+
+
+class TopologyService:
+    """
+    The newest network_architecture*.json in `directory`, parsed once.
+
+    A watcher thread re-stats the candidate files every `check_interval`
+    seconds and reloads only when the newest file or its mtime/size changed;
+    a file that fails to parse keeps the previous snapshot until it changes
+    again. When every file is gone the last snapshot is kept (routes keep
+    working) but logged and reported as stale until one is back. `on_change`
+    callables get every new snapshot (on the watcher thread, or the caller's
+    for reload()). Requests only ever read current().
+    """
+
+    def __init__(self, directory, pattern=ARCHITECTURE_PATTERN, check_interval=CHECK_INTERVAL):
+        self.directory = directory
+        self.pattern = pattern
+        self.check_interval = check_interval
+        self.on_change = []
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._failed = None   # (path, signature) that did not parse, retried once it changes
+        self._missing = False   # every architecture file was removed after one loaded
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'loads': 0, 'load_errors': 0, 'checks': 0}
+
+    def _latest(self):
+        """(path, (mtime_ns, size)) of the newest architecture file, or (None, None)"""
+        latest = None
+        for path in glob.glob(os.path.join(self.directory, self.pattern)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if latest is None or stat.st_mtime_ns > latest[1][0]:
+                latest = (path, (stat.st_mtime_ns, stat.st_size))
+        return latest or (None, None)
+
+    def current(self):
+        """Latest snapshot, or None when no architecture file was ever loaded"""
+        return self._snapshot
+
+    def stale(self):
+        """True while the current snapshot's file is gone and no other has replaced it"""
+        return self._missing
+
+    def reload(self, force=False):
+        """Load the newest file if it changed; returns True when the snapshot was replaced"""
+        self.stats['checks'] += 1
+        path, signature = self._latest()
+        with self._lock:
+            snapshot = self._snapshot
+            if path is None:
+                if snapshot is not None and not self._missing:
+                    self._missing = True
+                    logger.warning(f"Network architecture {os.path.basename(snapshot.path)} was removed; "
+                                   f"serving the last loaded topology until a file is back")
+                return False
+            if self._missing:
+                self._missing = False
+                logger.info(f"Network architecture file found again: {os.path.basename(path)}")
+            if (not force and (path, signature) in (
+                    self._failed, snapshot and (snapshot.path, snapshot.signature))):
+                return False
+            try:
+                with open(path, 'r') as json_file:
+                    snapshot = TopologySnapshot(path, signature, json.load(json_file))
+            except (OSError, ValueError) as e:
+                self.stats['load_errors'] += 1
+                self._failed = (path, signature)
+                logger.error(f"Failed to load network architecture {path}: {e}")
+                return False
+            self._snapshot = snapshot
+            self.stats['loads'] += 1
+        logger.info(f"Loaded network architecture {os.path.basename(path)} "
+                    f"({len(snapshot.topology.components)} components)")
+        for callback in self.on_change:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Network architecture change handler failed: {e}")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            self.reload()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='topology-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def metrics(self):
+        snapshot = self._snapshot
+        return dict(self.stats,
+                    path=snapshot and os.path.basename(snapshot.path),
+                    etag=snapshot and snapshot.etag,
+                    stale=self._missing)